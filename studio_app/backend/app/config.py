@@ -79,6 +79,93 @@ PROJECT_ID = os.getenv("PROJECT_ID", "seismic-mantis-483123-g8")
 LOCATION = os.getenv("LOCATION", "us-central1")
 MODEL_ID = os.getenv("MODEL_ID", "gemini-2.5-flash")
 
+# --- DETECTION CONFIG ---
+# Load + warm up the YOLO model in the background at startup (otherwise lazily on first request)
+YOLO_PRELOAD = os.getenv("YOLO_PRELOAD", "true").lower() in ("1", "true", "yes")
+# Pages fed to YOLO per forward pass in batch detection (/ai/detect/batch)
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "4"))
+# Write annotated detection images to temp/inference for every request (debug only)
+YOLO_DEBUG_OUTPUT = os.getenv("YOLO_DEBUG_OUTPUT", "false").lower() in ("1", "true", "yes")
+
+# --- WORKER POOLS (CPU-heavy stages, see services/worker_pool.py) ---
+# "process": one process per worker, each with its own model copy (production)
+# "thread":  threads in the API process, shared model (dev / debugging)
+WORKER_POOL_MODE = os.getenv("WORKER_POOL_MODE", "process").lower()
+YOLO_WORKERS = int(os.getenv("YOLO_WORKERS", "2"))
+FRAME_WORKERS = int(os.getenv("FRAME_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# Max queued + running tasks per stage = workers * WORKER_QUEUE_DEPTH (beyond that: 503)
+WORKER_QUEUE_DEPTH = int(os.getenv("WORKER_QUEUE_DEPTH", "4"))
+
+# --- JOB STORE (see services/job_manager.py) ---
+# Finished jobs are evicted after JOB_TTL_SECONDS, and at most JOB_MAX_FINISHED are kept in memory
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_MAX_FINISHED = int(os.getenv("JOB_MAX_FINISHED", "500"))
+# Also write jobs to the SQLite `jobs` table so history survives restarts
+JOB_PERSIST = os.getenv("JOB_PERSIST", "false").lower() in ("1", "true", "yes")
+# Persisted progress is written at most once per interval per job (state changes are always written)
+JOB_PROGRESS_PERSIST_SECONDS = float(os.getenv("JOB_PROGRESS_PERSIST_SECONDS", "2"))
+# Worker threads per job queue (see services/job_scheduler.py)
+JOB_QUEUE_WORKERS = {
+    "detection": int(os.getenv("JOB_WORKERS_DETECTION", "2")),
+    "ocr": int(os.getenv("JOB_WORKERS_OCR", "2")),
+    "export": int(os.getenv("JOB_WORKERS_EXPORT", "1")),
+    "default": int(os.getenv("JOB_WORKERS_DEFAULT", "1")),
+    "tiles": int(os.getenv("JOB_WORKERS_TILES", "1")),
+    "thumbnails": int(os.getenv("JOB_WORKERS_THUMBNAILS", "1")),
+    "ingest": int(os.getenv("JOB_WORKERS_INGEST", "1")),
+}
+
+# --- DATABASE (SQLite, see app/database.py) ---
+# WAL lets readers (e.g. export gathering) run alongside a writer; "delete" restores the rollback journal
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "wal").lower()
+# "normal" is durable in WAL mode except for the last commits on power loss; "full" fsyncs every commit
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "normal").lower()
+# Page cache per connection and memory-mapped I/O window
+DB_CACHE_SIZE_MB = int(os.getenv("DB_CACHE_SIZE_MB", "64"))
+DB_MMAP_SIZE_MB = int(os.getenv("DB_MMAP_SIZE_MB", "256"))
+# How long a writer waits for the lock before "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Pooled connections: one per job queue worker plus request threads (sync routes run in a threadpool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(sum(JOB_QUEUE_WORKERS.values()) + 8)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "16"))
+
+# --- EDITOR SAVES (write-behind, see services/save_buffer.py) ---
+# PUT /files/{id}/data saves arriving within SAVE_COALESCE_MS are merged per file and written in one transaction
+SAVE_COALESCE_MS = int(os.getenv("SAVE_COALESCE_MS", "500"))
+# "commit":    respond after the shared commit (group commit: still one transaction per window)
+# "buffered":  respond at once, the save is committed within SAVE_COALESCE_MS (a crash can lose that window)
+# "immediate": no buffering, one commit per save
+SAVE_DURABILITY = os.getenv("SAVE_DURABILITY", "commit").lower()
+
+# --- DEEP ZOOM TILES (see services/tile_service.py) ---
+# Build the full tile pyramid in a background job when pages are uploaded/imported
+# (otherwise tiles are only generated on demand by the viewer)
+TILE_PREGENERATE = os.getenv("TILE_PREGENERATE", "true").lower() in ("1", "true", "yes")
+# Memory budget for decoded zoom layers kept between tile requests (services/layer_cache.py)
+TILE_LAYER_CACHE_MB = int(os.getenv("TILE_LAYER_CACHE_MB", "256"))
+# Where pre-built pyramids are stored:
+# "files": one file per tile (temp/tiles/{id}/{zoom}/{x}_{y}.{jpg|webp|avif})
+# "pack":  one indexed, memory-mapped pack per image and format (services/tile_pack.py)
+TILE_STORE = os.getenv("TILE_STORE", "files").lower()
+# Tile formats written by pyramid pre-generation (others are encoded on demand)
+TILE_PREBUILD_FORMATS = [f.strip().lower() for f in os.getenv("TILE_PREBUILD_FORMATS", "jpeg,webp").split(",") if f.strip()]
+
+# --- IMAGE OUTPUT FORMATS (tiles + thumbnails, see services/image_format.py) ---
+# Server preference order; each request gets the first one its Accept header lists (JPEG fallback)
+IMAGE_OUTPUT_FORMATS = [f.strip().lower() for f in os.getenv("IMAGE_OUTPUT_FORMATS", "avif,webp,jpeg").split(",") if f.strip()]
+
+# --- THUMBNAILS (see services/thumbnail_service.py) ---
+# Gallery widths generated once per uploaded/imported page, in these formats
+THUMBNAIL_SIZES = sorted(int(w) for w in os.getenv("THUMBNAIL_SIZES", "150,300,600").split(",") if w.strip())
+THUMBNAIL_PREBUILD_FORMATS = [f.strip().lower() for f in os.getenv("THUMBNAIL_PREBUILD_FORMATS", "jpeg,webp").split(",") if f.strip()]
+
+# --- PDF INGESTION (see services/pdf_ingest_service.py) ---
+# Pages are rasterized in windows of PDF_CHUNK_PAGES by up to PDF_RASTER_WORKERS parallel pdftoppm processes
+PDF_CHUNK_PAGES = int(os.getenv("PDF_CHUNK_PAGES", "8"))
+PDF_RASTER_WORKERS = int(os.getenv("PDF_RASTER_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PDF_JPEG_QUALITY = int(os.getenv("PDF_JPEG_QUALITY", "90"))
+
 # --- LOGGING SETUP ---
 LOG_BUFFER = deque(maxlen=200)
 
@@ -9,10 +9,27 @@ from .project import (
 from .filesystem import (
     get_all_filesystem_entries,
     get_filesystem_by_parent,
+    list_filesystem_entries,
+    count_filesystem_entries,
     get_filesystem_entry,
     create_filesystem_entry,
+    bulk_create_filesystem_entries,
     # update_file_extended_data,
     update_file_clean_status,
     update_filesystem_entry,
-    delete_filesystem_entry
+    move_filesystem_entry,
+    bulk_update_filesystem_entries,
+    delete_filesystem_entry,
+    bulk_delete_filesystem_entries,
+    bump_file_revision,
+    replace_page_annotations,
+    patch_balloons
+)
+
+from .tree import (
+    get_descendant_ids,
+    get_subtree_entries,
+    get_subtree_files,
+    get_ancestor_ids,
+    is_in_subtree
 )
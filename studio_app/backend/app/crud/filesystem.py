@@ -1,5 +1,11 @@
-from sqlalchemy.orm import Session
-from app.models_db import FileSystemEntry
+from typing import Dict, List, Optional
+from sqlalchemy import JSON, and_, bindparam, case, delete, func, insert, literal, select, tuple_, type_coerce, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload
+from app.models_db import FileSystemEntry, FileAnnotation, PageBalloon
+from app.crud.tree import assign_paths, move_subtree, repath
+
+ANNOTATION_FIELDS = ("balloons", "panels")
 
 def get_all_filesystem_entries(db: Session):
     return db.query(FileSystemEntry).all()
@@ -12,31 +18,168 @@ def get_filesystem_by_parent(db: Session, parent_id: str | None):
          return db.query(FileSystemEntry).filter(FileSystemEntry.parent_id == None).all()
     return db.query(FileSystemEntry).filter(FileSystemEntry.parent_id == parent_id).all()
 
-def get_filesystem_entry(db: Session, entry_id: str):
-    return db.query(FileSystemEntry).filter(FileSystemEntry.id == entry_id).first()
+# Listing order; the id makes every key unique, so it can serve as a keyset cursor.
+# order and name are never NULL (defaults here, backfilled by upgrade_schema): a NULL would drop out of the tuple comparison
+LISTING_ORDER = (FileSystemEntry.order, FileSystemEntry.name, FileSystemEntry.id)
 
-def create_filesystem_entry(db: Session, entry_data: dict):
+def _listing_filter(stmt, parent_id: str | None, all_entries: bool):
+    if all_entries:
+        return stmt
+    # Same convention as get_filesystem_by_parent: "root"/None = top-level items
+    if parent_id == "root" or parent_id is None:
+        return stmt.where(FileSystemEntry.parent_id == None)
+    return stmt.where(FileSystemEntry.parent_id == parent_id)
+
+def list_filesystem_entries(
+    db: Session, parent_id: str | None = None, all_entries: bool = False, include_data: bool = True,
+    include_cover: bool = True, after: tuple | None = None, limit: int | None = None
+):
+    """
+    Rows for the GET /filesystem listing in a single query (children of parent_id, or every entry),
+    in LISTING_ORDER: (order, name, id).
+    Each folder/comic is joined to its cover, the first file child by name, through an
+    index seek on (parent_id, type, name) instead of one query per folder.
+    include_data=True adds panels from file_annotations (outer join) and each page's balloons,
+    aggregated from page_balloons in position order; otherwise annotation data is not touched at all.
+    Rows carry the entry columns plus cover_id/cover_url (None when there is no file child,
+    or always with include_cover=False).
+    Keyset pagination: after=(order, name, id) of the last row seen, at most `limit` rows.
+    """
+    child = aliased(FileSystemEntry)
+    cover = aliased(FileSystemEntry)
+    first_child_id = (
+        select(child.id)
+        .where(child.parent_id == FileSystemEntry.id, child.type == "file")
+        .order_by(child.name)
+        .limit(1)
+        .correlate(FileSystemEntry)
+        .scalar_subquery()
+    )
+
+    columns = [getattr(FileSystemEntry, attr.key) for attr in FileSystemEntry.__mapper__.column_attrs]
+    if include_cover:
+        stmt = (
+            select(*columns, cover.id.label("cover_id"), cover.url.label("cover_url"))
+            .select_from(FileSystemEntry)
+            .outerjoin(cover, and_(FileSystemEntry.type.in_(("folder", "comic")), cover.id == first_child_id))
+        )
+    else:
+        stmt = select(*columns, literal(None).label("cover_id"), literal(None).label("cover_url"))
+    if include_data:
+        # Aggregated over an ordered subquery: SQLite 3.40 has no ORDER BY inside aggregates
+        ordered_balloons = (
+            select(PageBalloon.data)
+            .where(PageBalloon.file_id == FileSystemEntry.id)
+            .order_by(PageBalloon.position)
+            .correlate(FileSystemEntry)
+            .subquery()
+        )
+        page_balloons = select(func.json_group_array(func.json(ordered_balloons.c.data))).scalar_subquery()
+        balloons = case((FileAnnotation.file_id == None, None), else_=page_balloons)
+        stmt = (
+            stmt.add_columns(type_coerce(balloons, JSON).label("balloons"), FileAnnotation.panels)
+            .outerjoin(FileAnnotation, FileAnnotation.file_id == FileSystemEntry.id)
+        )
+    stmt = _listing_filter(stmt, parent_id, all_entries).order_by(*LISTING_ORDER)
+    if after is not None:
+        stmt = stmt.where(tuple_(*LISTING_ORDER) > tuple_(*after))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.execute(stmt).all()
+
+def count_filesystem_entries(db: Session, parent_id: str | None = None, all_entries: bool = False) -> int:
+    """Number of rows list_filesystem_entries returns without pagination."""
+    stmt = _listing_filter(select(func.count()).select_from(FileSystemEntry), parent_id, all_entries)
+    return db.execute(stmt).scalar()
+
+def get_filesystem_entry(db: Session, entry_id: str, with_annotations: bool = False):
+    # with_annotations: balloons/panels loaded up front (otherwise on first access)
+    query = db.query(FileSystemEntry)
+    if with_annotations:
+        query = query.options(joinedload(FileSystemEntry.annotations), selectinload(FileSystemEntry.balloon_rows))
+    return query.filter(FileSystemEntry.id == entry_id).first()
+
+def _entry_columns(entry_data: dict) -> dict:
     # Map dictionary keys (often camelCase from frontend/legacy) to model fields (snake_case)
-    db_entry = FileSystemEntry(
+    return dict(
         id=entry_data.get("id"),
         parent_id=entry_data.get("parentId"),
         project_id=entry_data.get("projectId"), # May not always be present
-        name=entry_data.get("name"),
+        name=entry_data.get("name") or "",
         type=entry_data.get("type"),
         url=entry_data.get("url"),
         created_at=entry_data.get("createdAt"),
         is_pinned=entry_data.get("isPinned", False),
-        order=entry_data.get("order", 0),
+        order=entry_data.get("order") or 0,
         
         clean_url=entry_data.get("cleanUrl"),
         is_cleaned=entry_data.get("isCleaned", False),
-        balloons=entry_data.get("balloons")
+        balloons=entry_data.get("balloons"),
+        panels=entry_data.get("panels")
     )
+
+def create_filesystem_entry(db: Session, entry_data: dict):
+    db_entry = FileSystemEntry(**_entry_columns(entry_data))
     db.add(db_entry)
     db.commit()
     db.refresh(db_entry)
     return db_entry
 
+def _insert_stmt(model, key_column, sample_row: dict, upsert: bool):
+    if not upsert:
+        return insert(model)
+    stmt = sqlite_insert(model)
+    return stmt.on_conflict_do_update(
+        index_elements=[key_column],
+        set_={col: stmt.excluded[col] for col in sample_row if col != key_column.key}
+    )
+
+def bulk_create_filesystem_entries(db: Session, entries: List[dict], upsert: bool = False, commit: bool = True) -> int:
+    """
+    Inserts many entries (same camelCase dicts as create_filesystem_entry) with one
+    executemany INSERT in a single transaction (plus one for their balloons/panels, if any).
+    upsert=True replaces rows whose id already exists (re-runnable imports).
+    No ORM objects are built or refreshed.
+    """
+    if not entries:
+        return 0
+    rows = [_entry_columns(e) for e in entries]
+    annotated = [row for row in rows if any(row[field] is not None for field in ANNOTATION_FIELDS)]
+    annotations = [{"file_id": row["id"], "panels": row["panels"]} for row in annotated]
+    balloons = [
+        {"file_id": row["id"], "balloon_id": PageBalloon.key_of(balloon), "position": position, "data": balloon}
+        for row in annotated for position, balloon in enumerate(row["balloons"] or [])
+    ]
+    for row in rows:
+        for field in ANNOTATION_FIELDS:
+            del row[field]
+
+    connection = db.connection()
+    assign_paths(connection, rows)
+    moved = []
+    if upsert:
+        # Replaced entries that changed place: their existing subtrees follow (after the insert)
+        new_paths = {row["id"]: row["path"] for row in rows}
+        table = FileSystemEntry.__table__
+        moved = [
+            (path, new_paths[entry_id]) for entry_id, path in db.execute(
+                select(table.c.id, table.c.path).where(table.c.id.in_(list(new_paths)))
+            ) if path is not None and path != new_paths[entry_id]
+        ]
+    db.execute(_insert_stmt(FileSystemEntry, FileSystemEntry.id, rows[0], upsert), rows)
+    for old_path, new_path in moved:
+        move_subtree(connection, old_path, new_path)
+    if annotations:
+        db.execute(_insert_stmt(FileAnnotation, FileAnnotation.file_id, annotations[0], upsert), annotations)
+    if upsert and annotated:
+        # Replaced pages start over with the given balloons
+        db.execute(delete(PageBalloon).where(PageBalloon.file_id.in_([row["id"] for row in annotated])))
+    if balloons:
+        db.execute(insert(PageBalloon), balloons)
+    if commit:
+        db.commit()
+    return len(rows)
+
 # update_file_extended_data REMOVED - Use PersistenceService
 # This prevents Pydantic vs SQLAlchemy serialization issues.
 
@@ -65,6 +208,140 @@ def update_filesystem_entry(db: Session, entry_id: str, updates: dict):
     db.refresh(db_entry)
     return db_entry
 
+def move_filesystem_entry(db: Session, entry_id: str, new_parent_id: str | None):
+    """Re-parents an entry; its path and its whole subtree's paths change in the same transaction."""
+    db_entry = get_filesystem_entry(db, entry_id)
+    if not db_entry:
+        return None
+    db_entry.parent_id = new_parent_id  # Paths: see the before_flush hook in crud/tree.py
+    db.commit()
+    return db_entry
+
+def bulk_update_filesystem_entries(db: Session, updates: List[dict], commit: bool = True) -> int:
+    """
+    Updates many entries in a single transaction: one executemany UPDATE keyed by primary key.
+    Each dict holds "id" plus the (snake_case) columns to set, e.g. {"id": ..., "order": 3};
+    all dicts must set the same columns.
+    """
+    if not updates:
+        return 0
+    # Core statement rather than ORM bulk UPDATE: unknown ids are skipped instead of raising StaleDataError
+    table = FileSystemEntry.__table__
+    columns = [col for col in updates[0] if col != "id"]
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values({col: bindparam(f"b_{col}") for col in columns})
+    )
+    db.execute(stmt, [{f"b_{col}": value for col, value in u.items()} for u in updates])
+    if "parent_id" in columns:
+        repath(db.connection(), [u["id"] for u in updates])
+    if commit:
+        db.commit()
+    return len(updates)
+
+def bump_file_revision(db: Session, file_id: str, base_revision: Optional[int] = None) -> Optional[int]:
+    """
+    Increments a page's annotation revision and returns the new value (no commit).
+    With base_revision, only if the page is still at that revision: None means someone else saved first.
+    Takes the write lock first, so concurrent patches of a page are serialized.
+    """
+    table = FileAnnotation.__table__
+    current = func.coalesce(table.c.revision, 0)
+    condition = table.c.file_id == file_id
+    if base_revision is not None:
+        condition = and_(condition, current == base_revision)
+
+    bumped = db.execute(update(table).where(condition).values(revision=current + 1).returning(table.c.revision)).first()
+    if bumped:
+        return bumped[0]
+    if db.execute(select(table.c.file_id).where(table.c.file_id == file_id)).first() or base_revision not in (None, 0):
+        return None
+    # Never annotated: revision 0 -> 1
+    db.execute(insert(table).values(file_id=file_id, revision=1))
+    return 1
+
+def replace_page_annotations(
+    db: Session, file_id: str, balloons: Optional[List[dict]] = None, panels: Optional[list] = None
+):
+    """
+    Full save of a page's annotations in Core statements (no commit): balloons (if given) are
+    replaced with one DELETE plus one bulk INSERT, panels (if given) with one UPDATE.
+    Call after bump_file_revision, which takes the write lock and creates the annotations row.
+    """
+    if balloons is not None:
+        table = PageBalloon.__table__
+        db.execute(delete(table).where(table.c.file_id == file_id))
+        if balloons:
+            db.execute(insert(table), [
+                {"file_id": file_id, "balloon_id": PageBalloon.key_of(balloon), "position": position, "data": balloon}
+                for position, balloon in enumerate(balloons)
+            ])
+    if panels is not None:
+        table = FileAnnotation.__table__
+        db.execute(update(table).where(table.c.file_id == file_id).values(panels=panels))
+
+def patch_balloons(
+    db: Session, file_id: str, add: List[dict], updates: List[dict], delete_ids: List[str]
+) -> Dict[str, object]:
+    """
+    Changes only the given balloons of a page, keyed by balloon id (no commit):
+    delete_ids are removed, updates are merged into the stored balloons (partial dicts),
+    add appends new balloons (or replaces the stored one with the same id).
+    Returns counts plus the ids of updates that matched no balloon.
+    """
+    table = PageBalloon.__table__
+    deleted = 0
+    if delete_ids:
+        deleted = db.execute(
+            delete(table).where(table.c.file_id == file_id, table.c.balloon_id.in_(delete_ids))
+        ).rowcount
+
+    keys = {PageBalloon.key_of(b) for b in updates + add} - {None}
+    stored: Dict[str, list] = {}
+    if keys:
+        for row in db.execute(
+            select(table.c.id, table.c.balloon_id, table.c.data)
+            .where(table.c.file_id == file_id, table.c.balloon_id.in_(keys))
+        ):
+            stored.setdefault(row.balloon_id, []).append(row)
+
+    changed, missing, new = [], [], []
+    for patch in updates:
+        rows = stored.get(PageBalloon.key_of(patch))
+        if not rows:
+            missing.append(PageBalloon.key_of(patch))
+        changed.extend({"b_id": row.id, "b_data": {**(row.data or {}), **patch}} for row in rows or [])
+    for balloon in add:
+        rows = stored.get(PageBalloon.key_of(balloon))
+        if rows:
+            changed.extend({"b_id": row.id, "b_data": balloon} for row in rows)
+        else:
+            new.append(balloon)
+
+    if changed:
+        db.execute(update(table).where(table.c.id == bindparam("b_id")).values(data=bindparam("b_data")), changed)
+    if new:
+        last = db.execute(select(func.max(table.c.position)).where(table.c.file_id == file_id)).scalar()
+        start = 0 if last is None else last + 1
+        db.execute(insert(table), [
+            {"file_id": file_id, "balloon_id": PageBalloon.key_of(balloon), "position": start + i, "data": balloon}
+            for i, balloon in enumerate(new)
+        ])
+
+    return {"added": len(new), "updated": len(changed), "deleted": deleted, "missing": missing}
+
+def bulk_delete_filesystem_entries(db: Session, entry_ids: List[str], commit: bool = True) -> int:
+    """Deletes many entries and their annotations with one DELETE per table (no cascade in SQLite without FK enforcement)."""
+    if not entry_ids:
+        return 0
+    db.execute(delete(PageBalloon).where(PageBalloon.file_id.in_(entry_ids)))
+    db.execute(delete(FileAnnotation).where(FileAnnotation.file_id.in_(entry_ids)))
+    result = db.execute(delete(FileSystemEntry).where(FileSystemEntry.id.in_(entry_ids)))
+    if commit:
+        db.commit()
+    return result.rowcount
+
 def delete_filesystem_entry(db: Session, entry_id: str):
     # This is a simple delete. Recursive deletion of children is handled by app logic or further calls if needed.
     # Ideally should cascade but for now following existing logic.
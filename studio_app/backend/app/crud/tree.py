@@ -0,0 +1,148 @@
+from typing import Dict, Iterable, List
+from sqlalchemy import and_, event, func, inspect, literal, select, update
+from sqlalchemy.orm import Session
+from app.models_db import FileSystemEntry
+
+# Tree index: every entry stores its materialized path "/{root id}/.../{own id}/" (filesystem.path).
+# A subtree is the index range [path, path with its last "/" replaced by "0"): "0" sorts right after "/".
+# Ancestors are read straight from the path. Paths are maintained in the same transaction as the change:
+# ORM inserts/moves through the before_flush hook below, Core bulk writes through assign_paths/repath.
+
+def path_of(parent_path: str | None, entry_id: str) -> str:
+    return f"{parent_path or '/'}{entry_id}/"
+
+def _in_subtree(path_column, prefix):
+    upper = func.substr(prefix, 1, func.length(prefix) - 1).concat("0")
+    return and_(path_column >= prefix, path_column < upper)
+
+def _parent_paths(connection, parent_ids: Iterable[str | None]) -> Dict[str, str]:
+    table = FileSystemEntry.__table__
+    ids = {parent_id for parent_id in parent_ids if parent_id is not None}
+    if not ids:
+        return {}
+    return dict(connection.execute(select(table.c.id, table.c.path).where(table.c.id.in_(ids))).all())
+
+def move_subtree(connection, old_path: str, new_path: str):
+    """Moves a whole subtree in one UPDATE: the old prefix of every path below old_path becomes new_path."""
+    if new_path.startswith(old_path):
+        raise ValueError("Cannot move an entry below itself")
+    table = FileSystemEntry.__table__
+    connection.execute(
+        update(table)
+        .where(_in_subtree(table.c.path, literal(old_path)))
+        .values(path=literal(new_path).concat(func.substr(table.c.path, len(old_path) + 1)))
+    )
+
+def assign_paths(connection, rows: List[dict]):
+    """
+    Sets row["path"] for rows about to be bulk-inserted (snake_case dicts with id/parent_id).
+    Parents may be earlier or later rows of the same batch; others are read in one query.
+    """
+    batch = {row["id"]: row for row in rows}
+    known = _parent_paths(connection, [row["parent_id"] for row in rows if row["parent_id"] not in batch])
+
+    def resolve(row, seen=()):
+        if row.get("path") is None:
+            parent = batch.get(row["parent_id"])
+            if parent is not None and parent["id"] not in seen and parent is not row:
+                parent_path = resolve(parent, seen + (row["id"],))
+            else:
+                parent_path = known.get(row["parent_id"])
+            row["path"] = path_of(parent_path, row["id"])
+        return row["path"]
+
+    for row in rows:
+        resolve(row)
+
+def repath(connection, entry_ids: Iterable[str]):
+    """Recomputes the paths of entries whose parent_id was changed outside the ORM (and of their subtrees)."""
+    table = FileSystemEntry.__table__
+    for entry_id, parent_id, old_path in connection.execute(
+        select(table.c.id, table.c.parent_id, table.c.path).where(table.c.id.in_(list(entry_ids)))
+    ).all():
+        new_path = path_of(_parent_paths(connection, [parent_id]).get(parent_id), entry_id)
+        if old_path is None:
+            connection.execute(update(table).where(table.c.id == entry_id).values(path=new_path))
+        elif old_path != new_path:
+            move_subtree(connection, old_path, new_path)
+
+@event.listens_for(Session, "before_flush")
+def _sync_paths(session, flush_context, instances):
+    """
+    Paths of ORM-inserted and re-parented entries, set before the flush writes them.
+    Every path is resolved against the tree as it will be after the flush, so parents added
+    or moved in the same flush (a folder and its pages added together) are taken into account.
+    """
+    new = {e.id: e for e in session.new if isinstance(e, FileSystemEntry)}
+    moved = {
+        e.id: e for e in session.dirty
+        if isinstance(e, FileSystemEntry) and inspect(e).attrs.parent_id.history.has_changes()
+    }
+    if not new and not moved:
+        return
+    connection = session.connection()
+    stored = _parent_paths(connection, [e.parent_id for e in (*new.values(), *moved.values())] + list(moved))
+    paths: Dict[str, str] = {}
+
+    def final_path(entry_id, seen=()):
+        if entry_id is None or entry_id in seen:
+            return stored.get(entry_id)
+        if entry_id not in paths:
+            entry = new.get(entry_id) or moved.get(entry_id)
+            if entry is not None:
+                paths[entry_id] = path_of(final_path(entry.parent_id, seen + (entry_id,)), entry_id)
+            else:
+                # Unchanged entry: its stored path, below the new path of its nearest moved ancestor
+                ids = stored[entry_id].strip("/").split("/") if entry_id in stored else []
+                moved_at = next((i for i in range(len(ids) - 1, -1, -1) if ids[i] in moved), None)
+                if moved_at is None:
+                    paths[entry_id] = stored.get(entry_id)
+                else:
+                    below = "".join(f"{i}/" for i in ids[moved_at + 1:])
+                    paths[entry_id] = final_path(ids[moved_at], seen + (entry_id,)) + below
+        return paths[entry_id]
+
+    # Deepest moves first: a subtree moved out of a subtree that moves later is already out of its range
+    for entry in sorted(moved.values(), key=lambda e: len(stored.get(e.id) or ""), reverse=True):
+        old_path, entry.path = stored.get(entry.id), final_path(entry.id)
+        if old_path and old_path != entry.path:
+            move_subtree(connection, old_path, entry.path)
+    for entry in new.values():
+        entry.path = final_path(entry.id)
+
+# --- Queries ---
+
+def _root_path(root_id: str):
+    table = FileSystemEntry.__table__
+    return select(table.c.path).where(table.c.id == root_id).scalar_subquery()
+
+def _subtree_ids(root_id: str, include_root: bool = True):
+    """Select of every id under root_id: one range scan on the path index."""
+    table = FileSystemEntry.__table__
+    ids = select(table.c.id).where(_in_subtree(table.c.path, _root_path(root_id)))
+    return ids if include_root else ids.where(table.c.id != root_id)
+
+def get_descendant_ids(db: Session, root_id: str, include_root: bool = False) -> List[str]:
+    return list(db.execute(_subtree_ids(root_id, include_root)).scalars())
+
+def get_subtree_entries(db: Session, root_id: str, include_root: bool = True, file_type: str | None = None):
+    """Entries under root_id (all levels), optionally only one type, in (order, name) order."""
+    query = db.query(FileSystemEntry).filter(_in_subtree(FileSystemEntry.path, _root_path(root_id)))
+    if not include_root:
+        query = query.filter(FileSystemEntry.id != root_id)
+    if file_type is not None:
+        query = query.filter(FileSystemEntry.type == file_type)
+    return query.order_by(FileSystemEntry.order, FileSystemEntry.name).all()
+
+def get_subtree_files(db: Session, root_id: str):
+    return get_subtree_entries(db, root_id, include_root=False, file_type="file")
+
+def get_ancestor_ids(db: Session, entry_id: str, include_self: bool = False) -> List[str]:
+    """Ids from entry_id's parent up to the root (nearest first), read from the entry's path."""
+    path = db.execute(select(FileSystemEntry.path).where(FileSystemEntry.id == entry_id)).scalar()
+    ids = list(reversed(path.strip("/").split("/"))) if path else []
+    return ids if include_self else ids[1:]
+
+def is_in_subtree(db: Session, entry_id: str, root_id: str) -> bool:
+    """True if entry_id is root_id or lies anywhere below it."""
+    return root_id in get_ancestor_ids(db, entry_id, include_self=True)
@@ -1,21 +1,161 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from loguru import logger
 
-from app.config import DATABASE_URL
+from app.config import (
+    DATABASE_URL, DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_CACHE_SIZE_MB, DB_MMAP_SIZE_MB,
+    DB_BUSY_TIMEOUT_MS, DB_POOL_SIZE, DB_MAX_OVERFLOW
+)
 
 # Parallel Setup: Using dynamic DB file from config
 SQLALCHEMY_DATABASE_URL = DATABASE_URL
 
-# connect_args={"check_same_thread": False} is needed for SQLite
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def create_sqlite_engine(
+    url: str,
+    journal_mode: str = DB_JOURNAL_MODE,
+    synchronous: str = DB_SYNCHRONOUS,
+    cache_size_mb: int = DB_CACHE_SIZE_MB,
+    mmap_size_mb: int = DB_MMAP_SIZE_MB,
+    busy_timeout_ms: int = DB_BUSY_TIMEOUT_MS,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+):
+    """
+    SQLite engine with the storage pragmas applied to every new pooled connection.
+    Also used by scripts/bench_sqlite_concurrency.py to compare settings.
+    """
+    # connect_args={"check_same_thread": False} is needed for SQLite
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": busy_timeout_ms / 1000},
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")  # Persistent for WAL, per connection otherwise
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA cache_size={-cache_size_mb * 1024}")  # Negative = KiB
+        cursor.execute(f"PRAGMA mmap_size={mmap_size_mb * 1024 * 1024}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+        cursor.close()
+
+    return engine
+
+engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def _explode_balloons(conn, source_table: str, id_column: str) -> int:
+    """Copies the JSON balloon arrays of source_table.balloons into page_balloons rows (one per balloon)."""
+    return conn.execute(text(
+        f"INSERT INTO page_balloons (file_id, balloon_id, position, data) "
+        f"SELECT src.{id_column}, "
+        f"CASE WHEN item.type = 'object' THEN CAST(json_extract(item.value, '$.id') AS TEXT) END, "
+        f"item.key, json_quote(item.value) "
+        f"FROM {source_table} AS src, json_each(src.balloons) AS item "
+        f"WHERE json_valid(src.balloons) AND json_type(src.balloons) = 'array' "
+        f"AND src.{id_column} NOT IN (SELECT file_id FROM page_balloons)"
+    )).rowcount
+
+# PRAGMA user_version from which the legacy annotation columns have been copied
+ANNOTATIONS_COPIED_VERSION = 1
+
+def legacy_annotation_columns(inspector) -> dict:
+    """{table: [legacy annotation columns still present]} (see _move_inline_annotations)."""
+    legacy = {"filesystem": {"balloons", "panels"}, "file_annotations": {"balloons"}}
+    return {
+        table: sorted({column["name"] for column in inspector.get_columns(table)} & columns)
+        for table, columns in legacy.items() if inspector.has_table(table)
+    }
+
+def _move_inline_annotations(conn, inspector):
+    """
+    One-time copies of older annotation layouts into file_annotations + page_balloons:
+    filesystem.balloons/panels (inline columns) and file_annotations.balloons (one JSON array per page).
+    The legacy columns are left in place (nothing is lost if the copy has to be redone or the app
+    rolled back); scripts/drop_legacy_annotation_columns.py drops them after backing up the database.
+    The copy is recorded in PRAGMA user_version, so it never runs again over newer edits.
+    """
+    if not inspector.has_table("filesystem") or not inspector.has_table("file_annotations"):
+        return
+    if conn.execute(text("PRAGMA user_version")).scalar() >= ANNOTATIONS_COPIED_VERSION:
+        return
+    legacy = {column["name"] for column in inspector.get_columns("filesystem")} & {"balloons", "panels"}
+    if legacy:
+        # JSON columns store Python None as the string 'null'
+        present = lambda col: f"({col} IS NOT NULL AND {col} != 'null')" if col in legacy else "0"
+        source = lambda col: col if col in legacy else "NULL"
+        moved = conn.execute(text(
+            f"INSERT OR IGNORE INTO file_annotations (file_id, panels, revision) "
+            f"SELECT id, {source('panels')}, 0 FROM filesystem "
+            f"WHERE {present('balloons')} OR {present('panels')}"
+        )).rowcount
+        if "balloons" in legacy:
+            _explode_balloons(conn, "filesystem", "id")
+        logger.info(f"🛠️ Schema: copied annotations of {moved} files to file_annotations")
+
+    if "balloons" in {column["name"] for column in inspector.get_columns("file_annotations")}:
+        moved = _explode_balloons(conn, "file_annotations", "file_id")
+        logger.info(f"🛠️ Schema: split {moved} balloons into page_balloons")
+
+    conn.execute(text(f"PRAGMA user_version = {ANNOTATIONS_COPIED_VERSION}"))
+
+def _backfill_tree_paths(conn):
+    """
+    Fills filesystem.path (materialized tree path, see app/crud/tree.py) where it is missing,
+    walking down from the roots in one recursive query. Entries whose parent does not exist
+    count as roots; entries only reachable through a parent cycle become roots too.
+    """
+    missing = conn.execute(text("SELECT COUNT(*) FROM filesystem WHERE path IS NULL")).scalar()
+    if not missing:
+        return
+    conn.execute(text(
+        "UPDATE filesystem SET path = tree.path FROM ("
+        "  WITH RECURSIVE tree(id, path) AS ("
+        "    SELECT id, '/' || id || '/' FROM filesystem"
+        "    WHERE parent_id IS NULL OR parent_id NOT IN (SELECT id FROM filesystem)"
+        "    UNION"
+        "    SELECT child.id, tree.path || child.id || '/' FROM filesystem AS child JOIN tree ON child.parent_id = tree.id"
+        "  ) SELECT id, path FROM tree"
+        ") AS tree WHERE filesystem.id = tree.id AND filesystem.path IS NULL"
+    ))
+    conn.execute(text("UPDATE filesystem SET path = '/' || id || '/' WHERE path IS NULL"))
+    logger.info(f"🛠️ Schema: backfilled tree paths of {missing} entries")
+
+def upgrade_schema():
+    """
+    create_all() only creates missing tables. For tables that already exist, adds the columns
+    and indexes the models gained since (new columns must be nullable: existing rows get NULL).
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                    logger.info(f"🛠️ Schema: added column {table.name}.{column.name}")
+        _move_inline_annotations(conn, inspector)
+        if inspector.has_table("filesystem"):
+            _backfill_tree_paths(conn)
+            # Keyset listing order (order, name, id) needs a value: rows from before the column have NULL
+            # order, and a NULL name would end the pages at that row
+            conn.execute(text('UPDATE filesystem SET "order" = 0 WHERE "order" IS NULL'))
+            conn.execute(text("UPDATE filesystem SET name = '' WHERE name IS NULL"))
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional, Literal
 
 class Project(BaseModel):
     id: str
@@ -31,10 +31,25 @@ class CleanRequest(BaseModel):
 
 class YOLOAnalyzeRequest(BaseModel):
     image_path: str
+    debug: Optional[bool] = False  # Save annotated detection image to temp/inference
+    simplify: Optional[Literal["dp", "hull", "none"]] = "dp"  # Polygon simplifier
+    tolerance: Optional[float] = Field(0.003, ge=0)  # DP epsilon as fraction of perimeter
+    comic_id: Optional[str] = None  # Async jobs only: groups the job for /jobs/stream?comic_id=
+
+class ThumbnailBatchRequest(BaseModel):
+    urls: List[str]                         # Page URLs/paths, as accepted by /thumbnail
+    width: Optional[int] = 300
+
+class BatchDetectRequest(BaseModel):
+    folder_id: str                          # Comic/folder whose pages will be scanned
+    batch_size: Optional[int] = Field(None, ge=1, le=32)  # Pages per predict call, defaults to YOLO_BATCH_SIZE
+    simplify: Optional[Literal["dp", "hull", "none"]] = "dp"
+    tolerance: Optional[float] = Field(0.003, ge=0)
 
 class OCRRequest(BaseModel):
     image_path: str
     balloons: list
+    comic_id: Optional[str] = None  # Async jobs only: groups the job for /jobs/stream?comic_id=
 
 class StoreRequest(BaseModel):
     data: dict
@@ -60,6 +75,12 @@ class FileUpdateData(BaseModel):
     cleanUrl: Optional[str] = None
     isCleaned: Optional[bool] = None
 
+class BalloonPatchRequest(BaseModel):
+    baseRevision: Optional[int] = None # Page revision the edit started from (409 if it moved on)
+    add: List[Balloon] = [] # New balloons (an existing id is replaced)
+    update: List[Balloon] = [] # id + changed fields only
+    delete: List[str] = [] # Balloon ids
+
 class CreateFolderRequest(BaseModel):
     name: str
     parentId: str
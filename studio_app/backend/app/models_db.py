@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Boolean, Integer, Text, ForeignKey, JSON
+from sqlalchemy import Column, String, Boolean, Integer, Float, Text, ForeignKey, JSON, Index
+from sqlalchemy.orm import relationship
 from .database import Base
 
 class Project(Base):
@@ -19,21 +20,122 @@ class FileSystemEntry(Base):
     id = Column(String, primary_key=True, index=True)
     parent_id = Column(String, index=True)
     project_id = Column(String, nullable=True, index=True) # Optional link to project
-    name = Column(String)
+    name = Column(String, default="", nullable=False)
     type = Column(String) # 'file', 'folder', 'comic'
+    # Materialized path "/{root id}/.../{own id}/": a subtree is a range scan on this index
+    # (maintained by app/crud/tree.py, backfilled by upgrade_schema)
+    path = Column(String, nullable=True, index=True)
     
     # File Specific
     url = Column(String, nullable=True)
     clean_url = Column(String, nullable=True)
     is_cleaned = Column(Boolean, default=False)
     
-    # Balloons Data (Stored as JSON)
-    balloons = Column(JSON, nullable=True)
-    panels = Column(JSON, nullable=True) # Added panels support
+    # Balloons/Panels Data: kept in page_balloons (one row per balloon) and file_annotations,
+    # loaded only when accessed, so tree queries never read annotation payloads.
+    # entry.balloons / entry.panels still work.
+    annotations = relationship("FileAnnotation", uselist=False, lazy="select", cascade="all, delete-orphan")
+    balloon_rows = relationship(
+        "PageBalloon", order_by="PageBalloon.position", lazy="select", cascade="all, delete-orphan"
+    )
     
     # Metadata
     created_at = Column(String)
-    order = Column(Integer, default=0)
+    order = Column(Integer, default=0, nullable=False)
 
     is_pinned = Column(Boolean, default=False)
     color = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Children of a folder by type, in name order: listings and cover lookup (first file child)
+        Index("ix_filesystem_parent_type_name", "parent_id", "type", "name"),
+        # Listing order (order, name, id) per folder and overall: keyset pages are index seeks
+        Index("ix_filesystem_parent_order_name", "parent_id", "order", "name", "id"),
+        Index("ix_filesystem_order_name", "order", "name", "id"),
+    )
+
+    def _annotations_row(self) -> "FileAnnotation":
+        if self.annotations is None:
+            self.annotations = FileAnnotation(revision=0)
+        return self.annotations
+
+    @property
+    def balloons(self):
+        # None = never annotated; [] = saved without balloons
+        if self.annotations is None and not self.balloon_rows:
+            return None
+        return [row.data for row in self.balloon_rows]
+
+    @balloons.setter
+    def balloons(self, value):
+        """
+        Replaces every balloon of the page through the ORM collection (new pages). Saves of stored
+        pages go through crud.replace_page_annotations under the page's write lock; crud.patch_balloons
+        changes only some balloons.
+        """
+        if value is None and self.annotations is None and not self.balloon_rows:
+            return
+        self._annotations_row()
+        self.balloon_rows = [PageBalloon.from_data(balloon, position) for position, balloon in enumerate(value or [])]
+
+    @property
+    def panels(self):
+        return self.annotations.panels if self.annotations else None
+
+    @panels.setter
+    def panels(self, value):
+        if value is not None or self.annotations is not None:
+            self._annotations_row().panels = value
+
+    @property
+    def revision(self) -> int:
+        return (self.annotations.revision or 0) if self.annotations else 0
+
+    def bump_revision(self) -> int:
+        annotations = self._annotations_row()
+        annotations.revision = (annotations.revision or 0) + 1
+        return annotations.revision
+
+class FileAnnotation(Base):
+    __tablename__ = "file_annotations"
+
+    file_id = Column(String, ForeignKey("filesystem.id", ondelete="CASCADE"), primary_key=True)
+    panels = Column(JSON, nullable=True) # Added panels support
+    # Page revision: incremented by every balloons/panels write (optimistic concurrency for patches)
+    revision = Column(Integer, default=0)
+
+class PageBalloon(Base):
+    __tablename__ = "page_balloons"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_id = Column(String, ForeignKey("filesystem.id", ondelete="CASCADE"), nullable=False)
+    balloon_id = Column(String, nullable=True) # The balloon's own "id" (patch key)
+    position = Column(Integer, default=0) # Order of the balloon on the page
+    data = Column(JSON) # Balloon Data (Stored as JSON)
+
+    __table_args__ = (
+        # A page's balloons in order; also the lookup path for patches by balloon id
+        Index("ix_page_balloons_file_position", "file_id", "position"),
+    )
+
+    @staticmethod
+    def key_of(balloon: dict) -> str | None:
+        balloon_id = balloon.get("id") if isinstance(balloon, dict) else None
+        return str(balloon_id) if balloon_id is not None else None
+
+    @classmethod
+    def from_data(cls, balloon: dict, position: int) -> "PageBalloon":
+        return cls(balloon_id=cls.key_of(balloon), position=position, data=balloon)
+
+class JobRecord(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    type = Column(String, index=True)
+    comic_id = Column(String, index=True, nullable=True)
+    status = Column(String, index=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    progress = Column(Float, default=0.0)
+    created_at = Column(Float, index=True) # Unix timestamps (matches JobStatus)
+    updated_at = Column(Float)
@@ -1,26 +1,78 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from app.models import YOLOAnalyzeRequest, OCRRequest
+import json
+import time
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app import crud
+from app.models import YOLOAnalyzeRequest, OCRRequest, BatchDetectRequest
 from app.services import ai_service
 from app.services.job_manager import job_manager
+from app.services.job_scheduler import job_scheduler, JobPriority
+from app.services.worker_pool import WorkerPoolBusy
 
 router = APIRouter(prefix="/ai", tags=["AI Async"])
 
 @router.post("/detect/async")
-async def detect_async(request: YOLOAnalyzeRequest, background_tasks: BackgroundTasks):
+async def detect_async(request: YOLOAnalyzeRequest, priority: JobPriority = JobPriority.INTERACTIVE):
     """
     Starts an async YOLO detection job.
     Returns: {"job_id": "...", "status": "PENDING"}
     """
-    job_id = job_manager.create_job("YOLO_DETECTION")
-    background_tasks.add_task(ai_service.process_detection_job, job_id, request.image_path)
+    job_id = job_manager.create_job("YOLO_DETECTION", comic_id=request.comic_id)
+    job_scheduler.submit(
+        job_id, ai_service.process_detection_job, request.image_path,
+        request.debug, request.simplify, request.tolerance,
+        queue_name="detection", priority=priority
+    )
     return {"job_id": job_id, "status": "PENDING"}
 
+@router.post("/detect/batch")
+def detect_batch(request: BatchDetectRequest, db: Session = Depends(get_db)):
+    """
+    Runs YOLO over every page of a comic/folder in mini-batches on the YOLO worker pool.
+    Streams one NDJSON line per page as soon as its batch finishes,
+    followed by a final {"status": "done"} summary line.
+    """
+    # Gather pages up-front so the DB session is not held while streaming
+    entries = crud.get_filesystem_by_parent(db, request.folder_id)
+    pages = sorted(
+        [e for e in entries if e.type == "file" and e.url],
+        key=lambda e: (e.order or 0, e.name or "")
+    )
+    if not pages:
+        raise HTTPException(status_code=404, detail="No pages found for folder")
+
+    page_ids = [p.id for p in pages]
+    page_urls = [p.url for p in pages]
+
+    start = time.perf_counter()
+    try:
+        pages_iter = ai_service.iter_yolo_batch(page_urls, request.batch_size, request.simplify, request.tolerance)
+    except WorkerPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    def stream():
+        for page in pages_iter:
+            page["file_id"] = page_ids[page["index"]]
+            yield json.dumps(page) + "\n"
+        yield json.dumps({
+            "status": "done",
+            "pages": len(page_urls),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000)
+        }) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @router.post("/ocr/async")
-async def ocr_async(request: OCRRequest, background_tasks: BackgroundTasks):
+async def ocr_async(request: OCRRequest, priority: JobPriority = JobPriority.INTERACTIVE):
     """
     Starts an async OCR job.
     Returns: {"job_id": "...", "status": "PENDING"}
     """
-    job_id = job_manager.create_job("OCR_READING")
-    background_tasks.add_task(ai_service.process_ocr_job, job_id, request.image_path, request.balloons)
+    job_id = job_manager.create_job("OCR_READING", comic_id=request.comic_id)
+    job_scheduler.submit(
+        job_id, ai_service.process_ocr_job, request.image_path, request.balloons,
+        queue_name="ocr", priority=priority
+    )
     return {"job_id": job_id, "status": "PENDING"}
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header
 from sqlalchemy.orm import Session
 from app.models import AnalyzeRequest, CleanRequest, YOLOAnalyzeRequest, OCRRequest
 from app.database import get_db
@@ -11,6 +12,8 @@ from app.services.ai_service import analyze_page_layout, clean_page_content, per
 # Dedicated Services for Detection
 from app.services.frame_service import detect_frames
 from app.services.balloon_service import execute_yolo
+# CPU-heavy work runs on per-stage worker pools, off the event loop
+from app.services.worker_pool import worker_pool, WorkerPoolBusy
 
 router = APIRouter(tags=["AI"])
 
@@ -30,7 +33,7 @@ async def clean_page(request: CleanRequest, db: Session = Depends(get_db)):
         if request.bubbles:
             logger.info(f"   -> Sample Balloon: {request.bubbles[0]}")
             
-        clean_url, mask_url = clean_page_content(request.image_url, request.bubbles)
+        clean_url, mask_url = await worker_pool.run("image", clean_page_content, request.image_url, request.bubbles)
         if not clean_url: return {"clean_image_url": request.image_url}
         
         final_clean_url = f"http://127.0.0.1:8000/temp/{clean_url}"
@@ -44,15 +47,24 @@ async def clean_page(request: CleanRequest, db: Session = Depends(get_db)):
             "clean_image_url": final_clean_url,
             "debug_mask_url": f"http://127.0.0.1:8000/temp/{mask_url}" if mask_url else None
         }
+    except WorkerPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Clean Page Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/analisar-yolo")
-async def analisar_yolo(request: YOLOAnalyzeRequest):
+async def analisar_yolo(request: YOLOAnalyzeRequest, x_debug_inference: Optional[str] = Header(None)):
     try:
+        # Debug images are opt-in: body flag or "X-Debug-Inference: 1" header
+        debug = bool(request.debug) or x_debug_inference in ("1", "true")
         # Calls the dedicated Balloon Service
-        return execute_yolo(request.image_path)
+        return await worker_pool.run(
+            "yolo", execute_yolo, request.image_path,
+            debug=debug, simplify=request.simplify, tolerance=request.tolerance
+        )
+    except WorkerPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"YOLO Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -60,12 +72,14 @@ async def analisar_yolo(request: YOLOAnalyzeRequest):
 @router.post("/ler-texto")
 async def read_text(request: OCRRequest):
     try:
-        result = perform_ocr(request.image_path, request.balloons)
+        result = await worker_pool.run("image", perform_ocr, request.image_path, request.balloons)
         return {
             "status": "success", 
             "balloons": result.get("balloons", []),
             "detected_language": result.get("detected_language")
         }
+    except WorkerPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"OCR Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -74,9 +88,11 @@ async def read_text(request: OCRRequest):
 async def analisar_quadros(request: YOLOAnalyzeRequest):
     try:
         # Calls the dedicated Frame Service
-        frames = detect_frames(request.image_path)
+        frames = await worker_pool.run("frames", detect_frames, request.image_path)
         # Returns 'panels' key for Frontend compatibility
         return {"status": "success", "panels": frames}
+    except WorkerPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Panel Detection Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
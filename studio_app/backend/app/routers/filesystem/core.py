@@ -1,15 +1,65 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Depends
+import json
+import base64
+from typing import Optional
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Depends, Query, Response
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app import crud
-from app.models import StoreRequest, MoveItemRequest, ReorderItemsRequest, FileRenameRequest, CreateFolderRequest, FileUpdateData
+from app.models import StoreRequest, MoveItemRequest, ReorderItemsRequest, FileRenameRequest, CreateFolderRequest, FileUpdateData, BalloonPatchRequest
 from app.models_db import FileSystemEntry
+from app.services.tile_service import tile_service
+from app.services.save_buffer import save_buffer
 from loguru import logger
 
 router = APIRouter(tags=["Filesystem Core"])
 
+# Keys of a GET /filesystem item, for ?fields= (id is always included)
+LISTING_FIELDS = (
+    "id", "name", "type", "parentId", "url", "cleanUrl", "isCleaned", "createdAt", "isPinned",
+    "balloons", "panels", "order", "color", "isComic", "coverUrl"
+)
+MAX_LISTING_PAGE = 1000
+
+def _encode_cursor(row) -> str:
+    key = json.dumps([row.order, row.name, row.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        order, name, entry_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return order, name, entry_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/filesystem")
-def get_filesystem(parentId: str = None, db: Session = Depends(get_db)):
+def get_filesystem(
+    response: Response,
+    parentId: str = None,
+    includeData: bool = True,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LISTING_PAGE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Library listing, ordered by (order, name).
+    Pagination (keyset): pass limit, then the X-Next-Cursor header of each page as ?cursor=
+    (no header on the last page). Without limit/cursor every matching entry is returned.
+    fields=id,name,coverUrl,... returns only those keys (balloons/panels/cover are not even queried
+    unless asked for). includeData=false drops balloons/panels as before.
+    The total number of matching entries is in the X-Total-Count header.
+    """
+    selected = LISTING_FIELDS
+    if fields:
+        selected = tuple(dict.fromkeys(["id"] + [f.strip() for f in fields.split(",") if f.strip()]))
+        unknown = [f for f in selected if f not in LISTING_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    include_data = includeData and ("balloons" in selected or "panels" in selected)
+    include_cover = "isComic" in selected or "coverUrl" in selected
+    after = _decode_cursor(cursor) if cursor else None
+
+    save_buffer.flush()  # Read-after-write: pending editor saves first (no-op when nothing is pending)
     if parentId is not None:
         # Lazy Load: Get only children of this parent
         # If parentId is "root" string from frontend, we treat it as None DB-wise if that's the convention,
@@ -18,17 +68,27 @@ def get_filesystem(parentId: str = None, db: Session = Depends(get_db)):
         # But if omitted, we want ALL (Legacy).
         # So we check if it IS NOT NONE.
         if parentId == "null": parentId = None # Handle "null" string if passed
-        entries = crud.get_filesystem_by_parent(db, parentId)
+        scope = {"parent_id": parentId}
     else:
-        # Eager Load (Legacy / Default): Get EVERYTHING
-        entries = crud.get_all_filesystem_entries(db)
+        # Eager Load (Legacy / Default): Get EVERYTHING (page by page with limit/cursor)
+        scope = {"all_entries": True}
+
+    page_size = limit or (MAX_LISTING_PAGE if cursor else None)
+    rows = crud.list_filesystem_entries(
+        db, **scope, include_data=include_data, include_cover=include_cover,
+        after=after, limit=page_size + 1 if page_size else None
+    )
+    if page_size and len(rows) > page_size:
+        rows = rows[:page_size]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1])
+    response.headers["X-Total-Count"] = str(crud.count_filesystem_entries(db, **scope))
         
-    # Map back to camelCase for frontend
     # Map back to camelCase for frontend
     # Backend Enrichment: Check if folders are actually Comics (contain files)
+    # Covers come from the same query (see crud.list_filesystem_entries), no per-folder lookup
     response_list = []
     
-    for e in entries:
+    for e in rows:
         item_dict = {
             "id": e.id,
             "name": e.name,
@@ -39,36 +99,31 @@ def get_filesystem(parentId: str = None, db: Session = Depends(get_db)):
             "isCleaned": e.is_cleaned,
             "createdAt": e.created_at,
             "isPinned": e.is_pinned,
-            "balloons": e.balloons,
-            "panels": e.panels, # Added panels
-            "order": e.order,
-            "color": e.color
         }
+        if include_data:
+            item_dict["balloons"] = e.balloons
+            item_dict["panels"] = e.panels # Added panels
+        item_dict["order"] = e.order
+        item_dict["color"] = e.color
 
-        # Lazy Logic Fix: If it's a folder, check if it has children files (Implicit Comic)
-        if e.type == 'folder' or e.type == 'comic':
-            # Check for first child file (Cover)
-            # We use a localized query. Performance note: N+1 but necessary for Lazy Tree correctness involving legacy data.
-            # Ideally we would join, but for SQLite this is acceptable < 50 items.
-            first_child = db.query(FileSystemEntry).filter(
-                FileSystemEntry.parent_id == e.id, 
-                FileSystemEntry.type == 'file'
-            ).order_by(FileSystemEntry.name).first()
-            
-            if first_child:
-                item_dict['isComic'] = True
-                item_dict['coverUrl'] = first_child.url
-                # Optional: Overwrite type to 'comic' logic if we want strictness, 
-                # but let's keep it additive 'isComic' field for safety as per Dossier.
-        
+        # Lazy Logic Fix: If it's a folder with a child file, it's an (implicit) Comic
+        if e.cover_id is not None:
+            item_dict['isComic'] = True
+            item_dict['coverUrl'] = e.cover_url
+            # Optional: Overwrite type to 'comic' logic if we want strictness, 
+            # but let's keep it additive 'isComic' field for safety as per Dossier.
+
+        if fields:
+            item_dict = {key: item_dict[key] for key in selected if key in item_dict}
         response_list.append(item_dict)
 
     return response_list
 
 @router.get("/files/{item_id}")
 def get_filesystem_item(item_id: str, db: Session = Depends(get_db)):
-    # SINGLE ITEM FETCH (Metadata)
-    entry = crud.get_filesystem_entry(db, item_id)
+    # SINGLE ITEM FETCH (Metadata + annotations, loaded on demand from file_annotations)
+    save_buffer.flush([item_id])
+    entry = crud.get_filesystem_entry(db, item_id, with_annotations=True)
     if not entry:
         raise HTTPException(status_code=404, detail="Item not found")
         
@@ -84,6 +139,7 @@ def get_filesystem_item(item_id: str, db: Session = Depends(get_db)):
         "isPinned": entry.is_pinned,
         "balloons": entry.balloons,
         "panels": entry.panels, # Added panels
+        "revision": entry.revision, # Send back as baseRevision in PATCH /files/{id}/balloons
         "order": entry.order,
         "color": entry.color
     }
@@ -105,22 +161,47 @@ def create_folder(request: CreateFolderRequest, db: Session = Depends(get_db)):
 
 @router.put("/files/{file_id}/data")
 def update_file_data(file_id: str, update_data: FileUpdateData, db: Session = Depends(get_db)):
-    from app.services.persistence_service import PersistenceService
-    
-    service = PersistenceService(db)
-    success = service.save_file_data(file_id, update_data)
-    
-    if not success:
-         # Check if it was a 404 or a 500 inside the service? 
-         # The service logs errors. We assume if it returned False, something went wrong.
-         # For now, generic 500 or 404. Let's assume 404 for missing file is common.
-         # Ideally service returns a status/enum.
-         # But based on logs, if file missing -> logs error.
-         # We will return 400 or 404.
-         logger.warning(f"PersistenceService returned failure for {file_id}")
-         raise HTTPException(status_code=400, detail="Failed to save data. Check server logs.")
+    """
+    Editor save. Coalesced with other saves of the same window (see services/save_buffer.py) and
+    answered once committed, with the new revision. Only with SAVE_DURABILITY=buffered does the
+    response come before the commit ("queued": true, no revision yet).
+    """
+    if not crud.get_filesystem_entry(db, file_id):
+        logger.warning(f"Save for unknown file {file_id}")
+        raise HTTPException(status_code=400, detail="Failed to save data. Check server logs.")
 
-    return {"status": "success", "message": "File data updated via PersistenceService"}
+    result = save_buffer.submit(file_id, update_data)
+    if not result["queued"] and not result["saved"]:
+        logger.warning(f"PersistenceService returned failure for {file_id}")
+        raise HTTPException(status_code=400, detail="Failed to save data. Check server logs.")
+
+    return {
+        "status": "success", "message": "File data updated via PersistenceService",
+        "queued": result["queued"], "revision": result.get("revision")
+    }
+
+@router.patch("/files/{file_id}/balloons")
+def patch_file_balloons(file_id: str, patch: BalloonPatchRequest, db: Session = Depends(get_db)):
+    """
+    Per-balloon edits (add / update / delete by balloon id) without resending the page.
+    With baseRevision, the patch is rejected (409) if the page was saved in the meantime.
+    """
+    from app.services.persistence_service import PersistenceService, RevisionConflict
+
+    if any(b.id is None for b in patch.update):
+        raise HTTPException(status_code=400, detail="Balloon updates need an id")
+    try:
+        # The patch applies on top of any pending full save, and no buffered save is written meanwhile
+        with save_buffer.exclusive([file_id]):
+            result = PersistenceService(db).patch_file_balloons(file_id, patch)
+    except RevisionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "revision": e.revision})
+    except Exception as e:
+        logger.error(f"Balloon patch failed for {file_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return {"status": "success", **result}
 
 
 @router.delete("/files/{item_id}")
@@ -133,25 +214,12 @@ def delete_item(item_id: str, db: Session = Depends(get_db)):
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    # 2. Define Recursive Deletion Helper
-    def get_all_descendant_ids(root_id):
-        ids = []
-        children = db.query(FileSystemEntry).filter(FileSystemEntry.parent_id == root_id).all()
-        for child in children:
-            ids.append(child.id)
-            if child.type == 'folder':
-                ids.extend(get_all_descendant_ids(child.id))
-        return ids
-
-    # 3. Collect all IDs to delete (Self + Descendants)
-    target_ids = [item.id]
-    if item.type == 'folder':
-        target_ids.extend(get_all_descendant_ids(item.id))
-
-    # 4. Physical Deletion of FILES
+    # 2. Collect the item and everything below it (one recursive query)
+    items_to_delete = crud.get_subtree_entries(db, item.id)
+    target_ids = [entry.id for entry in items_to_delete]
+
+    # 3. Physical Deletion of FILES
     deleted_files_count = 0
-    items_to_delete = db.query(FileSystemEntry).filter(FileSystemEntry.id.in_(target_ids)).all()
-    
     for entry in items_to_delete:
         if entry.type == 'file' and entry.url:
             try:
@@ -166,11 +234,12 @@ def delete_item(item_id: str, db: Session = Depends(get_db)):
             except Exception as e:
                 logger.error(f"Failed to delete physical file {entry.id}: {e}")
 
-    # 5. DB Deletion
+    # 4. DB Deletion
     try:
-        # Delete in bulk
-        db.query(FileSystemEntry).filter(FileSystemEntry.id.in_(target_ids)).delete(synchronize_session=False)
-        db.commit()
+        # Delete in bulk (entries + their annotations)
+        save_buffer.discard(target_ids)
+        crud.bulk_delete_filesystem_entries(db, target_ids)
+        tile_service.invalidate_sources(target_ids)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -192,6 +261,9 @@ def rename_item(item_id: str, request: FileRenameRequest, db: Session = Depends(
     
     if not updated:
         raise HTTPException(status_code=404, detail="Item not found")
+    if "name" in updates:
+        # The entry name is one of the tile source fallbacks
+        tile_service.invalidate_sources([item_id])
         
     return {"status": "success", "id": item_id, "name": request.name, "color": request.color, "isPinned": request.isPinned}
 
@@ -205,38 +277,32 @@ def move_item(item_id: str, request: MoveItemRequest, db: Session = Depends(get_
     if request.targetParentId == item.id:
         raise HTTPException(status_code=400, detail="Cannot move folder into itself")
     
-    # If moving a folder, check if target is a descendant (Cycle Detection)
-    if item.type == 'folder':
-        # Simple BFS or recursive check could work, but for now simple check:
-        # A robust solution would recursively check parents of targetParentId
-        # checking if any matches item.id
-        current = db.query(FileSystemEntry).filter(FileSystemEntry.id == request.targetParentId).first()
-        while current:
-            if current.id == item.id:
-                raise HTTPException(status_code=400, detail="Cannot move folder into its own child")
-            current = db.query(FileSystemEntry).filter(FileSystemEntry.id == current.parent_id).first()
-
-    item.parent_id = request.targetParentId
-    db.commit()
+    # The target must not be inside the item, whatever its type: comics hold pages too (Cycle Detection: one ancestor query)
+    if request.targetParentId and crud.is_in_subtree(db, request.targetParentId, item.id):
+        raise HTTPException(status_code=400, detail="Cannot move folder into its own child")
+
+    crud.move_filesystem_entry(db, item.id, request.targetParentId)
     return {"status": "success", "message": "Item moved"}
 
 @router.post("/files/reorder")
 def reorder_items(request: ReorderItemsRequest, db: Session = Depends(get_db)):
-    # Update order for each item in list
-    for index, item_id in enumerate(request.orderedIds):
-        db.query(FileSystemEntry).filter(FileSystemEntry.id == item_id).update({"order": index})
-    
-    db.commit()
+    # New order for every item in one executemany UPDATE / one commit
+    crud.bulk_update_filesystem_entries(db, [
+        {"id": item_id, "order": index} for index, item_id in enumerate(request.orderedIds)
+    ])
     return {"status": "success", "message": "Items reordered"}
 
 @router.post("/admin/reset_data")
 def reset_application_data(db: Session = Depends(get_db)):
     try:
         # DB Reset: delete all rows
-        from app.models_db import Project, FileSystemEntry
+        from app.models_db import Project, FileSystemEntry, FileAnnotation, PageBalloon
+        db.query(PageBalloon).delete()
+        db.query(FileAnnotation).delete()
         db.query(FileSystemEntry).delete()
         db.query(Project).delete()
         db.commit()
+        tile_service.invalidate_sources()
         logger.warning("♻️ DATA RESET COMPLETE (DB Truncated).")
         return {"status": "success"}
     except Exception as e:
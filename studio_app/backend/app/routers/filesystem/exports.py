@@ -1,5 +1,5 @@
 import re
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from loguru import logger
 
@@ -7,6 +7,7 @@ from app.database import get_db
 from app import crud
 from app.models import ExportRequest
 from app.services.job_manager import job_manager
+from app.services.job_scheduler import job_scheduler, JobPriority
 from app.services.export_service import export_service
 
 router = APIRouter(tags=["Filesystem Exports"])
@@ -15,7 +16,6 @@ router = APIRouter(tags=["Filesystem Exports"])
 def export_project(
     entity_id: str, 
     request: ExportRequest, 
-    background_tasks: BackgroundTasks, 
     db: Session = Depends(get_db)
 ):
     try:
@@ -23,36 +23,24 @@ def export_project(
         # We still gather metadata synchronously to ensure validity before creating the job.
         # Ideally, we could move even this to background, but for now let's keep it safe.
         
-        projects = crud.get_projects(db)
-        projects_dict = [{ "id": p.id, "name": p.name, "rootFolderId": p.root_folder_id } for p in projects]
-        
-        all_entries = crud.get_all_filesystem_entries(db)
-        fs_list = [{
-            "id": e.id, "name": e.name, "type": e.type, 
-            "parentId": e.parent_id, "url": e.url
-        } for e in all_entries]
-        
-        # Identify Target
-        project = next((p for p in projects_dict if p["id"] == entity_id), None)
+        # Identify Target (project root folder, or a folder)
+        project = crud.get_project(db, entity_id)
         if project:
-            target_id = project["rootFolderId"]
-            name = project["name"]
+            target_id = project.root_folder_id
+            name = project.name
         else:
-            folder = next((f for f in fs_list if f["id"] == entity_id and f["type"] == "folder"), None)
-            if folder:
-                target_id = folder["id"]
-                name = folder["name"]
+            folder = crud.get_filesystem_entry(db, entity_id)
+            if folder and folder.type == "folder":
+                target_id = folder.id
+                name = folder.name
             else:
                 raise HTTPException(status_code=404, detail="Project/Folder not found")
 
-        # Collect Files Recursive
-        def get_files(fid):
-            files = [f for f in fs_list if f.get("parentId") == fid and f.get("type") == "file"]
-            for sub in [f for f in fs_list if f.get("parentId") == fid and f.get("type") == "folder"]:
-                files.extend(get_files(sub["id"]))
-            return files
-
-        files = get_files(target_id)
+        # Collect Files Recursive (one recursive query)
+        files = [{
+            "id": e.id, "name": e.name, "type": e.type,
+            "parentId": e.parent_id, "url": e.url
+        } for e in crud.get_subtree_files(db, target_id)]
         # Sort by number in filename
         files.sort(key=lambda f: int(re.findall(r'\d+', f["name"])[0]) if re.findall(r'\d+', f["name"]) else 0)
         
@@ -60,7 +48,7 @@ def export_project(
 
         # Phase 2: Create Job
         job_type = f"EXPORT_{request.format.upper()}"
-        job_id = job_manager.create_job(job_type)
+        job_id = job_manager.create_job(job_type, comic_id=entity_id)
         
         # Payload for the worker
         payload = {
@@ -70,8 +58,11 @@ def export_project(
             "files": files
         }
         
-        # Dispatch to Background
-        background_tasks.add_task(export_service.process_export_job, job_id, payload)
+        # Dispatch to the export queue (batch priority, own workers so it never starves OCR/detection)
+        job_scheduler.submit(
+            job_id, export_service.process_export_job, payload,
+            queue_name="export", priority=JobPriority.BATCH
+        )
         
         return {
             "status": "queued",
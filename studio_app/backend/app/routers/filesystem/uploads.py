@@ -1,30 +1,132 @@
 import os
 import io
 import uuid
+import base64
 import re
 from datetime import datetime
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Depends, Request
 from sqlalchemy.orm import Session
 from PIL import Image
-from pdf2image import convert_from_bytes
 from loguru import logger
 
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app import crud
-from app.config import LIBRARY_DIR, TEMP_DIR
+from app.config import LIBRARY_DIR, TEMP_DIR, PDF_CHUNK_PAGES
 from app.utils import resolve_local_path
+from app.services.tile_service import tile_service
+from app.services.http_cache import cached_file_response
+from app.services import image_format
+from app.services.thumbnail_service import thumbnail_service
+from app.services.pdf_ingest_service import pdf_ingest_service
+from app.models import ThumbnailBatchRequest
+
+MAX_THUMBNAIL_BATCH = 500
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
 router = APIRouter(tags=["Filesystem Uploads"])
 
+async def _spool_upload(file: UploadFile, suffix: str) -> str:
+    """Streams an upload to a temp file (1 MB at a time) instead of reading it into memory."""
+    os.makedirs(os.path.join(TEMP_DIR, "uploads"), exist_ok=True)
+    path = os.path.join(TEMP_DIR, "uploads", f"{uuid.uuid4().hex}{suffix}")
+    with open(path, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            f.write(chunk)
+    return path
+
+def _ingest_pdf_pages(job_id: str, pdf_path: str, pdf_folder_id: str) -> dict:
+    """
+    PDF_INGEST job body of upload_pdf: each page is saved to the library as soon as it is
+    rasterized, and its DB row is inserted with the rest of its rasterizer window
+    (one bulk INSERT and one commit per PDF_CHUNK_PAGES pages), so pages show up in the
+    folder while the job runs.
+    If ingestion fails (or is cancelled), the written pages, their rows and the folder are removed.
+    Deletes the spooled PDF when done.
+    """
+    base_url = "http://127.0.0.1:8000/library"
+    new_pages_urls = []
+    pending_entries = []
+    inserted_ids = []
+    written_paths = []
+    tile_sources = []
+    unique_ids = {}
+
+    def dest_path(page_num: int) -> str:
+        unique_ids[page_num] = uuid.uuid4().hex[:8]
+        path = os.path.join(LIBRARY_DIR, f"page_{page_num}_{unique_ids[page_num]}.jpg")
+        written_paths.append(path)
+        return path
+
+    def flush_pages():
+        if pending_entries:
+            crud.bulk_create_filesystem_entries(db, pending_entries)
+            inserted_ids.extend(entry["id"] for entry in pending_entries)
+            pending_entries.clear()
+
+    def on_page(page_num: int, save_path: str):
+        unique_id = unique_ids.pop(page_num)
+        full_url = f"{base_url}/{os.path.basename(save_path)}"
+        entry = {
+            "id": f"file-{unique_id}",
+            "name": f"Page {page_num}",
+            "type": "file",
+            "parentId": pdf_folder_id,
+            "url": full_url,
+            "createdAt": datetime.now().isoformat(),
+            "order": page_num - 1
+        }
+        pending_entries.append(entry)
+        new_pages_urls.append({"id": entry["id"], "url": full_url, "name": entry["name"]})
+        tile_sources.append((entry["id"], save_path))
+        # Windows are PDF_CHUNK_PAGES pages starting at page 1: a full batch is a finished window
+        if len(pending_entries) >= PDF_CHUNK_PAGES:
+            flush_pages()
+
+    db = SessionLocal()
+    try:
+        pdf_ingest_service.extract_pages(pdf_path, dest_path, on_page, job_id=job_id)
+        flush_pages()
+    except BaseException:
+        db.rollback()
+        try:
+            crud.bulk_delete_filesystem_entries(db, inserted_ids + [pdf_folder_id])
+        except Exception as e:
+            logger.error(f"Failed to remove rows of failed PDF import {pdf_folder_id}: {e}")
+        for path in written_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        logger.warning(f"🧹 PDF import {pdf_folder_id} failed: removed {len(written_paths)} pages and the folder")
+        raise
+    finally:
+        db.close()
+        os.remove(pdf_path)
+
+    # Gallery thumbnails + Deep Zoom pyramid for every page, built in the background
+    thumbnails_job_id = thumbnail_service.schedule_pregeneration([path for _, path in tile_sources], comic_id=pdf_folder_id)
+    tiles_job_id = tile_service.schedule_pyramids(tile_sources, comic_id=pdf_folder_id)
+
+    return {
+        "status": "success", "folder_id": pdf_folder_id, "page_count": len(new_pages_urls), "pages": new_pages_urls,
+        "tiles_job_id": tiles_job_id, "thumbnails_job_id": thumbnails_job_id
+    }
+
 @router.post("/upload_pdf")
-async def upload_pdf(file: UploadFile = File(...), parent_id: str = Form(...), db: Session = Depends(get_db)):
+async def upload_pdf(
+    file: UploadFile = File(...), parent_id: str = Form(...), background: bool = Form(False),
+    db: Session = Depends(get_db)
+):
+    """
+    Imports a PDF as a comic folder, one page at a time (see services/pdf_ingest_service.py).
+    Runs as a PDF_INGEST job for the new folder; with background=true only the job id is returned
+    and pages appear in the folder as they are rasterized (one window of PDF_CHUNK_PAGES at a time).
+    A failed import leaves neither the folder nor any of its pages behind.
+    """
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
+    pdf_path = None
     try:
-        contents = await file.read()
-        images = convert_from_bytes(contents, fmt='jpeg')
+        pdf_path = await _spool_upload(file, ".pdf")
         
         pdf_folder_id = f"folder-{uuid.uuid4().hex[:8]}"
         pdf_name = file.filename.replace(".pdf", "")
@@ -38,38 +140,15 @@ async def upload_pdf(file: UploadFile = File(...), parent_id: str = Form(...), d
             "createdAt": datetime.now().isoformat()
         })
         
-        base_url = "http://127.0.0.1:8000/library"
-        new_pages_urls = []
-        
-        for i, image in enumerate(images):
-            unique_id = uuid.uuid4().hex[:8]
-            filename = f"page_{i + 1}_{unique_id}.jpg"
-            save_path = os.path.join(LIBRARY_DIR, filename)
-            image.save(save_path, "JPEG")
-            
-            full_url = f"{base_url}/{filename}"
-            
-            # Create File (Explicit Commit)
-            from app.models_db import FileSystemEntry
-            new_file = FileSystemEntry(
-                id=f"file-{unique_id}",
-                name=f"Page {i+1}",
-                type="file",
-                parent_id=pdf_folder_id,
-                url=full_url,
-                created_at=datetime.now().isoformat(),
-                order=i
-            )
-            db.add(new_file)
-            db.commit()
-            db.refresh(new_file)
-
-            new_pages_urls.append({"id": new_file.id, "url": full_url, "name": new_file.name})
-            
-        return {"status": "success", "page_count": len(images), "pages": new_pages_urls}
+        return await pdf_ingest_service.run(
+            _ingest_pdf_pages, pdf_path, pdf_folder_id,
+            comic_id=pdf_folder_id, background=background
+        )
         
     except Exception as e:
         logger.error(f"Error processing PDF: {e}")
+        if pdf_path and os.path.exists(pdf_path):
+            os.remove(pdf_path)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/upload_page")
@@ -112,8 +191,14 @@ async def upload_page(file: UploadFile = File(...), parent_id: str = Form(...),
         db.refresh(new_entry)
         
         logger.info(f"✅ Created File Entry in DB (Explicit v4): {entry_id} ({file.filename})")
+
+        thumbnails_job_id = thumbnail_service.schedule_pregeneration([file_path], comic_id=parent_id)
+        tiles_job_id = tile_service.schedule_pyramids([(entry_id, file_path)], comic_id=parent_id)
         
-        return {"status": "success", "url": full_url, "filename": filename, "id": entry_id}
+        return {
+            "status": "success", "url": full_url, "filename": filename, "id": entry_id,
+            "tiles_job_id": tiles_job_id, "thumbnails_job_id": thumbnails_job_id
+        }
         
     except Exception as e:
         logger.error(f"Error saving image: {e}")
@@ -126,31 +211,47 @@ async def upload_image(file: UploadFile = File(...), db: Session = Depends(get_d
     return await upload_page(file, parent_id="root", db=db) 
 
 @router.get("/thumbnail")
-async def get_thumbnail(url: str, width: int = 300):
+def get_thumbnail(request: Request, url: str, width: int = 300):
     # Thumbnail logic relies on file existence, no DB needed
+    # Content-hash ETag (If-None-Match -> 304); immutable when requested as a versioned URL (&v=...)
+    # Encoded as AVIF/WebP/JPEG depending on the Accept header; each format is cached separately
     try:
+        fmt = image_format.negotiate(request.headers.get("accept"))
         original_path = resolve_local_path(url)
         if not os.path.exists(original_path):
              raise HTTPException(status_code=404, detail="Image not found")
 
-        thumbs_dir = os.path.join(TEMP_DIR, "thumbs")
-        os.makedirs(thumbs_dir, exist_ok=True)
-        
-        filename = os.path.basename(original_path)
-        thumb_filename = f"{width}_{filename}"
-        thumb_path = os.path.join(thumbs_dir, thumb_filename)
-
-        if os.path.exists(thumb_path):
-            return FileResponse(thumb_path)
+        thumb_path = thumbnail_service.get_thumbnail(original_path, width, fmt)
+        return cached_file_response(request, thumb_path, image_format.media_type(fmt), negotiated=True)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Thumbnail Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        with Image.open(original_path) as img:
-            img = img.convert("RGB")
-            aspect_ratio = img.height / img.width
-            new_height = int(width * aspect_ratio)
-            img.thumbnail((width, new_height))
-            img.save(thumb_path, "JPEG", quality=85)
+@router.post("/thumbnails/batch")
+def get_thumbnails_batch(request: Request, body: ThumbnailBatchRequest):
+    """
+    Many thumbnails in one response (e.g. a library grid), as data URIs keyed by the requested URL.
+    URLs whose image is missing are listed under "missing".
+    """
+    if len(body.urls) > MAX_THUMBNAIL_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_THUMBNAIL_BATCH} thumbnails per batch")
+    try:
+        fmt = image_format.negotiate(request.headers.get("accept"))
+        paths = {url: resolve_local_path(url) for url in body.urls}
+        thumbnails, missing_paths = thumbnail_service.get_batch(list(set(paths.values())), body.width, fmt)
 
-        return FileResponse(thumb_path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+        prefix = f"data:{image_format.media_type(fmt)};base64,"
+        return {
+            "format": fmt,
+            "width": body.width,
+            "thumbnails": {
+                url: prefix + base64.b64encode(thumbnails[path]).decode("ascii")
+                for url, path in paths.items() if path in thumbnails
+            },
+            "missing": [url for url, path in paths.items() if path in missing_paths]
+        }
     except Exception as e:
-        logger.error(f"Thumbnail Error: {e}")
+        logger.error(f"Thumbnail Batch Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
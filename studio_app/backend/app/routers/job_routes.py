@@ -1,7 +1,15 @@
+import json
 import time
 import asyncio
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from app.services.job_manager import job_manager, JobState
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.services.job_manager import job_manager, JobState, JobCancelled, FINISHED_STATES
+from app.services.job_scheduler import job_scheduler, JobPriority
+from app.services.job_events import job_events
+
+STREAM_KEEPALIVE_SECONDS = 15
 
 router = APIRouter(prefix="/jobs", tags=["Jobs"])
 
@@ -11,20 +19,80 @@ def _run_test_job(job_id: str):
     """
     try:
         job_manager.update_job(job_id, JobState.PROCESSING)
-        time.sleep(5)  # Simulate blocking work? Or asyncio.sleep?
-        # Since FastAPI runs in a threadpool for def functions, time.sleep is okay-ish for simulation,
-        # but for real async work we might want async def and await.
-        # However, BackgroundTasks runs standard functions in a threadpool.
+        # Simulate 5s of blocking work in steps, reporting progress (and honouring cancellation)
+        for step in range(10):
+            time.sleep(0.5)
+            job_manager.update_progress(job_id, (step + 1) * 10)
         job_manager.update_job(job_id, JobState.COMPLETED, result={"message": "Task finished successfully"})
+    except JobCancelled:
+        raise
     except Exception as e:
         job_manager.update_job(job_id, JobState.FAILED, error=str(e))
 
 @router.post("/test")
-def create_test_job(background_tasks: BackgroundTasks):
+def create_test_job(priority: JobPriority = JobPriority.BATCH):
     job_id = job_manager.create_job("TEST_TASK")
-    background_tasks.add_task(_run_test_job, job_id)
+    job_scheduler.submit(job_id, _run_test_job, priority=priority)
     return {"job_id": job_id, "status": "PENDING"}
 
+@router.get("/queues")
+def get_queue_stats():
+    """Queued job counts and worker threads per scheduler queue."""
+    return job_scheduler.stats()
+
+@router.get("/stream")
+async def stream_jobs(
+    request: Request,
+    ids: List[str] = Query(default=[]),
+    comic_id: Optional[str] = None
+):
+    """
+    Server-Sent Events stream of job changes (replaces polling GET /jobs/{job_id}).
+    Subscribe to several jobs (?ids=a&ids=b), to every job of a comic (?comic_id=...),
+    or to all jobs (no filter). Starts with a "snapshot" event per matching job,
+    then pushes "created" / "updated" / "progress" / "cancelled" events.
+    """
+    sub = job_events.subscribe(set(ids), comic_id)
+
+    def take_snapshot():
+        if ids:
+            return [job for job in (job_manager.get_job(i) for i in ids) if job]
+        _, jobs = job_manager.list_jobs(comic_id=comic_id, limit=500)
+        return [job for job in jobs if job.status not in FINISHED_STATES]
+
+    # Snapshot after subscribing, so no transition can fall between the two.
+    # Off the event loop: with JOB_PERSIST it is a (blocking) SQLite query
+    try:
+        snapshot = await run_in_threadpool(take_snapshot)
+    except BaseException:
+        job_events.unsubscribe(sub)
+        raise
+
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def stream():
+        try:
+            for job in snapshot:
+                yield sse("snapshot", job.model_dump(mode="json"))
+            while True:
+                try:
+                    payload = await asyncio.wait_for(sub.queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse(payload["event"], payload["job"])
+        finally:
+            job_events.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/{job_id}")
 def get_job_status(job_id: str):
     job = job_manager.get_job(job_id)
@@ -32,10 +100,35 @@ def get_job_status(job_id: str):
         raise HTTPException(status_code=404, detail="Job not found")
     return job
 
+@router.delete("/{job_id}")
+def cancel_job(job_id: str):
+    """
+    Cancels a queued or running job.
+    Queued jobs never start; running jobs stop at their next progress checkpoint.
+    """
+    job = job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail=f"Job already finished ({job.status.value})")
+    return job_manager.cancel_job(job_id)
+
 @router.get("")
-def list_jobs():
+def list_jobs(
+    response: Response,
+    status: Optional[JobState] = None,
+    type: Optional[str] = None,
+    comic_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0)
+):
     """
-    Returns all jobs.
-    TODO: Filter by status/user in future.
+    Returns jobs (newest first), optionally filtered by status, type and comic.
+    Without limit every matching job is returned (from offset on).
+    Total matching count is returned in the X-Total-Count header.
     """
-    return list(job_manager.list_jobs().values())
+    total, jobs = job_manager.list_jobs(
+        status=status, job_type=type, comic_id=comic_id, limit=limit, offset=offset
+    )
+    response.headers["X-Total-Count"] = str(total)
+    return jobs
@@ -34,6 +34,38 @@ def run_cleanup(db: Session = Depends(get_db)):
 class ExtractPDFRequest(BaseModel):
     pdf_path: str  # Absolute path to PDF file
     output_dir: str  # Directory to save extracted pages (usually next to PDF)
+    background: bool = False  # Return a PDF_INGEST job id right away instead of waiting
+
+def _extract_pdf(job_id: str, pdf_path: str, origin_dir: str) -> dict:
+    """PDF_INGEST job body: pages are written to .origin/ one at a time as they are rasterized."""
+    from app.services.pdf_ingest_service import pdf_ingest_service
+    from app.config import LOCAL_PROJECT_FOLDERS
+
+    origin_folder = LOCAL_PROJECT_FOLDERS["origin"]
+    extracted_pages = []
+
+    def on_page(page_num: int, save_path: str):
+        filename = os.path.basename(save_path)
+        extracted_pages.append({
+            "page": page_num,
+            "path": save_path,
+            "filename": filename,
+            "relativePath": f"{origin_folder}/{filename}"  # For project.irproject
+        })
+        logger.info(f"  ✅ Saved page {page_num}: {filename}")
+
+    pdf_ingest_service.extract_pages(
+        pdf_path, lambda page_num: os.path.join(origin_dir, f"page_{page_num:03d}.jpg"), on_page,
+        dpi=150, job_id=job_id
+    )
+    logger.info(f"📄 Extraction complete: {len(extracted_pages)} pages")
+
+    return {
+        "status": "success",
+        "page_count": len(extracted_pages),
+        "origin_dir": origin_dir,  # Renamed from assets_dir
+        "pages": extracted_pages
+    }
 
 @router.post("/extract_pdf_pages")
 async def extract_pdf_pages(request: ExtractPDFRequest):
@@ -41,9 +73,9 @@ async def extract_pdf_pages(request: ExtractPDFRequest):
     Extracts pages from a local PDF file and saves them as JPEG images.
     Used for opening local PDF comics in the Workstation.
     Saves to .origin/ folder (hidden from user).
+    Runs as a PDF_INGEST job (progress per page); with background=true only the job id is returned.
     """
-    from pdf2image import convert_from_path
-    from app.services.local_storage_service import local_storage_service
+    from app.services.pdf_ingest_service import pdf_ingest_service
     from app.config import LOCAL_PROJECT_FOLDERS
     
     pdf_path = request.pdf_path
@@ -61,33 +93,7 @@ async def extract_pdf_pages(request: ExtractPDFRequest):
     os.makedirs(origin_dir, exist_ok=True)
     
     try:
-        # Extract pages from PDF
-        images = convert_from_path(pdf_path, fmt='jpeg', dpi=150)
-        
-        extracted_pages = []
-        for i, image in enumerate(images):
-            page_num = i + 1
-            filename = f"page_{page_num:03d}.jpg"
-            save_path = os.path.join(origin_dir, filename)
-            
-            # Save the image
-            image.save(save_path, "JPEG", quality=90)
-            extracted_pages.append({
-                "page": page_num,
-                "path": save_path,
-                "filename": filename,
-                "relativePath": f"{origin_folder}/{filename}"  # For project.irproject
-            })
-            logger.info(f"  ✅ Saved page {page_num}: {filename}")
-        
-        logger.info(f"📄 Extraction complete: {len(extracted_pages)} pages")
-        
-        return {
-            "status": "success",
-            "page_count": len(extracted_pages),
-            "origin_dir": origin_dir,  # Renamed from assets_dir
-            "pages": extracted_pages
-        }
+        return await pdf_ingest_service.run(_extract_pdf, pdf_path, origin_dir, background=request.background)
         
     except Exception as e:
         logger.error(f"❌ PDF extraction failed: {e}")
@@ -99,20 +105,131 @@ class ImportComicRequest(BaseModel):
     source_path: str   # Absolute path to PDF/CBR/images
     project_path: str  # Absolute path to the project folder
     comic_name: str | None = None  # Optional custom name (defaults to filename)
+    background: bool = False  # Return a PDF_INGEST job id right away instead of waiting
+
+IMPORT_EXTENSIONS = ['.pdf', '.jpg', '.jpeg', '.png', '.webp']
+
+def _import_comic(job_id: str, source_path: str, paths: dict, comic_name: str, comic_id: str) -> dict:
+    """
+    PDF_INGEST job body of import_comic: extracts pages into .origin/ and writes comic.json.
+    comic.json is rewritten after every rasterizer window (PDF_CHUNK_PAGES pages), so an import that
+    crashes or is cancelled midway still describes the pages already in .origin/ ("importComplete": false).
+    """
+    from app.services.pdf_ingest_service import pdf_ingest_service
+    from app.services.tile_service import tile_service
+    from app.services.thumbnail_service import thumbnail_service
+    from app.config import LOCAL_PROJECT_FOLDERS, PDF_CHUNK_PAGES
+    import json
+    from datetime import datetime
+
+    comic_folder = paths["comic_folder"]
+    origin_dir = paths["origin_folder"]
+    
+    # Get the sanitized folder name
+    comic_folder_name = os.path.basename(comic_folder)
+    
+    # Determine file type and extract
+    file_ext = os.path.splitext(source_path)[1].lower()
+    extracted_pages = []
+    tile_sources = []  # (tile key, path) of each extracted page, for the Deep Zoom pyramid
+
+    # comic.json metadata, written before the first page and updated as pages land
+    comic_metadata = {
+        "id": comic_id,
+        "name": comic_name,
+        "folderName": comic_folder_name,
+        "sourceFile": os.path.basename(source_path),
+        "createdAt": datetime.now().isoformat(),
+        "pageCount": 0,
+        "importComplete": False,
+        "pages": extracted_pages
+    }
+    comic_json_path = os.path.join(comic_folder, "comic.json")
+
+    def write_metadata(complete: bool = False):
+        comic_metadata.update(pageCount=len(extracted_pages), importComplete=complete)
+        temp_path = comic_json_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(comic_metadata, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, comic_json_path)
+
+    write_metadata()
+    
+    if file_ext == '.pdf':
+        # Extract PDF pages, each one saved as soon as it is rasterized
+        def on_page(page_num: int, save_path: str):
+            filename = os.path.basename(save_path)
+            tile_sources.append((tile_service.local_key(save_path), save_path))
+            extracted_pages.append({
+                "id": f"page_{page_num:03d}",
+                "order": page_num - 1,
+                "filename": filename,
+                "originPath": f"{LOCAL_PROJECT_FOLDERS['origin']}/{filename}",
+                "balloons": [],
+                "panels": []
+            })
+            logger.info(f"  ✅ Page {page_num}: {filename}")
+            if len(extracted_pages) % PDF_CHUNK_PAGES == 0:
+                write_metadata()  # End of a rasterizer window
+
+        try:
+            pdf_ingest_service.extract_pages(
+                source_path, lambda page_num: os.path.join(origin_dir, f"page_{page_num:03d}.jpg"), on_page,
+                dpi=150, job_id=job_id
+            )
+        except BaseException:
+            write_metadata()  # Failed or cancelled: record the pages that did land
+            raise
+    
+    else:
+        # Single image import
+        import shutil
+        filename = os.path.basename(source_path)
+        dest_path = os.path.join(origin_dir, filename)
+        shutil.copy2(source_path, dest_path)
+        tile_sources.append((tile_service.local_key(dest_path), dest_path))
+        
+        extracted_pages.append({
+            "id": os.path.splitext(filename)[0],
+            "order": 0,
+            "filename": filename,
+            "originPath": f"{LOCAL_PROJECT_FOLDERS['origin']}/{filename}",
+            "balloons": [],
+            "panels": []
+        })
+        logger.info(f"  ✅ Copied image: {filename}")
+    
+    write_metadata(complete=True)
+    logger.info(f"📝 Created comic.json: {comic_json_path}")
+    logger.info(f"📚 Import complete: {len(extracted_pages)} pages")
+
+    # Local pages are tiled via /tiles/local (keyed by path hash)
+    thumbnails_job_id = thumbnail_service.schedule_pregeneration([path for _, path in tile_sources], comic_id=comic_id)
+    tiles_job_id = tile_service.schedule_pyramids(tile_sources, comic_id=comic_id)
+    
+    return {
+        "status": "success",
+        "comic_id": comic_id,
+        "tiles_job_id": tiles_job_id,
+        "thumbnails_job_id": thumbnails_job_id,
+        "comic_name": comic_name,
+        "comic_folder": comic_folder_name,
+        "page_count": len(extracted_pages),
+        "paths": paths,
+        "pages": extracted_pages
+    }
 
 @router.post("/import_comic")
 async def import_comic(request: ImportComicRequest):
     """
     Import a comic (PDF/CBR) into a project with proper folder structure.
     Creates: {project}/{comic_name}/.origin/, .cleaned/, .exports/
-    Extracts pages into .origin/ and creates comic.json metadata.
+    Extracts pages into .origin/ and creates comic.json metadata (updated as pages are extracted).
+    Runs as a PDF_INGEST job for the new comic_id; with background=true only the job id is returned.
     """
-    from pdf2image import convert_from_path
+    from app.services.pdf_ingest_service import pdf_ingest_service
     from app.services.local_storage_service import LocalStorageService
-    from app.config import LOCAL_PROJECT_FOLDERS
-    import json
     import uuid
-    from datetime import datetime
     
     source_path = request.source_path
     project_path = request.project_path
@@ -132,87 +249,19 @@ async def import_comic(request: ImportComicRequest):
     if not os.path.exists(project_path):
         raise HTTPException(status_code=404, detail=f"Project folder not found: {project_path}")
     
+    file_ext = os.path.splitext(source_path)[1].lower()
+    if file_ext not in IMPORT_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_ext}")
+    
     try:
-        # 1. Create comic folder structure
+        # Create comic folder structure
         paths = LocalStorageService.create_comic_structure(project_path, comic_name)
-        comic_folder = paths["comic_folder"]
-        origin_dir = paths["origin_folder"]
-        
-        # Get the sanitized folder name
-        comic_folder_name = os.path.basename(comic_folder)
-        
-        # 2. Determine file type and extract
-        file_ext = os.path.splitext(source_path)[1].lower()
-        extracted_pages = []
-        
-        if file_ext == '.pdf':
-            # Extract PDF pages
-            images = convert_from_path(source_path, fmt='jpeg', dpi=150)
-            
-            for i, image in enumerate(images):
-                page_num = i + 1
-                filename = f"page_{page_num:03d}.jpg"
-                save_path = os.path.join(origin_dir, filename)
-                
-                image.save(save_path, "JPEG", quality=90)
-                extracted_pages.append({
-                    "id": f"page_{page_num:03d}",
-                    "order": i,
-                    "filename": filename,
-                    "originPath": f"{LOCAL_PROJECT_FOLDERS['origin']}/{filename}",
-                    "balloons": [],
-                    "panels": []
-                })
-                logger.info(f"  ✅ Page {page_num}: {filename}")
-        
-        elif file_ext in ['.jpg', '.jpeg', '.png', '.webp']:
-            # Single image import
-            import shutil
-            filename = os.path.basename(source_path)
-            dest_path = os.path.join(origin_dir, filename)
-            shutil.copy2(source_path, dest_path)
-            
-            extracted_pages.append({
-                "id": os.path.splitext(filename)[0],
-                "order": 0,
-                "filename": filename,
-                "originPath": f"{LOCAL_PROJECT_FOLDERS['origin']}/{filename}",
-                "balloons": [],
-                "panels": []
-            })
-            logger.info(f"  ✅ Copied image: {filename}")
-        
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_ext}")
-        
-        # 3. Create comic.json metadata
         comic_id = str(uuid.uuid4())
-        comic_metadata = {
-            "id": comic_id,
-            "name": comic_name,
-            "folderName": comic_folder_name,
-            "sourceFile": os.path.basename(source_path),
-            "createdAt": datetime.now().isoformat(),
-            "pageCount": len(extracted_pages),
-            "pages": extracted_pages
-        }
-        
-        comic_json_path = os.path.join(comic_folder, "comic.json")
-        with open(comic_json_path, "w", encoding="utf-8") as f:
-            json.dump(comic_metadata, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"📝 Created comic.json: {comic_json_path}")
-        logger.info(f"📚 Import complete: {len(extracted_pages)} pages")
         
-        return {
-            "status": "success",
-            "comic_id": comic_id,
-            "comic_name": comic_name,
-            "comic_folder": comic_folder_name,
-            "page_count": len(extracted_pages),
-            "paths": paths,
-            "pages": extracted_pages
-        }
+        return await pdf_ingest_service.run(
+            _import_comic, source_path, paths, comic_name, comic_id,
+            comic_id=comic_id, background=request.background
+        )
         
     except HTTPException:
         raise
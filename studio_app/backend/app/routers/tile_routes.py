@@ -1,8 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.services.tile_service import tile_service
+from app.services.layer_cache import layer_cache
+from app.services.tile_pack import tile_pack_store
+from app.services.http_cache import cached_file_response, cached_bytes_response
+from app.services import image_format
 import os
 
 router = APIRouter(tags=["Deep Zoom Tiles"])
@@ -11,8 +14,39 @@ router = APIRouter(tags=["Deep Zoom Tiles"])
 # IMPORTANT: Specific routes must come BEFORE generic routes!
 # Otherwise FastAPI will match "local" as an image_id
 
+# Tiles carry content-hash ETags (If-None-Match -> 304). Requests with ?v=<manifest version>
+# are versioned URLs and are cached as immutable; without it clients revalidate.
+# The encoding (AVIF/WebP/JPEG) is negotiated from the Accept header.
+
+@router.get("/tiles/metrics")
+def get_tile_metrics():
+    """
+    Decoded-layer cache usage (entries, bytes, hits/misses, evictions),
+    pack store hits and source-path resolution cache hits.
+    """
+    return {
+        "layer_cache": layer_cache.stats(),
+        "tile_pack": tile_pack_store.stats(),
+        "source_cache": tile_service.source_cache_stats()
+    }
+
+@router.get("/tiles/local/manifest")
+def get_local_manifest(path: str = Query(..., description="Absolute path to local image file")):
+    """
+    Pyramid manifest (levels, dimensions, tile grid) for a LOCAL file.
+    """
+    if not path.startswith('/'):
+        raise HTTPException(status_code=400, detail="Path must be absolute")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"File not found: {path}")
+
+    manifest = tile_service.get_manifest(tile_service.local_key(path), path)
+    if not manifest:
+        raise HTTPException(status_code=404, detail="Manifest could not be generated")
+    return manifest
+
 @router.get("/tiles/local/{zoom}/{x}/{y}")
-def get_local_tile(zoom: int, x: int, y: int, path: str = Query(..., description="Absolute path to local image file")):
+def get_local_tile(request: Request, zoom: int, x: int, y: int, path: str = Query(..., description="Absolute path to local image file")):
     """
     Serves a tile for a LOCAL file (not in database).
     Used for imported PDFs/images that haven't been uploaded to cloud.
@@ -23,25 +57,62 @@ def get_local_tile(zoom: int, x: int, y: int, path: str = Query(..., description
     
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail=f"File not found: {path}")
+
+    key = tile_service.local_key(path)
+    fmt = image_format.negotiate(request.headers.get("accept"))
+    packed = tile_service.get_packed_tile(key, zoom, x, y, fmt)
+    if packed is not None:
+        return cached_bytes_response(request, packed, image_format.media_type(fmt), negotiated=True)
     
-    tile_path = tile_service.get_tile_for_local_path(path, zoom, x, y)
+    tile_path = tile_service.get_tile_for_local_path(path, zoom, x, y, key=key, fmt=fmt)
     
     if not tile_path:
         raise HTTPException(status_code=404, detail="Tile could not be generated")
         
-    return FileResponse(tile_path, media_type="image/jpeg")
+    return cached_file_response(request, tile_path, image_format.media_type(fmt), negotiated=True)
+
+
+@router.get("/tiles/{image_id}/manifest")
+def get_manifest(image_id: str, db: Session = Depends(get_db)):
+    """
+    Pyramid manifest: tile size, per-level dimensions and cols/rows,
+    so the viewer knows the grid without probing tiles.
+    """
+    manifest = tile_service.get_manifest_for_id(image_id, db)
+    if not manifest:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return manifest
+
+
+@router.post("/tiles/{image_id}/pyramid")
+def build_pyramid(image_id: str, db: Session = Depends(get_db)):
+    """
+    Queues a background job that pre-generates every tile of every level
+    (e.g. for pages uploaded before pre-generation was enabled).
+    """
+    source_path = tile_service._find_source_image(image_id, db)
+    if not source_path:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    job_id = tile_service.schedule_pyramids([(image_id, source_path)], force=True)
+    return {"job_id": job_id, "status": "PENDING"}
 
 
 @router.get("/tiles/{image_id}/{zoom}/{x}/{y}")
-def get_tile(image_id: str, zoom: int, x: int, y: int, db: Session = Depends(get_db)):
+def get_tile(request: Request, image_id: str, zoom: int, x: int, y: int, db: Session = Depends(get_db)):
     """
     Serves a specific tile for deep zoom.
     Generates it on-demand if missing.
     """
-    tile_path = tile_service.get_tile_path(image_id, zoom, x, y, db)
+    fmt = image_format.negotiate(request.headers.get("accept"))
+    packed = tile_service.get_packed_tile(image_id, zoom, x, y, fmt)
+    if packed is not None:
+        return cached_bytes_response(request, packed, image_format.media_type(fmt), negotiated=True)
+
+    tile_path = tile_service.get_tile_path(image_id, zoom, x, y, db, fmt=fmt)
     
     if not tile_path:
         raise HTTPException(status_code=404, detail="Tile not found or could not be generated")
         
-    return FileResponse(tile_path, media_type="image/jpeg")
+    return cached_file_response(request, tile_path, image_format.media_type(fmt), negotiated=True)
 
@@ -41,7 +41,7 @@ def init_genai_client():
         client = None
 
 # --- YOLO SERVICE ---
-from .balloon_service import execute_yolo
+from .balloon_service import execute_yolo, iter_yolo_batch
 
 
 
@@ -163,23 +163,49 @@ def perform_ocr(image_path_or_url: str, balloons: List[dict]):
     return execute_ocr_logic(image_path_or_url, balloons, client, MODEL_ID)
 
 # --- ASYNC JOB WRAPPERS ---
-from app.services.job_manager import job_manager, JobState
+from concurrent.futures import TimeoutError as FuturesTimeout
+from app.services.job_manager import job_manager, JobState, JobCancelled
+from app.services.worker_pool import worker_pool
 
-def process_detection_job(job_id: str, image_path: str):
+# How often a job waiting on a worker pool checks for cancellation
+JOB_CANCEL_POLL_SECONDS = 0.25
+
+def _await_stage(job_id: str, future):
+    """
+    Waits for a worker pool task, checking for cancellation meanwhile.
+    A cancelled job stops waiting at once (the task is dropped if it has not started yet).
+    """
+    while True:
+        try:
+            return future.result(timeout=JOB_CANCEL_POLL_SECONDS)
+        except FuturesTimeout:
+            try:
+                job_manager.check_cancelled(job_id)
+            except JobCancelled:
+                future.cancel()
+                raise
+
+def process_detection_job(job_id: str, image_path: str, debug: bool = False, simplify: str = "dp", tolerance: float = 0.003):
     """
     Wrapper to run YOLO in background and update job state.
     """
     try:
         job_manager.update_job(job_id, JobState.PROCESSING)
+        job_manager.update_progress(job_id, 0)  # Checkpoint: cancelled while queued
         
-        # Run Synchronous Logic
-        result = execute_yolo(image_path)
+        # Run on the YOLO worker pool (blocks this background thread only)
+        result = _await_stage(job_id, worker_pool.submit(
+            "yolo", execute_yolo, image_path, debug=debug, simplify=simplify, tolerance=tolerance
+        ))
+        job_manager.update_progress(job_id, 90)  # Checkpoint: cancelled during inference
         
         if result.get("status") == "success":
              job_manager.update_job(job_id, JobState.COMPLETED, result=result)
         else:
              job_manager.update_job(job_id, JobState.FAILED, error="YOLO execution returned failure status")
              
+    except JobCancelled:
+        raise
     except Exception as e:
         logger.error(f"❌ Async Detection Job Failed: {e}")
         job_manager.update_job(job_id, JobState.FAILED, error=str(e))
@@ -190,12 +216,16 @@ def process_ocr_job(job_id: str, image_path: str, balloons: List[dict]):
     """
     try:
         job_manager.update_job(job_id, JobState.PROCESSING)
+        job_manager.update_progress(job_id, 0)  # Checkpoint: cancelled while queued
         
-        # Run Synchronous Logic
-        updated_balloons = perform_ocr(image_path, balloons)
+        # Run on the image worker pool (blocks this background thread only)
+        updated_balloons = _await_stage(job_id, worker_pool.submit("image", perform_ocr, image_path, balloons))
+        job_manager.update_progress(job_id, 90)  # Checkpoint: cancelled during OCR
         
         job_manager.update_job(job_id, JobState.COMPLETED, result={"status": "success", "balloons": updated_balloons})
              
+    except JobCancelled:
+        raise
     except Exception as e:
         logger.error(f"❌ Async OCR Job Failed: {e}")
         job_manager.update_job(job_id, JobState.FAILED, error=str(e))
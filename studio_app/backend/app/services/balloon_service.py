@@ -1,39 +1,247 @@
+import gc
 import os
+import time
+import uuid
+import threading
 import numpy as np
-from ultralytics import YOLO
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+from PIL import Image
 from loguru import logger
-from app.config import TEMP_DIR
+from app.config import TEMP_DIR, YOLO_BATCH_SIZE, YOLO_DEBUG_OUTPUT, YOLO_WORKERS
 from app.utils import resolve_local_path
 
-# --- YOLO INITIALIZATION (Singleton) ---
+# --- YOLO INITIALIZATION (Lazy Singleton) ---
+# The model (and ultralytics/torch) is only imported on first use or by the
+# background warm-up started from the FastAPI lifespan, so importing this module
+# never blocks server start, reload or tests.
 yolo_model = None
-try:
-    logger.info("🏗️ Starting YOLO Model Load...")
+_model_lock = threading.Lock()
+# ultralytics predictors are not thread-safe: one predict at a time per process
+# (in "thread" worker mode the YOLO workers share this model)
+_predict_lock = threading.Lock()
+_model_state = {
+    "status": "not_loaded",  # not_loaded | loading | ready | failed
+    "model_path": None,
+    "load_ms": None,
+    "warmup_ms": None,
+    "error": None
+}
+
+def _resolve_model_path() -> str:
     # Go up from backend/app/services -> backend/app -> backend -> root, then down to models
     current_file_dir = os.path.dirname(os.path.abspath(__file__))
     model_path = os.path.join(current_file_dir, '../models/comic_speech_bubble_seg_v1.pt')
-    
+
     # Fallback to YOLOv8n-seg if specific model not found (dev safety)
     if not os.path.exists(model_path):
         logger.warning(f"⚠️ Custom model not found at {model_path}. Using standard yolov8n-seg.pt")
-        model_path = "yolov8n-seg.pt"
-    else:
-        logger.info(f"✅ Loaded Custom YOLO Model: {model_path}")
-        
-    yolo_model = YOLO(model_path)
-    logger.info("✅ YOLO Model Loaded Successfully in balloon_service")
-    
-except Exception as e:
-    logger.error(f"❌ Failed to load YOLO model: {e}")
-    yolo_model = None
-
-def execute_yolo(image_path_or_url: str):
+        return "yolov8n-seg.pt"
+    return model_path
+
+def load_model(warmup: bool = True):
+    """
+    Loads the YOLO model once (thread-safe) and optionally runs a warm-up
+    inference on a blank page so the first real request skips the cold path.
+    Returns the model, or raises if loading failed.
+    """
+    global yolo_model
+    if yolo_model is not None:
+        return yolo_model
+
+    with _model_lock:
+        if yolo_model is not None:
+            return yolo_model
+
+        _model_state.update(status="loading", error=None)
+        try:
+            logger.info("🏗️ Starting YOLO Model Load...")
+            start = time.perf_counter()
+            from ultralytics import YOLO
+
+            model_path = _resolve_model_path()
+            model = YOLO(model_path)
+            _model_state.update(model_path=model_path, load_ms=round((time.perf_counter() - start) * 1000))
+            logger.info(f"✅ YOLO Model Loaded in {_model_state['load_ms']}ms: {model_path}")
+
+            if warmup:
+                start = time.perf_counter()
+                dummy = np.zeros((YOLO_IMGSZ, YOLO_IMGSZ, 3), dtype=np.uint8)
+                model.predict(source=dummy, save=False, conf=YOLO_CONF, imgsz=YOLO_IMGSZ, verbose=False)
+                _model_state["warmup_ms"] = round((time.perf_counter() - start) * 1000)
+                logger.info(f"🔥 YOLO Warm-up inference done in {_model_state['warmup_ms']}ms")
+
+            yolo_model = model
+            _model_state["status"] = "ready"
+            return yolo_model
+
+        except Exception as e:
+            logger.error(f"❌ Failed to load YOLO model: {e}")
+            _model_state.update(status="failed", error=str(e))
+            raise Exception(f"YOLO Model not loaded: {e}")
+
+def warm_up_model():
+    """
+    Background warm-up entrypoint (lifespan). Failures are recorded in the model
+    state and retried lazily by the next detection request.
+    """
+    try:
+        load_model()
+    except Exception:
+        pass
+
+def get_model_status() -> dict:
+    """Snapshot of the model lifecycle for readiness checks."""
+    return dict(_model_state)
+
+try:
+    import cv2
+except ImportError:
+    logger.warning("⚠️ OpenCV (cv2) not found. YOLO polygons will not be simplified.")
+    cv2 = None
+
+# Inference settings shared by single-page and batch modes
+YOLO_CONF = 0.15
+YOLO_IMGSZ = 1920 # HIGH RESOLUTION (Balanced for Simplification)
+
+# --- POLYGON SIMPLIFICATION ---
+# "dp":   Douglas-Peucker (cv2.approxPolyDP), epsilon = tolerance * perimeter
+# "hull": Convex hull of the mask contour (fast, loses concave tails)
+# "none": Raw mask contour as returned by YOLO
+SIMPLIFIERS = ("dp", "hull", "none")
+DEFAULT_SIMPLIFIER = "dp"
+# Epsilon as a fraction of the perimeter:
+# - 0.001 (0.1%): Very faithful, keeps some noise.
+# - 0.003 (0.3%): "Comic Style" (Smoothed but organic).
+# - 0.010 (1.0%): Geometric/Low Poly.
+DEFAULT_SIMPLIFY_TOLERANCE = 0.003
+
+@contextmanager
+def _gc_paused():
+    """
+    Pauses the cyclic GC while point lists are built: every [x, y] pair is a tracked allocation,
+    and with torch loaded the collections they trigger cost more than the conversion itself.
+    The lists only hold numbers, so no garbage cycle is missed.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _simplify_polygons(raw_polys: List[np.ndarray], method: str, tolerance: float) -> List[list]:
+    """
+    Simplifies a batch of mask contours (each an (N, 2) float array).
+    All contours are converted to int32 in one go and the output lists are built in one pass;
+    only the cv2 simplifier runs per contour (it has no batched form).
+    Falls back to the raw contour when simplification is unavailable or degenerates.
+    """
+    if method not in SIMPLIFIERS:
+        raise ValueError(f"Unknown simplifier: {method}")
+    if tolerance < 0:
+        raise ValueError(f"Simplify tolerance must be >= 0, got {tolerance}")
+    if not raw_polys:
+        return []
+
+    if method == "none" or cv2 is None:
+        with _gc_paused():
+            return [poly.tolist() for poly in raw_polys]
+
+    # One conversion for every contour, split back into (N, 1, 2) views for cv2
+    offsets = np.cumsum([len(poly) for poly in raw_polys])[:-1]
+    contours = np.split(np.concatenate(raw_polys).astype(np.int32).reshape(-1, 1, 2), offsets)
+
+    simplified = []
+    for poly, contour in zip(raw_polys, contours):
+        try:
+            if method == "hull":
+                approx = cv2.convexHull(contour)
+            else:
+                approx = cv2.approxPolyDP(contour, tolerance * cv2.arcLength(contour, True), True)
+        except Exception as e:
+            logger.error(f"⚠️ Polygon Simplification Failed: {e}")
+            approx = None
+
+        # Fallback if simplification destroyed the shape
+        simplified.append(approx.reshape(-1, 2) if approx is not None and len(approx) > 2 else poly)
+
+    with _gc_paused():
+        return [points.tolist() for points in simplified]
+
+def _result_to_balloons(result, simplify: str = DEFAULT_SIMPLIFIER, tolerance: float = DEFAULT_SIMPLIFY_TOLERANCE) -> List[dict]:
+    """
+    Converts a single ultralytics Result (already on CPU) into balloon dicts.
+    Boxes and confidences are pulled out as arrays in one go and filtered vectorially;
+    only the contour simplification itself runs per polygon.
+    """
+    if not result.boxes:
+        return []
+
+    xyxy = np.asarray(result.boxes.xyxy).astype(np.int32)
+    confs = np.asarray(result.boxes.conf).reshape(-1)
+
+    keep = np.flatnonzero(confs >= YOLO_CONF)
+    if keep.size == 0:
+        return []
+
+    kept_xyxy = xyxy[keep]
+    # [x1, y1, x2, y2] -> [x, y, w, h]
+    boxes = np.concatenate([kept_xyxy[:, :2], kept_xyxy[:, 2:] - kept_xyxy[:, :2]], axis=1).tolist()
+    # Default Polygon (Box)
+    polygons = [[[x1, y1], [x2, y1], [x2, y2], [x1, y2]] for x1, y1, x2, y2 in kept_xyxy.tolist()]
+
+    # Mask Polygons with SMART SIMPLIFICATION (batched)
+    mask_xy = getattr(result.masks, "xy", None) if result.masks is not None else None
+    if mask_xy is not None:
+        with_mask = [k for k, i in enumerate(keep) if i < len(mask_xy) and len(mask_xy[i]) > 0]
+        simplified = _simplify_polygons([mask_xy[keep[k]] for k in with_mask], simplify, tolerance)
+        for k, polygon in zip(with_mask, simplified):
+            polygons[k] = polygon
+
+    # Python floats before rounding: float32 rounding gives 0.8700000047683716, not 0.87
+    conf_list = [round(c, 2) for c in confs[keep].tolist()]
+    return [
+        {"id": int(i), "conf": conf, "box": box, "polygon": polygon}
+        for i, conf, box, polygon in zip(keep, conf_list, boxes, polygons)
+    ]
+
+def _save_debug_image(result, local_path: str) -> str:
+    """
+    Renders the annotated detection image and writes it to TEMP_DIR/inference.
+    Each call gets its own file so concurrent requests never overwrite each other.
+    Returns the saved filename.
+    """
+    debug_dir = os.path.join(TEMP_DIR, "inference")
+    os.makedirs(debug_dir, exist_ok=True)
+
+    stem = os.path.splitext(os.path.basename(local_path))[0]
+    debug_name = f"{stem}_{uuid.uuid4().hex[:8]}.jpg"
+
+    # plot() returns a BGR array; flip channels for PIL
+    annotated = result.plot()
+    Image.fromarray(annotated[..., ::-1]).save(os.path.join(debug_dir, debug_name), "JPEG", quality=85)
+    return debug_name
+
+def execute_yolo(
+    image_path_or_url: str,
+    debug: bool = False,
+    simplify: str = DEFAULT_SIMPLIFIER,
+    tolerance: float = DEFAULT_SIMPLIFY_TOLERANCE
+):
     """
     Executes YOLO directly using ultralytics library.
     Replaces legacy run_yolo.py script.
+
+    Production mode (default) only returns polygons/boxes and never touches disk.
+    With debug=True (or YOLO_DEBUG_OUTPUT) the annotated image is written to TEMP_DIR/inference.
     """
-    if not yolo_model:
-        raise Exception("YOLO Model not loaded")
+    # Lazy: loads (and warms) the model on first use if the lifespan warm-up hasn't finished
+    model = load_model()
+
+    debug = debug or YOLO_DEBUG_OUTPUT
 
     # 1. Resolve Path
     local_path = resolve_local_path(image_path_or_url)
@@ -43,89 +251,153 @@ def execute_yolo(image_path_or_url: str):
     logger.info(f"🚀 Running YOLO (In-Memory) on: {local_path}")
 
     try:
-        # 2. Run Inference
-        # save=True matches legacy behavior to save debug images (can be disabled for speed)
-        results = yolo_model.predict(
-            source=local_path,
-            save=True,
-            conf=0.15,
-            imgsz=1920, # HIGH RESOLUTION (Balanced for Simplification)
-            project=os.path.join(TEMP_DIR, "inference"),
-            name="run",
-            exist_ok=True,
-            verbose=False
-        )
+        timings = {}
+
+        # 2. Decode (IO)
+        t0 = time.perf_counter()
+        with Image.open(local_path) as img:
+            image = img.convert("RGB")
+        timings["decode_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        # 3. Run Inference (no disk writes, annotated output stays in memory)
+        t0 = time.perf_counter()
+        with _predict_lock:
+            results = model.predict(
+                source=image,
+                save=False,
+                conf=YOLO_CONF,
+                imgsz=YOLO_IMGSZ,
+                verbose=False
+            )
+        timings["inference_ms"] = round((time.perf_counter() - t0) * 1000, 1)
 
         if not results:
-             return {"status": "success", "balloons": [], "count": 0}
+             return {"status": "success", "balloons": [], "count": 0, "timings": timings}
 
         result = results[0].cpu()
-        balloons = []
-        
-        # 3. Process Boxes
-        if result.boxes:
-            for i, box in enumerate(result.boxes):
-                conf = float(box.conf)
-                if conf < 0.15: continue
-
-                x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                w, h = x2 - x1, y2 - y1
-                
-                # Default Polygon (Box)
-                polygon = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
-                
-                # Try Mask for Polygon with SMART SIMPLIFICATION
-                if result.masks is not None:
-                     if hasattr(result.masks, 'xy') and len(result.masks.xy) > i:
-                        raw_poly = result.masks.xy[i]
-                        
-                        if len(raw_poly) > 0:
-                            # 1. Convert to integer numpy array for OpenCV
-                            try:
-                                import cv2
-                                # Reshape for cv2: (N, 1, 2)
-                                contour = raw_poly.astype(np.int32).reshape(-1, 1, 2)
-                                
-                                # 2. Calculate Perimeter (arcLength)
-                                peri = cv2.arcLength(contour, True)
-                                
-                                # 3. Apply Douglas-Peucker Simplification
-                                # Epsilon = 0.2% of perimeter.
-                                # - 0.001 (0.1%): Very faithful, keeps some noise.
-                                # - 0.003 (0.3%): "Comic Style" (Smoothed but organic).
-                                # - 0.010 (1.0%): Geometric/Low Poly.
-                                epsilon = 0.003 * peri
-                                approx = cv2.approxPolyDP(contour, epsilon, True)
-                                
-                                # 4. Convert back to list of [x, y]
-                                # Reshape back to (N, 2)
-                                if len(approx) > 2:
-                                    polygon = approx.reshape(-1, 2).tolist()
-                                else:
-                                    # Fallback if simplification destroyed the shape
-                                    polygon = raw_poly.tolist()
-                                    
-                            except ImportError:
-                                logger.warning("⚠️ OpenCV (cv2) not found. Using raw polygon.")
-                                polygon = raw_poly.tolist()
-                            except Exception as e:
-                                logger.error(f"⚠️ Polygon Simplification Failed: {e}")
-                                polygon = raw_poly.tolist()
-
-                balloons.append({
-                    "id": i,
-                    "conf": round(conf, 2),
-                    "box": [x1, y1, w, h],
-                    "polygon": polygon
-                })
-
-        return {
+
+        # 4. Process Boxes
+        t0 = time.perf_counter()
+        balloons = _result_to_balloons(result, simplify, tolerance)
+        timings["postprocess_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        response = {
             "status": "success",
             "balloons": balloons,
             "count": len(balloons),
-            "image_output": result.save_dir
+            "timings": timings
         }
 
+        # 5. Debug Output (opt-in)
+        if debug:
+            t0 = time.perf_counter()
+            response["image_output"] = f"/temp/inference/{_save_debug_image(result, local_path)}"
+            timings["debug_io_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        return response
+
     except Exception as e:
         logger.error(f"❌ YOLO Direct Execution Error: {e}")
         raise e
+
+# --- BATCH MODE ---
+
+def detect_yolo_batch(
+    image_paths_or_urls: List[str],
+    indexes: List[int],
+    simplify: str = DEFAULT_SIMPLIFIER,
+    tolerance: float = DEFAULT_SIMPLIFY_TOLERANCE
+) -> List[dict]:
+    """
+    Runs one mini-batch of pages through YOLO in a single predict call (on a YOLO worker).
+    Returns one result dict per page, tagged with its index from `indexes`.
+    Unreadable pages, or the whole batch if inference fails, come back with status "error".
+    """
+    # Lazy: loads (and warms) the model on first use if the worker warm-up hasn't finished
+    model = load_model()
+
+    images = []
+    for path in image_paths_or_urls:
+        try:
+            with Image.open(resolve_local_path(path)) as img:
+                images.append(img.convert("RGB"))
+        except Exception as e:
+            logger.warning(f"⚠️ Batch YOLO: Could not decode {path}: {e}")
+            images.append(None)
+
+    valid = [k for k, img in enumerate(images) if img is not None]
+    results_by_page = {}
+    if valid:
+        start = time.perf_counter()
+        try:
+            with _predict_lock:
+                results = model.predict(
+                    source=[images[k] for k in valid],
+                    save=False,
+                    conf=YOLO_CONF,
+                    imgsz=YOLO_IMGSZ,
+                    verbose=False
+                )
+            for k, result in zip(valid, results):
+                results_by_page[k] = result.cpu()
+        except Exception as e:
+            logger.error(f"❌ Batch YOLO inference failed on pages {indexes}: {e}")
+            return [
+                {"index": i, "image_path": path, "status": "error", "error": str(e)}
+                for i, path in zip(indexes, image_paths_or_urls)
+            ]
+        logger.info(f"   -> Batch YOLO: {len(valid)} pages in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    pages = []
+    for k, (i, path) in enumerate(zip(indexes, image_paths_or_urls)):
+        if k not in results_by_page:
+            pages.append({"index": i, "image_path": path, "status": "error", "error": f"Image not found or unreadable: {path}"})
+            continue
+        balloons = _result_to_balloons(results_by_page[k], simplify, tolerance)
+        pages.append({"index": i, "image_path": path, "status": "success", "balloons": balloons, "count": len(balloons)})
+    return pages
+
+def iter_yolo_batch(
+    image_paths_or_urls: List[str],
+    batch_size: Optional[int] = None,
+    simplify: str = DEFAULT_SIMPLIFIER,
+    tolerance: float = DEFAULT_SIMPLIFY_TOLERANCE
+) -> Iterator[dict]:
+    """
+    Runs YOLO over many pages, in mini-batches on the YOLO worker pool (bounded, one model per worker).
+    Up to YOLO_WORKERS batches are queued at once, so the next batch is decoded while the current one
+    is in inference. Yields one result dict per input page, in input order, as soon as its batch finishes.
+    The first batch is queued before this returns: raises WorkerPoolBusy if the stage is full.
+    """
+    from app.services.worker_pool import worker_pool, WorkerPoolBusy
+
+    batch_size = max(1, batch_size or YOLO_BATCH_SIZE)
+    chunks = [list(range(i, min(i + batch_size, len(image_paths_or_urls)))) for i in range(0, len(image_paths_or_urls), batch_size)]
+    if not chunks:
+        return iter(())
+
+    def submit(chunk):
+        return worker_pool.submit(
+            "yolo", detect_yolo_batch, [image_paths_or_urls[i] for i in chunk], chunk, simplify, tolerance
+        )
+
+    logger.info(f"🚀 Running Batch YOLO on {len(image_paths_or_urls)} pages (batch_size={batch_size})")
+    first = submit(chunks[0])
+
+    def results():
+        in_flight = deque([first])
+        next_chunk = 1
+        while in_flight or next_chunk < len(chunks):
+            while next_chunk < len(chunks) and len(in_flight) < YOLO_WORKERS:
+                try:
+                    in_flight.append(submit(chunks[next_chunk]))
+                    next_chunk += 1
+                except WorkerPoolBusy:
+                    # Stage full (other requests): retry after our oldest batch, or shortly if none is queued
+                    if in_flight:
+                        break
+                    time.sleep(0.1)
+            if in_flight:
+                yield from in_flight.popleft().result()
+
+    return results()
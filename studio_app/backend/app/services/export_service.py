@@ -10,7 +10,7 @@ from PIL import Image
 from app.config import TEMP_DIR
 from app.utils import resolve_local_path
 from app.models import ExportRequest
-from app.services.job_manager import job_manager, JobState
+from app.services.job_manager import job_manager, JobState, JobCancelled
 
 class ExportService:
     """
@@ -40,13 +40,13 @@ class ExportService:
             safe_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', entity_name)
 
             if format_type in ["clean_images", "raw_images"]:
-                result_path = self._create_zip_export(safe_name, file_list, format_type)
+                result_path = self._create_zip_export(job_id, safe_name, file_list, format_type)
             
             elif format_type == "json_data":
                 result_path = self._create_json_export(safe_name, request_data)
             
             elif format_type == "pdf":
-                result_path = self._create_pdf_export(safe_name, file_list)
+                result_path = self._create_pdf_export(job_id, safe_name, file_list)
             
             else:
                 raise ValueError(f"Unknown format: {format_type}")
@@ -62,19 +62,22 @@ class ExportService:
             })
             logger.info(f"✅ Export Job {job_id} Completed!")
 
+        except JobCancelled:
+            logger.info(f"🛑 Export Job {job_id} Cancelled")
         except Exception as e:
             logger.error(f"❌ Export Job {job_id} Failed: {e}")
             job_manager.update_job(job_id, JobState.FAILED, error=str(e))
 
     # --- INTERNAL WORKERS ---
     
-    def _create_zip_export(self, safe_name: str, files: List[Dict], format_type: str) -> str:
+    def _create_zip_export(self, job_id: str, safe_name: str, files: List[Dict], format_type: str) -> str:
         suffix = "clean" if format_type == "clean_images" else "raw"
         zip_name = f"{safe_name}_{suffix}.zip"
         zip_path = os.path.join(TEMP_DIR, zip_name)
         
         with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for p in files:
+            for i, p in enumerate(files):
+                job_manager.update_progress(job_id, i / len(files) * 100)
                 path = resolve_local_path(p["url"])
                 if os.path.exists(path):
                     # For ZIP, ensure we have an extension
@@ -92,12 +95,14 @@ class ExportService:
             json.dump(payload, f, indent=2, ensure_ascii=False)
         return json_path
 
-    def _create_pdf_export(self, safe_name: str, files: List[Dict]) -> str:
+    def _create_pdf_export(self, job_id: str, safe_name: str, files: List[Dict]) -> str:
         pdf_name = f"{safe_name}.pdf"
         pdf_path = os.path.join(TEMP_DIR, pdf_name)
         imgs = []
         
-        for p in files:
+        # Decoding takes the first 80%, writing the PDF the rest
+        for i, p in enumerate(files):
+            job_manager.update_progress(job_id, i / len(files) * 80)
             path = resolve_local_path(p["url"])
             if os.path.exists(path):
                 try:
@@ -110,6 +115,7 @@ class ExportService:
         if not imgs:
             raise ValueError("No valid images found for PDF generation")
             
+        job_manager.update_progress(job_id, 80)
         imgs[0].save(pdf_path, "PDF", save_all=True, append_images=imgs[1:])
         return pdf_path
 
@@ -0,0 +1,135 @@
+import os
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from loguru import logger
+
+from app.config import TEMP_DIR
+
+# Versioned URLs (?v=...) never change content; unversioned ones must be revalidated (ETag -> 304)
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+# Content hashes of served files, keyed by (path, mtime_ns, size)
+_MAX_HASHED_FILES = 4096
+_file_hashes: "OrderedDict[tuple[str, int, int], str]" = OrderedDict()
+_lock = threading.Lock()
+# Same keys on disk (one small file each), so after a restart a known file costs a stat
+# and a tiny read instead of reading the whole image again
+HASH_INDEX_DIR = os.path.join(TEMP_DIR, "hashes")
+
+
+def bytes_etag(data) -> str:
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+def _index_path(key: tuple) -> str:
+    name = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(HASH_INDEX_DIR, name[:2], name)
+
+
+def _read_index(key: tuple) -> str | None:
+    try:
+        with open(_index_path(key), "r", encoding="ascii") as f:
+            content_hash = f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+    return content_hash if len(content_hash) == 32 else None
+
+
+def _write_index(key: tuple, content_hash: str):
+    index_path = _index_path(key)
+    temp_path = index_path + f".{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(temp_path, "w", encoding="ascii") as f:
+            f.write(content_hash)
+        os.replace(temp_path, index_path)
+    except OSError as e:
+        logger.warning(f"⚠️ Could not persist content hash of {key[0]}: {e}")
+
+
+def file_hash(path: str, stat_result: os.stat_result | None = None) -> str:
+    """
+    Content hash (hex) of a file. The file is hashed once per (path, mtime, size) and the
+    result is kept in memory and in HASH_INDEX_DIR: later calls for an unchanged file,
+    also after a restart, only cost a stat (plus a tiny read on a memory miss).
+    """
+    stat_result = stat_result or os.stat(path)
+    key = (os.path.abspath(path), stat_result.st_mtime_ns, stat_result.st_size)
+
+    with _lock:
+        content_hash = _file_hashes.get(key)
+        if content_hash:
+            _file_hashes.move_to_end(key)
+            return content_hash
+
+    content_hash = _read_index(key)
+    if content_hash is None:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        _write_index(key, content_hash)
+
+    with _lock:
+        _file_hashes[key] = content_hash
+        while len(_file_hashes) > _MAX_HASHED_FILES:
+            _file_hashes.popitem(last=False)
+    return content_hash
+
+
+def file_etag(path: str, stat_result: os.stat_result | None = None) -> str:
+    """Content-hash ETag for a file (see file_hash)."""
+    return f'"{file_hash(path, stat_result)}"'
+
+
+def source_version(mtime: float) -> str:
+    """Short version token for a source image (its mtime), used as ?v= in versioned URLs."""
+    return format(int(mtime * 1000), "x")
+
+
+def cache_control(request: Request, immutable: bool = False) -> str:
+    return IMMUTABLE if immutable or "v" in request.query_params else REVALIDATE
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+def _headers(request: Request, etag: str, immutable: bool, negotiated: bool) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control(request, immutable)}
+    if negotiated:
+        # Format was picked from the Accept header (see image_format.negotiate)
+        headers["Vary"] = "Accept"
+    return headers
+
+
+def cached_file_response(
+    request: Request, path: str, media_type: str | None = None, immutable: bool = False, negotiated: bool = False
+) -> Response:
+    """FileResponse with a content-hash ETag and Cache-Control; 304 if the client already has it."""
+    stat_result = os.stat(path)
+    headers = _headers(request, file_etag(path, stat_result), immutable, negotiated)
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+
+def cached_bytes_response(
+    request: Request, data, media_type: str, immutable: bool = False, negotiated: bool = False
+) -> Response:
+    """Same as cached_file_response, for in-memory content (e.g. packed tiles)."""
+    headers = _headers(request, bytes_etag(data), immutable, negotiated)
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=media_type, headers=headers)
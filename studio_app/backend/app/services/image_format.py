@@ -0,0 +1,62 @@
+import io
+from typing import List
+from PIL import Image, features
+
+from app.config import IMAGE_OUTPUT_FORMATS
+
+# Encoders for served images (tiles, thumbnails). "jpeg" is always available and the fallback.
+FORMATS = {
+    "avif": {"mime": "image/avif", "ext": "avif", "pil": "AVIF", "save": {"quality": 55, "speed": 8}},
+    "webp": {"mime": "image/webp", "ext": "webp", "pil": "WEBP", "save": {"quality": 80, "method": 4}},
+    "jpeg": {"mime": "image/jpeg", "ext": "jpg", "pil": "JPEG", "save": {"quality": 85}},
+}
+
+
+def _supported(fmt: str) -> bool:
+    return fmt == "jpeg" or (fmt in FORMATS and features.check(fmt))
+
+
+# Server preference order, restricted to what this Pillow build can encode
+ENABLED_FORMATS: List[str] = [f for f in IMAGE_OUTPUT_FORMATS if _supported(f)]
+if "jpeg" not in ENABLED_FORMATS:
+    ENABLED_FORMATS.append("jpeg")
+
+
+def negotiate(accept: str | None) -> str:
+    """
+    Picks the output format from an Accept header: the first enabled format
+    (server preference order) the client lists; JPEG otherwise.
+    Wildcards (*/*, image/*) do not opt in to WebP/AVIF, since browsers send them for every image.
+    """
+    if not accept:
+        return "jpeg"
+
+    accepted = set()
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        if any(p.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for p in params):
+            continue
+        accepted.add(media_type.lower())
+
+    for fmt in ENABLED_FORMATS:
+        if FORMATS[fmt]["mime"] in accepted:
+            return fmt
+    return "jpeg"
+
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt]["mime"]
+
+
+def extension(fmt: str) -> str:
+    return FORMATS[fmt]["ext"]
+
+
+def save_kwargs(fmt: str) -> dict:
+    return {"format": FORMATS[fmt]["pil"], **FORMATS[fmt]["save"]}
+
+
+def encode(img: Image.Image, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, **save_kwargs(fmt))
+    return buf.getvalue()
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from typing import Optional, Set
+from loguru import logger
+
+# Max undelivered events per subscriber; a stalled client loses its oldest events, not the server's memory
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class JobSubscription:
+    """
+    One streaming client. Receives events for the given job ids and/or comic,
+    or for every job when neither filter is set.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, job_ids: Optional[Set[str]] = None, comic_id: Optional[str] = None):
+        self.loop = loop
+        self.job_ids = job_ids or set()
+        self.comic_id = comic_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def matches(self, job: dict) -> bool:
+        if not self.job_ids and not self.comic_id:
+            return True
+        return job["id"] in self.job_ids or (self.comic_id is not None and job.get("comic_id") == self.comic_id)
+
+    def _offer(self, event: dict):
+        # Runs on the subscriber's event loop
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class JobEventBus:
+    """
+    Fan-out of job state changes to streaming clients (SSE).
+    publish() is called from worker threads by job_manager; events are handed
+    to each subscriber's event loop with call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._subscribers: Set[JobSubscription] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_ids: Optional[Set[str]] = None, comic_id: Optional[str] = None) -> JobSubscription:
+        """Must be called from the event loop that will consume the events."""
+        sub = JobSubscription(asyncio.get_running_loop(), job_ids, comic_id)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: JobSubscription):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, event: str, job) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+
+        payload = {"event": event, "job": job.model_dump(mode="json")}
+        for sub in subscribers:
+            if sub.matches(payload["job"]):
+                try:
+                    sub.loop.call_soon_threadsafe(sub._offer, payload)
+                except RuntimeError:
+                    # Subscriber's loop already closed
+                    logger.debug("Dropping event for closed job stream")
+                    self.unsubscribe(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+# Global Instance
+job_events = JobEventBus()
@@ -1,73 +1,316 @@
 import uuid
 import time
-from typing import Dict, Optional, Any
+import threading
+from collections import OrderedDict
+from typing import Optional, Any, List, Tuple
 from enum import Enum
 from pydantic import BaseModel
 from loguru import logger
 
+from app.config import JOB_TTL_SECONDS, JOB_MAX_FINISHED, JOB_PERSIST, JOB_PROGRESS_PERSIST_SECONDS
+from app.services.job_events import job_events
+
 class JobState(str, Enum):
     PENDING = "PENDING"
     PROCESSING = "PROCESSING"
     COMPLETED = "COMPLETED"
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
+FINISHED_STATES = (JobState.COMPLETED, JobState.FAILED, JobState.CANCELLED)
+
+class JobCancelled(Exception):
+    """Raised inside a running job (via check_cancelled) once cancellation was requested."""
+    pass
 
 class JobStatus(BaseModel):
     id: str
     type: str
     status: JobState
+    comic_id: Optional[str] = None # Groups jobs for /jobs/stream?comic_id=
     result: Optional[Any] = None
     error: Optional[str] = None
+    progress: float = 0.0 # Percentage (0-100)
     created_at: float
     updated_at: float
 
 class JobManager:
+    """
+    Registry of background jobs.
+    In-memory jobs are bounded: finished jobs are evicted after JOB_TTL_SECONDS
+    and only the newest JOB_MAX_FINISHED finished jobs are kept.
+    With JOB_PERSIST enabled, every state change is also written to the `jobs`
+    SQLite table so job history survives restarts; progress ticks are written at most
+    every JOB_PROGRESS_PERSIST_SECONDS per job.
+    """
     _instance = None
-    _jobs: Dict[str, JobStatus] = {}
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(JobManager, cls).__new__(cls)
-            # Initialize state if needed, but class attribute _jobs works for singleton behavior 
-            # as long as we don't re-initialize it in __init__ incorrectly.
+            # Insertion-ordered so eviction can drop the oldest finished jobs first
+            cls._instance._jobs = OrderedDict()
+            cls._instance._lock = threading.RLock()
+            # job id -> time its row was last written (progress throttling)
+            cls._instance._persisted_at = {}
         return cls._instance
 
-    def create_job(self, task_type: str) -> str:
+    # --- PERSISTENCE (optional) ---
+
+    def _persist(self, job: JobStatus):
+        if not JOB_PERSIST:
+            return
+        with self._lock:
+            if job.status in FINISHED_STATES:
+                self._persisted_at.pop(job.id, None)
+            else:
+                self._persisted_at[job.id] = time.monotonic()
+        from app.database import SessionLocal
+        from app.models_db import JobRecord
+        db = SessionLocal()
+        try:
+            db.merge(JobRecord(
+                id=job.id,
+                type=job.type,
+                comic_id=job.comic_id,
+                status=job.status.value,
+                result=job.result,
+                error=job.error,
+                progress=job.progress,
+                created_at=job.created_at,
+                updated_at=job.updated_at
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Failed to persist job {job.id}: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _from_record(record) -> JobStatus:
+        return JobStatus(
+            id=record.id,
+            type=record.type,
+            comic_id=record.comic_id,
+            status=JobState(record.status),
+            result=record.result,
+            error=record.error,
+            progress=record.progress or 0.0,
+            created_at=record.created_at,
+            updated_at=record.updated_at
+        )
+
+    def _prune_persisted(self, interrupted: bool = False):
+        """
+        Deletes persisted finished jobs older than JOB_TTL_SECONDS.
+        With interrupted=True (startup), jobs left PENDING/PROCESSING by a previous run are marked FAILED first.
+        """
+        if not JOB_PERSIST:
+            return
+        from app.database import SessionLocal
+        from app.models_db import JobRecord
+        db = SessionLocal()
+        try:
+            now = time.time()
+            if interrupted:
+                count = db.query(JobRecord).filter(
+                    JobRecord.status.in_([JobState.PENDING.value, JobState.PROCESSING.value])
+                ).update({"status": JobState.FAILED.value, "error": "Interrupted by server restart", "updated_at": now},
+                         synchronize_session=False)
+                if count:
+                    logger.warning(f"🗂️ Marked {count} interrupted jobs as FAILED")
+            db.query(JobRecord).filter(
+                JobRecord.status.in_([s.value for s in FINISHED_STATES]),
+                JobRecord.updated_at < now - JOB_TTL_SECONDS
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Failed to prune job store: {e}")
+        finally:
+            db.close()
+
+    def restore(self):
+        """Called at startup: recovers the persisted job table after a restart."""
+        self._prune_persisted(interrupted=True)
+
+    # --- EVICTION ---
+
+    def _evict(self) -> bool:
+        """
+        Drops expired finished jobs, then the oldest finished ones beyond JOB_MAX_FINISHED.
+        Returns True if any job expired (so the persisted table is due for pruning too).
+        """
+        with self._lock:
+            cutoff = time.time() - JOB_TTL_SECONDS
+            finished = [j for j in self._jobs.values() if j.status in FINISHED_STATES]
+
+            expired = {j.id for j in finished if j.updated_at < cutoff}
+            for job_id in expired:
+                del self._jobs[job_id]
+
+            remaining = [j for j in finished if j.id not in expired]
+            overflow = len(remaining) - JOB_MAX_FINISHED
+            if overflow > 0:
+                for job in sorted(remaining, key=lambda j: j.updated_at)[:overflow]:
+                    del self._jobs[job.id]
+            return bool(expired)
+
+    # --- PUBLIC API ---
+
+    def create_job(self, task_type: str, comic_id: Optional[str] = None) -> str:
         job_id = str(uuid.uuid4())
         now = time.time()
-        
+
         job = JobStatus(
             id=job_id,
             type=task_type,
+            comic_id=comic_id,
             status=JobState.PENDING,
             created_at=now,
             updated_at=now
         )
-        
-        self._jobs[job_id] = job
+
+        with self._lock:
+            self._jobs[job_id] = job
+            expired = self._evict()
+        self._persist(job)
+        job_events.publish("created", job)
+        if expired:
+            self._prune_persisted()
         logger.info(f"🆕 Job Created: {job_id} [{task_type}]")
         return job_id
 
     def update_job(self, job_id: str, status: JobState, result: Optional[Any] = None, error: Optional[str] = None):
-        if job_id not in self._jobs:
-            logger.error(f"❌ Attempted to update non-existent job: {job_id}")
-            return
-            
-        job = self._jobs[job_id]
-        job.status = status
-        job.updated_at = time.time()
-        
-        if result is not None:
-            job.result = result
-        if error is not None:
-            job.error = error
-            
+        with self._lock:
+            if job_id not in self._jobs:
+                logger.error(f"❌ Attempted to update non-existent job: {job_id}")
+                return
+
+            job = self._jobs[job_id]
+            if job.status == JobState.CANCELLED:
+                # Late updates from a worker that was cancelled mid-run are ignored
+                return
+
+            job.status = status
+            job.updated_at = time.time()
+            if status == JobState.COMPLETED:
+                job.progress = 100.0
+
+            if result is not None:
+                job.result = result
+            if error is not None:
+                job.error = error
+
+            if status in FINISHED_STATES:
+                self._evict()
+
+        self._persist(job)
+        job_events.publish("updated", job)
         logger.info(f"🔄 Job Updated: {job_id} -> {status}")
 
+    def update_progress(self, job_id: str, progress: float):
+        """
+        Records percentage progress (0-100) for a running job.
+        Also raises JobCancelled if the job was cancelled, so long loops stop early.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            if job.status == JobState.CANCELLED:
+                raise JobCancelled(job_id)
+            job.progress = round(max(0.0, min(100.0, progress)), 1)
+            job.updated_at = time.time()
+            # The next state change writes the latest progress anyway
+            due = time.monotonic() - self._persisted_at.get(job.id, 0.0) >= JOB_PROGRESS_PERSIST_SECONDS
+        if due:
+            self._persist(job)
+        job_events.publish("progress", job)
+
+    def check_cancelled(self, job_id: str):
+        """Raises JobCancelled if cancellation was requested for this job."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job and job.status == JobState.CANCELLED:
+            raise JobCancelled(job_id)
+
+    def cancel_job(self, job_id: str) -> Optional[JobStatus]:
+        """
+        Cancels a queued or running job. Queued jobs are skipped by the scheduler;
+        running jobs stop at their next progress/cancellation checkpoint.
+        Returns the job (unchanged if it had already finished), or None if unknown.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            if job.status in FINISHED_STATES:
+                return job
+            job.status = JobState.CANCELLED
+            job.updated_at = time.time()
+            self._evict()
+        self._persist(job)
+        job_events.publish("cancelled", job)
+        logger.info(f"🛑 Job Cancelled: {job_id}")
+        return job
+
     def get_job(self, job_id: str) -> Optional[JobStatus]:
-        return self._jobs.get(job_id)
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job or not JOB_PERSIST:
+            return job
+
+        # Evicted from memory: fall back to the persisted record
+        from app.database import SessionLocal
+        from app.models_db import JobRecord
+        db = SessionLocal()
+        try:
+            record = db.query(JobRecord).filter(JobRecord.id == job_id).first()
+            return self._from_record(record) if record else None
+        finally:
+            db.close()
+
+    def list_jobs(
+        self,
+        status: Optional[JobState] = None,
+        job_type: Optional[str] = None,
+        comic_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> Tuple[int, List[JobStatus]]:
+        """
+        Returns (total, page) of jobs matching the filters, newest first (limit=None: all of them).
+        Lists from the persisted table when JOB_PERSIST is enabled, otherwise from memory.
+        """
+        if JOB_PERSIST:
+            from app.database import SessionLocal
+            from app.models_db import JobRecord
+            db = SessionLocal()
+            try:
+                query = db.query(JobRecord)
+                if status:
+                    query = query.filter(JobRecord.status == status.value)
+                if job_type:
+                    query = query.filter(JobRecord.type == job_type)
+                if comic_id:
+                    query = query.filter(JobRecord.comic_id == comic_id)
+                total = query.count()
+                records = query.order_by(JobRecord.created_at.desc()).offset(offset).limit(limit).all()
+                return total, [self._from_record(r) for r in records]
+            finally:
+                db.close()
 
-    def list_jobs(self) -> Dict[str, JobStatus]:
-        return self._jobs
+        with self._lock:
+            self._evict()
+            jobs = [
+                j for j in reversed(self._jobs.values())
+                if (status is None or j.status == status)
+                and (job_type is None or j.type == job_type)
+                and (comic_id is None or j.comic_id == comic_id)
+            ]
+        return len(jobs), jobs[offset:] if limit is None else jobs[offset:offset + limit]
 
 # Global Instance
 job_manager = JobManager()
@@ -0,0 +1,104 @@
+import itertools
+import queue
+import threading
+from enum import IntEnum
+from typing import Callable, Dict, List
+from loguru import logger
+
+from app.config import JOB_QUEUE_WORKERS
+from app.services.job_manager import job_manager, JobState, JobCancelled
+
+
+class JobPriority(IntEnum):
+    """Lower runs first. Interactive (single page) work jumps ahead of batch work in the same queue."""
+    INTERACTIVE = 0
+    BATCH = 10
+
+
+class JobScheduler:
+    """
+    In-process job scheduler.
+    Each queue (see JOB_QUEUE_WORKERS: "detection", "ocr", "export", "default", "tiles",
+    "thumbnails", "ingest") has its own priority queue and worker threads, so a bulk export
+    can never occupy the threads that serve OCR.
+    Job functions are called as fn(job_id, *args, **kwargs) and report their own state
+    through job_manager; cancelled jobs are skipped when dequeued.
+    """
+
+    def __init__(self, workers_per_queue: Dict[str, int] = JOB_QUEUE_WORKERS):
+        self._workers_per_queue = workers_per_queue
+        self._queues: Dict[str, queue.PriorityQueue] = {}
+        self._threads: Dict[str, List[threading.Thread]] = {}
+        self._seq = itertools.count()  # FIFO tie-break within a priority
+        self._lock = threading.Lock()
+
+    def _queue(self, name: str) -> queue.PriorityQueue:
+        if name not in self._workers_per_queue:
+            raise ValueError(f"Unknown job queue: {name}")
+
+        with self._lock:
+            if name not in self._queues:
+                self._queues[name] = queue.PriorityQueue()
+                self._threads[name] = []
+                for i in range(self._workers_per_queue[name]):
+                    thread = threading.Thread(target=self._worker, args=(name,), name=f"job-{name}-{i}", daemon=True)
+                    thread.start()
+                    self._threads[name].append(thread)
+                logger.info(f"🧵 Job queue '{name}' started ({self._workers_per_queue[name]} workers)")
+            return self._queues[name]
+
+    def submit(
+        self,
+        job_id: str,
+        fn: Callable,
+        *args,
+        queue_name: str = "default",
+        priority: JobPriority = JobPriority.INTERACTIVE,
+        **kwargs
+    ):
+        """Enqueues a job created via job_manager.create_job()."""
+        self._queue(queue_name).put((int(priority), next(self._seq), job_id, fn, args, kwargs))
+        logger.info(f"📥 Job {job_id} queued on '{queue_name}' (priority {priority.name})")
+
+    def _worker(self, name: str):
+        q = self._queues[name]
+        while True:
+            _, _, job_id, fn, args, kwargs = q.get()
+            try:
+                if job_id is None:  # Shutdown sentinel
+                    return
+
+                job = job_manager.get_job(job_id)
+                if not job or job.status == JobState.CANCELLED:
+                    logger.info(f"⏭️ Skipping cancelled job {job_id}")
+                    continue
+
+                fn(job_id, *args, **kwargs)
+
+            except JobCancelled:
+                logger.info(f"🛑 Job {job_id} stopped after cancellation")
+            except Exception as e:
+                logger.error(f"❌ Job {job_id} crashed in queue '{name}': {e}")
+                job_manager.update_job(job_id, JobState.FAILED, error=str(e))
+            finally:
+                q.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {"workers": self._workers_per_queue[name], "queued": q.qsize()}
+                for name, q in self._queues.items()
+            }
+
+    def shutdown(self):
+        """Stops worker threads after their current job; queued jobs are dropped."""
+        with self._lock:
+            queues = dict(self._queues)
+        for name, q in queues.items():
+            for _ in self._threads.get(name, []):
+                # Sentinel sorts ahead of every real priority
+                q.put((-1, next(self._seq), None, None, (), {}))
+
+
+# Global Instance
+job_scheduler = JobScheduler()
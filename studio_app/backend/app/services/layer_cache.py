@@ -0,0 +1,112 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+from PIL import Image
+from loguru import logger
+
+from app.config import TILE_LAYER_CACHE_MB
+
+
+class LayerCache:
+    """
+    Byte-budgeted LRU of decoded PIL images, shared across requests.
+    Used by TileService so a burst of tile crops from one zoom layer costs a single decode.
+    Concurrent misses for the same key wait for one loader instead of decoding in parallel.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Hashable, Image.Image]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size_of(img: Image.Image) -> int:
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, key: Hashable) -> Optional[Image.Image]:
+        with self._lock:
+            img = self._items.get(key)
+            if img is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            return img
+
+    def put(self, key: Hashable, img: Image.Image):
+        size = self._size_of(img)
+        if size > self.max_bytes:
+            return  # Larger than the whole budget: never cache
+        img.load()  # Cached images are shared read-only between threads
+
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._sizes[key]
+            self._items[key] = img
+            self._items.move_to_end(key)
+            self._sizes[key] = size
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                old_key, _ = self._items.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[Image.Image]]) -> Optional[Image.Image]:
+        """Returns the cached image, or runs loader() once (per key) and caches the result."""
+        img = self.get(key)
+        if img is not None:
+            return img
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have loaded it while we waited
+            with self._lock:
+                img = self._items.get(key)
+                if img is not None:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return img
+                self.misses += 1
+
+            try:
+                img = loader()
+                if img is not None:
+                    self.put(key, img)
+                return img
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+    def invalidate(self, prefix: Hashable):
+        """Drops every entry whose key tuple starts with prefix (e.g. all zooms of one image)."""
+        with self._lock:
+            stale = [k for k in self._items if isinstance(k, tuple) and k[0] == prefix]
+            for key in stale:
+                del self._items[key]
+                self._bytes -= self._sizes.pop(key)
+        if stale:
+            logger.debug(f"Layer cache: dropped {len(stale)} layers of {prefix}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions
+            }
+
+
+# Global Instance (decoded Deep Zoom layers, keyed by (image_id, zoom))
+layer_cache = LayerCache(TILE_LAYER_CACHE_MB * 1024 * 1024)
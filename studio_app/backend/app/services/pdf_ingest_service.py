@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Tuple
+from fastapi.concurrency import run_in_threadpool
+from pdf2image import convert_from_path, pdfinfo_from_path
+from loguru import logger
+
+from app.config import TEMP_DIR, PDF_CHUNK_PAGES, PDF_RASTER_WORKERS, PDF_JPEG_QUALITY
+from app.services.job_manager import job_manager, JobState
+from app.services.job_scheduler import job_scheduler, JobPriority
+
+
+class PDFIngestService:
+    """
+    Page-at-a-time PDF rasterization.
+    Pages are rendered in windows of PDF_CHUNK_PAGES (first_page/last_page) by up to
+    PDF_RASTER_WORKERS parallel pdftoppm processes, straight to JPEG files on disk:
+    no page is ever held as a PIL image, and at most PDF_RASTER_WORKERS windows are
+    in flight, so memory (and scratch space) stays constant in the page count.
+    Each page is handed to the caller as soon as its window is done, in page order.
+    """
+
+    @staticmethod
+    def page_count(pdf_path: str) -> int:
+        return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+    @staticmethod
+    def _rasterize_window(pdf_path: str, first: int, last: int, dpi: int, work_dir: str) -> Tuple[str, List[str]]:
+        """Renders pages first..last into their own folder; returns (folder, JPEG paths in page order)."""
+        window_dir = tempfile.mkdtemp(prefix=f"p{first:06d}_", dir=work_dir)
+        paths = convert_from_path(
+            pdf_path, dpi=dpi, first_page=first, last_page=last,
+            fmt="jpeg", jpegopt={"quality": PDF_JPEG_QUALITY},
+            output_folder=window_dir, output_file="page", paths_only=True
+        )
+        return window_dir, paths
+
+    def iter_pages(self, pdf_path: str, dpi: int = 200) -> Iterator[Tuple[int, int, str]]:
+        """
+        Yields (page number, page count, scratch JPEG path) in page order.
+        The scratch file is deleted once the caller moves on: move or copy it before the next page.
+        """
+        total = self.page_count(pdf_path)
+        windows = deque((first, min(first + PDF_CHUNK_PAGES - 1, total)) for first in range(1, total + 1, PDF_CHUNK_PAGES))
+        work_dir = tempfile.mkdtemp(prefix="pdf_ingest_", dir=TEMP_DIR)
+        executor = ThreadPoolExecutor(max_workers=max(1, PDF_RASTER_WORKERS), thread_name_prefix="pdf-raster")
+
+        def submit_next(pending: deque):
+            if windows:
+                first, last = windows.popleft()
+                pending.append((first, executor.submit(self._rasterize_window, pdf_path, first, last, dpi, work_dir)))
+
+        try:
+            pending = deque()
+            for _ in range(max(1, PDF_RASTER_WORKERS)):
+                submit_next(pending)
+
+            while pending:
+                first, future = pending.popleft()
+                window_dir, paths = future.result()
+                submit_next(pending)  # Keep every rasterizer busy while this window is consumed
+
+                for offset, path in enumerate(paths):
+                    yield first + offset, total, path
+                shutil.rmtree(window_dir, ignore_errors=True)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def extract_pages(
+        self, pdf_path: str, dest_path: Callable[[int], str], on_page: Callable[[int, str], None],
+        dpi: int = 200, job_id: str | None = None
+    ) -> int:
+        """
+        Rasterizes every page to dest_path(page_num) and calls on_page(page_num, path) right away
+        (e.g. to insert its DB row). Reports progress on job_id. Returns the page count.
+        """
+        count = 0
+        # closing(): a cancelled job (JobCancelled from update_progress) stops the rasterizers right away
+        with closing(self.iter_pages(pdf_path, dpi)) as pages:
+            for page_num, total, scratch_path in pages:
+                path = dest_path(page_num)
+                shutil.move(scratch_path, path)
+                on_page(page_num, path)
+                count += 1
+                if job_id:
+                    job_manager.update_progress(job_id, page_num / total * 100)
+        logger.info(f"📄 Rasterized {count} pages from {os.path.basename(pdf_path)}")
+        return count
+
+    def run_ingest_job(self, job_id: str, fn: Callable[..., dict], *args) -> dict:
+        """Runs fn(job_id, *args) as a PDF_INGEST job; its return value becomes the job result."""
+        job_manager.update_job(job_id, JobState.PROCESSING)
+        result = fn(job_id, *args)
+        job_manager.update_job(job_id, JobState.COMPLETED, result=result)
+        return result
+
+    async def run(self, fn: Callable[..., dict], *args, comic_id: str | None = None, background: bool = False) -> dict:
+        """
+        Ingestion entry point for routes.
+        background=False: waits for the result (rasterization runs off the event loop);
+        background=True: returns the job id at once, the result lands on the job (GET /jobs/{id}, /jobs/stream).
+        Failures are recorded on the job either way.
+        """
+        job_id = job_manager.create_job("PDF_INGEST", comic_id=comic_id)
+        if background:
+            job_scheduler.submit(
+                job_id, self.run_ingest_job, fn, *args,
+                queue_name="ingest", priority=JobPriority.INTERACTIVE
+            )
+            return {"status": "queued", "job_id": job_id, "comic_id": comic_id}
+
+        try:
+            result = await run_in_threadpool(self.run_ingest_job, job_id, fn, *args)
+        except Exception as e:
+            job_manager.update_job(job_id, JobState.FAILED, error=str(e))
+            raise
+        return {**result, "job_id": job_id}
+
+
+pdf_ingest_service = PDFIngestService()
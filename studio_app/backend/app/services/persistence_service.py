@@ -1,83 +1,130 @@
 from sqlalchemy.orm import Session
 from loguru import logger
-from app.models import FileUpdateData, Balloon
-from app.crud.filesystem import get_filesystem_entry
-from typing import List, Dict, Any
+from app.models import FileUpdateData, BalloonPatchRequest
+from app.crud.filesystem import (
+    get_filesystem_entry, bulk_delete_filesystem_entries, bump_file_revision, replace_page_annotations, patch_balloons
+)
+from typing import Dict, Any
+
+
+class RevisionConflict(Exception):
+    """The page was saved since the client's baseRevision."""
+
+    def __init__(self, revision: int):
+        super().__init__(f"Page is at revision {revision}")
+        self.revision = revision
+
 
 class PersistenceService:
     def __init__(self, db: Session):
         self.db = db
+        self.revision = None # Page revision after the last successful save
+
+    def _apply(self, entry, data: FileUpdateData) -> bool:
+        """
+        Writes the provided fields of one file (no commit). Returns whether anything was set.
+        Balloons/panels go through Core statements on the current rows (see save_many for the lock).
+        """
+        updates_made = False
+
+        # 1. Balloons + Panels (JSON columns need plain dicts, not Pydantic models)
+        if data.balloons is not None or data.panels is not None:
+            replace_page_annotations(
+                self.db, entry.id,
+                balloons=[b.model_dump() for b in data.balloons] if data.balloons is not None else None,
+                panels=data.panels
+            )
+            updates_made = True
+
+        # 2. Handle Clean Status
+        if data.cleanUrl is not None:
+            entry.clean_url = data.cleanUrl
+            updates_made = True
+
+        if data.isCleaned is not None:
+            entry.is_cleaned = data.isCleaned
+            updates_made = True
+
+        return updates_made
 
     def save_file_data(self, file_id: str, data: FileUpdateData) -> bool:
         """
         Unified save function for File Data (Balloons + Clean Status).
-        Explicitly handles Pydantic -> Dict conversion for JSON serialization.
+        Balloons/panels replace the page's annotations and bump its revision.
+        """
+        return file_id in self.save_many({file_id: data})
+
+    def save_many(self, saves: Dict[str, FileUpdateData]) -> Dict[str, int]:
+        """
+        Applies several file saves in one transaction (a single commit).
+        Balloons/panels replace the stored ones in Core statements after the page's revision bump,
+        so concurrent saves and patches of a page are serialized instead of duplicating balloons.
+        Returns {file_id: page revision} for the files saved; missing files are left out.
+        Nothing is saved if the transaction fails.
         """
         try:
-            logger.info(f"💾 PersistenceService: Attempting to save file {file_id}")
-            entry = get_filesystem_entry(self.db, file_id)
-            if not entry:
-                logger.error(f"❌ PersistenceService: File {file_id} not found.")
-                return False
-
-            updates_made = False
-
-            # 1. Handle Balloons (Convert Pydantic List[Balloon] -> List[Dict])
-            if data.balloons is not None:
-                logger.info(f"   -> Processing {len(data.balloons)} balloons...")
-                try:
-                    # CRITICAL: Debugging Serialization
-                    sample = data.balloons[0] if data.balloons else "Empty"
-                    logger.debug(f"   -> Sample Balloon Type: {type(sample)}")
-                    
-                    # CRITICAL FIX: Explicitly convert Pydantic models to dicts
-                    # SQLAlchemy JSON columns cannot serialize Pydantic models automatically.
-                    serialized_balloons = [b.dict() if hasattr(b, 'dict') else b for b in data.balloons]
-                    
-                    logger.debug(f"   -> Serialized Sample: {serialized_balloons[0] if serialized_balloons else 'Empty'}")
-                    
-                    entry.balloons = serialized_balloons
-                    updates_made = True
-                    logger.info(f"   -> Assigned balloons to entry. Updates Made = True")
-                except Exception as e:
-                    logger.error(f"   -> Error processing balloons: {e}")
-                    raise e
-            
-            # 1.5 Handle Panels (Added)
-            if data.panels is not None:
-                 entry.panels = data.panels
-                 updates_made = True
-                 logger.debug(f"   -> Assigned {len(data.panels)} panels to entry.")
-
-            # 2. Handle Clean Status
-            if data.cleanUrl is not None:
-                entry.clean_url = data.cleanUrl
-                updates_made = True
-                logger.debug(f"   -> Updated clean_url: {data.cleanUrl}")
-
-            if data.isCleaned is not None:
-                entry.is_cleaned = data.isCleaned
-                updates_made = True
-                logger.debug(f"   -> Updated is_cleaned: {data.isCleaned}")
-
-            # 3. Commit
-            if updates_made:
-                logger.info(f"   -> Committing changes to DB...")
-                self.db.commit()
-                self.db.refresh(entry)
-                
-                # Verify immediately
-                logger.info(f"   -> Re-read from DB. Balloons count: {len(entry.balloons) if entry.balloons else 0}")
-                
-                logger.info(f"✅ PersistenceService: Successfully saved {file_id}")
-                return True
-            else:
-                logger.info(f"ℹ️ PersistenceService: No changes detected/requested for {file_id}")
-                return True
+            # Revisions first: the write lock is taken before anything is read, so every page below
+            # is read (and its existence checked) after any concurrent save, patch or delete committed
+            bumped = {
+                file_id: bump_file_revision(self.db, file_id)
+                for file_id, data in saves.items() if data.balloons is not None or data.panels is not None
+            }
+
+            revisions = {}
+            for file_id, data in saves.items():
+                entry = get_filesystem_entry(self.db, file_id)
+                if not entry:
+                    logger.error(f"❌ PersistenceService: File {file_id} not found.")
+                    continue
+                self._apply(entry, data)
+                revisions[file_id] = bumped[file_id] if file_id in bumped else entry.revision
+
+            if not revisions:
+                self.db.rollback()
+                return {}
+            # Files deleted meanwhile: drop the annotation rows the revision bump may have created
+            bulk_delete_filesystem_entries(self.db, list(bumped.keys() - revisions.keys()), commit=False)
+            self.db.commit()
+            if len(revisions) == 1:
+                self.revision = next(iter(revisions.values()))
+
+            logger.debug(f"✅ PersistenceService: Saved {len(revisions)}/{len(saves)} files in one commit")
+            return revisions
 
         except Exception as e:
             self.db.rollback()
             logger.error(f"🔥 PersistenceService CRITICAL ERROR: {e}")
             import traceback
             logger.error(traceback.format_exc())
-            return False
+            return {}
+
+    def patch_file_balloons(self, file_id: str, patch: BalloonPatchRequest) -> Dict[str, Any] | None:
+        """
+        Applies a per-balloon patch in one transaction: only the touched balloon rows are written.
+        Returns None if the file does not exist; raises RevisionConflict if patch.baseRevision is stale.
+        """
+        try:
+            # Revision first: the write lock is taken before anything is read
+            revision = bump_file_revision(self.db, file_id, patch.baseRevision)
+            if not get_filesystem_entry(self.db, file_id):
+                self.db.rollback()
+                return None
+            if revision is None:
+                current = get_filesystem_entry(self.db, file_id, with_annotations=True).revision
+                self.db.rollback()
+                raise RevisionConflict(current)
+
+            result = patch_balloons(
+                self.db, file_id,
+                add=[b.model_dump() for b in patch.add],
+                updates=[b.model_dump(exclude_unset=True) for b in patch.update],
+                delete_ids=patch.delete
+            )
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        self.revision = revision
+        logger.debug(f"✏️ PersistenceService: Patched balloons of {file_id} -> revision {revision} {result}")
+        return {"revision": revision, **result}
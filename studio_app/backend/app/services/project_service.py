@@ -4,6 +4,8 @@ import os
 from app import crud
 from app.models_db import FileSystemEntry
 from app.config import LIBRARY_DIR
+from app.services.tile_service import tile_service
+from app.services.save_buffer import save_buffer
 
 def delete_project_and_files(db: Session, project_id: str):
     # 1. Recuperar o projeto
@@ -25,22 +27,9 @@ def delete_project_and_files(db: Session, project_id: str):
     # A. Tentar via project_id
     items = db.query(FileSystemEntry).filter(FileSystemEntry.project_id == project_id).all()
     
-    # B. Se nao tiver items (legacy?), tentar via rootFolderId
+    # B. Se nao tiver items (legacy?), tentar via rootFolderId (root + descendentes, uma query recursiva)
     if not items and project.root_folder_id:
-        # Helper recursivo
-        def get_all_descendant_ids(root_id):
-            ids = []
-            children = db.query(FileSystemEntry).filter(FileSystemEntry.parent_id == root_id).all()
-            for child in children:
-                ids.append(child.id)
-                if child.type == 'folder':
-                    ids.extend(get_all_descendant_ids(child.id))
-            return ids
-            
-        descendants = get_all_descendant_ids(project.root_folder_id)
-        # Incluir o root folder também
-        all_ids = [project.root_folder_id] + descendants
-        items = db.query(FileSystemEntry).filter(FileSystemEntry.id.in_(all_ids)).all()
+        items = crud.get_subtree_entries(db, project.root_folder_id)
 
     deleted_count = 0
     for item in items:
@@ -57,7 +46,9 @@ def delete_project_and_files(db: Session, project_id: str):
     # 3. Remover entradas do FileSystem (Cascata manual se DB nao tiver ON DELETE CASCADE)
     if items:
         item_ids = [i.id for i in items]
-        db.query(FileSystemEntry).filter(FileSystemEntry.id.in_(item_ids)).delete(synchronize_session=False)
+        save_buffer.discard(item_ids)
+        crud.bulk_delete_filesystem_entries(db, item_ids, commit=False)
+        tile_service.invalidate_sources(item_ids)
 
     # 4. Remover Projeto do DB
     crud.delete_project(db, project_id)
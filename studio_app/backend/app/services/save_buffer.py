@@ -0,0 +1,186 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+from loguru import logger
+
+from app.config import SAVE_COALESCE_MS, SAVE_DURABILITY
+from app.models import FileUpdateData
+from app.services.persistence_service import PersistenceService
+
+DURABILITY_MODES = ("buffered", "commit", "immediate")
+
+
+class _Batch:
+    """One flush: saves merged per file, plus the event `commit`-mode callers wait on."""
+
+    def __init__(self):
+        self.saves: Dict[str, dict] = {}
+        self.done = threading.Event()
+        self.revisions: Dict[str, int] = {}
+
+
+class SaveBuffer:
+    """
+    Write-behind buffer for editor saves (PUT /files/{id}/data).
+    Saves to the same file within SAVE_COALESCE_MS are merged (later fields win) and every
+    file pending in the window is written in a single transaction, so a burst of autosaves
+    costs one commit instead of one per request.
+    The window starts with the first pending save and does not slide: a page edited
+    continuously is still written every SAVE_COALESCE_MS.
+    Pending saves are flushed by the timer, by flush() before reads of that data
+    (read-after-write) and by shutdown().
+    """
+
+    def __init__(self, window_ms: int = SAVE_COALESCE_MS, durability: str = SAVE_DURABILITY):
+        if durability not in DURABILITY_MODES:
+            logger.warning(f"Unknown SAVE_DURABILITY '{durability}', using 'commit'")
+            durability = "commit"
+        if window_ms <= 0:
+            durability = "immediate"
+        self.window = window_ms / 1000
+        self.durability = durability
+
+        self._batch = _Batch()
+        self._deadline: Optional[float] = None
+        self._in_flight: set = set()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # One flush (transaction) at a time
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.saves = 0
+        self.commits = 0
+
+    @staticmethod
+    def _write(saves: Dict[str, FileUpdateData]) -> Dict[str, int]:
+        from app.database import SessionLocal
+        db = SessionLocal()
+        try:
+            return PersistenceService(db).save_many(saves)
+        finally:
+            db.close()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="save-buffer", daemon=True)
+            self._thread.start()
+
+    def submit(self, file_id: str, data: FileUpdateData) -> Dict[str, object]:
+        """
+        Queues a save. Returns {"queued": True} in buffered mode, otherwise waits for the commit
+        and returns {"queued": False, "saved": bool, "revision": page revision}.
+        """
+        fields = {name: value for name, value in data if value is not None}
+        with self._cond:
+            self.saves += 1
+            if self.durability != "immediate" and not self._closed:
+                batch = self._batch
+                batch.saves[file_id] = {**batch.saves.get(file_id, {}), **fields}
+                if self._deadline is None:
+                    self._deadline = time.monotonic() + self.window
+                    self._ensure_thread()
+                    self._cond.notify()
+                if self.durability == "buffered":
+                    return {"queued": True}
+            else:
+                batch = None
+
+        if batch is None:
+            # Write-through (immediate mode, or after shutdown)
+            self.flush([file_id])
+            with self._flush_lock:
+                revisions = self._write({file_id: data})
+                self.commits += 1
+            return {"queued": False, "saved": file_id in revisions, "revision": revisions.get(file_id)}
+
+        batch.done.wait()
+        return {"queued": False, "saved": file_id in batch.revisions, "revision": batch.revisions.get(file_id)}
+
+    def _is_pending(self, file_ids: Optional[Iterable[str]]) -> bool:
+        if file_ids is None:
+            return True
+        wanted = set(file_ids)
+        with self._cond:
+            return bool(wanted & self._batch.saves.keys()) or bool(wanted & self._in_flight)
+
+    def _flush_locked(self):
+        """Writes the current batch; the caller holds _flush_lock."""
+        with self._cond:
+            batch, self._batch, self._deadline = self._batch, _Batch(), None
+            self._in_flight = set(batch.saves)
+        try:
+            if batch.saves:
+                self._commit(batch)
+        finally:
+            with self._cond:
+                self._in_flight = set()
+            batch.done.set()
+
+    def flush(self, file_ids: Optional[Iterable[str]] = None):
+        """
+        Writes pending saves now. With file_ids, returns at once unless one of them is pending
+        or being written (so reads of untouched files never wait).
+        """
+        if not self._is_pending(file_ids):
+            return
+        with self._flush_lock:
+            self._flush_locked()
+
+    @contextmanager
+    def exclusive(self, file_ids: Iterable[str]):
+        """
+        Writes the pending saves of file_ids, then keeps every buffered write out until the block
+        ends: for writes that must land on top of those saves and not race the next flush
+        (balloon patches).
+        """
+        file_ids = list(file_ids)
+        with self._flush_lock:
+            if self._is_pending(file_ids):
+                self._flush_locked()
+            yield
+
+    def discard(self, file_ids: Iterable[str]):
+        """Drops pending saves of files that are being deleted."""
+        with self._cond:
+            for file_id in file_ids:
+                self._batch.saves.pop(file_id, None)
+
+    def _commit(self, batch: _Batch):
+        saves = {file_id: FileUpdateData(**fields) for file_id, fields in batch.saves.items()}
+        batch.revisions = self._write(saves)
+        self.commits += 1
+        if len(batch.revisions) < len(saves) and len(saves) > 1:
+            # A failed transaction drops the whole batch: retry file by file, so one bad save
+            # (or a file deleted meanwhile) does not lose the others
+            for file_id in saves.keys() - batch.revisions.keys():
+                batch.revisions.update(self._write({file_id: saves[file_id]}))
+                self.commits += 1
+        logger.debug(f"💾 Save buffer: {len(batch.revisions)}/{len(saves)} files committed")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._deadline is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                delay = self._deadline - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Save buffer flush failed: {e}")
+
+    def shutdown(self):
+        """Flushes pending saves and stops the timer; later saves are written through."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.flush()
+        logger.info(f"💾 Save buffer closed ({self.saves} saves, {self.commits} commits)")
+
+
+# Global Instance
+save_buffer = SaveBuffer()
@@ -0,0 +1,144 @@
+import os
+import uuid
+from typing import Dict, List, Tuple
+from PIL import Image
+from loguru import logger
+
+from app.config import TEMP_DIR, THUMBNAIL_SIZES, THUMBNAIL_PREBUILD_FORMATS
+from app.services import image_format
+from app.services.http_cache import file_hash
+from app.services.job_manager import job_manager, JobState, JobCancelled
+from app.services.job_scheduler import job_scheduler, JobPriority
+
+MIN_WIDTH = 16
+MAX_WIDTH = 2048
+
+
+class ThumbnailService:
+    """
+    Gallery thumbnails.
+    Path Structure: temp/thumbs/{hash[:2]}/{hash}_{width}.{jpg|webp|avif}
+    Keyed by the content hash of the source, so identical file names in different
+    folders never collide and a replaced page gets new thumbnails automatically.
+    Standard THUMBNAIL_SIZES are generated once per upload; JPEG sources are decoded
+    in draft mode (DCT scaling), and other widths are derived from the nearest
+    larger cached size, so serving a library grid needs no full-size decode.
+    """
+
+    @staticmethod
+    def _thumb_path(content_hash: str, width: int, fmt: str) -> str:
+        return os.path.join(TEMP_DIR, "thumbs", content_hash[:2], f"{content_hash}_{width}.{image_format.extension(fmt)}")
+
+    @staticmethod
+    def _decode(path: str, width: int) -> Image.Image:
+        """Decodes the source at the smallest scale that still covers `width` (JPEG draft mode)."""
+        with Image.open(path) as img:
+            target = (width, max(1, round(width * img.height / img.width)))
+            img.draft("RGB", target)  # No-op for non-JPEG sources
+            img.thumbnail(target, Image.Resampling.LANCZOS)
+            return img.convert("RGB")
+
+    @staticmethod
+    def _save(img: Image.Image, path: str, fmt: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + f".{uuid.uuid4().hex}.tmp"
+        img.save(temp_path, **image_format.save_kwargs(fmt))
+        os.replace(temp_path, path)
+
+    def _closest_cached(self, content_hash: str, width: int) -> str | None:
+        """Smallest cached standard thumbnail at least `width` wide, in any format."""
+        for size in THUMBNAIL_SIZES:
+            if size < width:
+                continue
+            for fmt in THUMBNAIL_PREBUILD_FORMATS:
+                path = self._thumb_path(content_hash, size, fmt)
+                if os.path.exists(path):
+                    return path
+        return None
+
+    def get_thumbnail(self, source_path: str, width: int, fmt: str = "jpeg") -> str:
+        """Returns the path of the thumbnail, generating it if needed."""
+        width = max(MIN_WIDTH, min(MAX_WIDTH, width))
+        content_hash = file_hash(source_path)
+        thumb_path = self._thumb_path(content_hash, width, fmt)
+        if os.path.exists(thumb_path):
+            return thumb_path
+
+        base = self._closest_cached(content_hash, width) or source_path
+        img = self._decode(base, width)
+        self._save(img, thumb_path, fmt)
+        return thumb_path
+
+    def pregenerate(self, source_path: str) -> int:
+        """
+        Writes every standard size in every pre-built format from a single decode,
+        each size downscaled from the previous (larger) one. Returns thumbnails written.
+        """
+        content_hash = file_hash(source_path)
+        formats = [f for f in THUMBNAIL_PREBUILD_FORMATS if f in image_format.ENABLED_FORMATS] or ["jpeg"]
+        sizes = sorted(THUMBNAIL_SIZES, reverse=True)
+
+        missing = [
+            (size, fmt) for size in sizes for fmt in formats
+            if not os.path.exists(self._thumb_path(content_hash, size, fmt))
+        ]
+        if not missing:
+            return 0
+
+        img = self._decode(source_path, sizes[0])
+        written = 0
+        for size in sizes:
+            if img.width > size:
+                img = img.resize((size, max(1, round(size * img.height / img.width))), Image.Resampling.LANCZOS)
+            for fmt in formats:
+                if (size, fmt) in missing:
+                    self._save(img, self._thumb_path(content_hash, size, fmt), fmt)
+                    written += 1
+        return written
+
+    def get_batch(self, source_paths: List[str], width: int, fmt: str = "jpeg") -> Tuple[Dict[str, bytes], List[str]]:
+        """Thumbnail bytes for many sources: ({source_path: bytes}, [missing source paths])."""
+        thumbnails, missing = {}, []
+        for source_path in source_paths:
+            try:
+                if not os.path.exists(source_path):
+                    missing.append(source_path)
+                    continue
+                with open(self.get_thumbnail(source_path, width, fmt), "rb") as f:
+                    thumbnails[source_path] = f.read()
+            except Exception as e:
+                logger.warning(f"Thumbnail failed for {source_path}: {e}")
+                missing.append(source_path)
+        return thumbnails, missing
+
+    def process_thumbnail_job(self, job_id: str, source_paths: List[str]):
+        """Background worker: standard sizes for freshly uploaded/imported pages."""
+        try:
+            job_manager.update_job(job_id, JobState.PROCESSING)
+            written = 0
+            for i, source_path in enumerate(source_paths):
+                job_manager.update_progress(job_id, i / len(source_paths) * 100)
+                try:
+                    written += self.pregenerate(source_path)
+                except Exception as e:
+                    logger.warning(f"Thumbnail pre-generation failed for {source_path}: {e}")
+            job_manager.update_job(job_id, JobState.COMPLETED, result={"pages": len(source_paths), "thumbnails": written})
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Thumbnail Job {job_id} Failed: {e}")
+            job_manager.update_job(job_id, JobState.FAILED, error=str(e))
+
+    def schedule_pregeneration(self, source_paths: List[str], comic_id: str | None = None) -> str | None:
+        """Queues a THUMBNAILS job (own queue, so gallery thumbnails never wait behind tile pyramids)."""
+        if not source_paths or not THUMBNAIL_SIZES:
+            return None
+        job_id = job_manager.create_job("THUMBNAILS", comic_id=comic_id)
+        job_scheduler.submit(
+            job_id, self.process_thumbnail_job, source_paths,
+            queue_name="thumbnails", priority=JobPriority.INTERACTIVE
+        )
+        return job_id
+
+
+thumbnail_service = ThumbnailService()
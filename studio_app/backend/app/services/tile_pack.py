@@ -0,0 +1,156 @@
+import os
+import json
+import mmap
+import uuid
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from loguru import logger
+
+from app.config import TEMP_DIR
+
+# One pack per image and format: tiles.pack (JPEG), tiles.webp.pack, tiles.avif.pack
+# Pack layout: [tile bytes ...][index JSON][footer]
+# footer = index offset (u64) + index length (u64) + magic
+PACK_NAME = "tiles.pack"
+PACK_MAGIC = b"IRTPACK1"
+FOOTER = struct.Struct("<QQ8s")
+
+
+class TilePackWriter:
+    """
+    Writes every tile of an image into one pack file.
+    Written to a unique temp file and renamed on close, like the loose tile files.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._temp_path = path + f".{uuid.uuid4().hex}.tmp"
+        self._file = open(self._temp_path, "wb")
+        self._index = []
+
+    def add(self, zoom: int, x: int, y: int, data: bytes):
+        self._index.append([zoom, x, y, self._file.tell(), len(data)])
+        self._file.write(data)
+
+    def close(self):
+        index_bytes = json.dumps(self._index).encode("utf-8")
+        index_offset = self._file.tell()
+        self._file.write(index_bytes)
+        self._file.write(FOOTER.pack(index_offset, len(index_bytes), PACK_MAGIC))
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+
+class TilePack:
+    """Read side of one pack: memory-mapped file + in-memory offset index."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            # The mapping keeps its own handle; the file object can be closed
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index_offset, index_length, magic = FOOTER.unpack(self._mm[-FOOTER.size:])
+        if magic != PACK_MAGIC:
+            raise ValueError(f"Not a tile pack: {path}")
+
+        entries = json.loads(self._mm[index_offset:index_offset + index_length])
+        self._index: Dict[Tuple[int, int, int], Tuple[int, int]] = {
+            (zoom, x, y): (offset, length) for zoom, x, y, offset, length in entries
+        }
+
+    def get(self, zoom: int, x: int, y: int) -> Optional[memoryview]:
+        """Zero-copy slice of the mapped file, or None if the tile is not in the pack."""
+        entry = self._index.get((zoom, x, y))
+        if entry is None:
+            return None
+        offset, length = entry
+        return memoryview(self._mm)[offset:offset + length]
+
+    def __len__(self):
+        return len(self._index)
+
+
+class TilePackStore:
+    """
+    Open packs, keyed by (tile key, format), bounded LRU.
+    A missing pack is remembered too, so loose-file images cost no extra stat per tile;
+    invalidate() must be called after a pack is (re)written.
+    Packs dropped from the LRU are never closed explicitly: views handed out may
+    still be streaming, and the mapping is released when the last one goes away.
+    """
+
+    def __init__(self, max_open: int = 64):
+        self.max_open = max_open
+        self._packs: "OrderedDict[Tuple[str, str], Optional[TilePack]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def path_for(key: str, fmt: str = "jpeg") -> str:
+        name = PACK_NAME if fmt == "jpeg" else f"tiles.{fmt}.pack"
+        return os.path.join(TEMP_DIR, "tiles", key, name)
+
+    def _open(self, key: str, fmt: str) -> Optional[TilePack]:
+        with self._lock:
+            if (key, fmt) in self._packs:
+                self._packs.move_to_end((key, fmt))
+                return self._packs[(key, fmt)]
+
+        path = self.path_for(key, fmt)
+        pack = None
+        if os.path.exists(path):
+            try:
+                pack = TilePack(path)
+            except Exception as e:
+                logger.error(f"Tile Pack Error ({key}): {e}")
+
+        with self._lock:
+            self._packs[(key, fmt)] = pack
+            while len(self._packs) > self.max_open:
+                self._packs.popitem(last=False)
+        return pack
+
+    def get_tile(self, key: str, zoom: int, x: int, y: int, fmt: str = "jpeg") -> Optional[memoryview]:
+        pack = self._open(key, fmt)
+        data = pack.get(zoom, x, y) if pack else None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def invalidate(self, key: str):
+        """Forgets every format of an image's packs."""
+        with self._lock:
+            for cached in [k for k in self._packs if k[0] == key]:
+                del self._packs[cached]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open_packs": sum(1 for p in self._packs.values() if p is not None),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# Global Instance
+tile_pack_store = TilePackStore()
@@ -1,26 +1,52 @@
 import os
 import math
+import json
+import uuid
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Tuple
 from PIL import Image
 from loguru import logger
-from app.config import TEMP_DIR, LIBRARY_DIR
+from app.config import TEMP_DIR, LIBRARY_DIR, TILE_PREGENERATE, TILE_STORE, TILE_PREBUILD_FORMATS
 from app.utils import resolve_local_path
+from app.services.job_manager import job_manager, JobState, JobCancelled
+from app.services.job_scheduler import job_scheduler, JobPriority
+from app.services.layer_cache import layer_cache
+from app.services.tile_pack import TilePackWriter, tile_pack_store
+from app.services.http_cache import source_version
+from app.services import image_format
 
 class TileService:
     """
     Handles generation and retrieval of Image Tiles for Deep Zoom.
-    Path Structure: temp/tiles/{image_id}/{zoom_level}/{x}_{y}.jpg
+    Path Structure: temp/tiles/{image_id}/{zoom_level}/{x}_{y}.{jpg|webp|avif}
     tileSize: 256px (Standard)
+    Each output format (see image_format.py) is cached separately.
+    Zoom 0 is the original resolution; each level halves it, down to a single tile.
+    Pyramids are pre-built on upload/import (build_pyramid) and described by
+    temp/tiles/{image_id}/manifest.json; missing tiles are still generated on demand.
+    With TILE_STORE=pack, pre-built tiles live in one pack per format (tiles.pack, tiles.webp.pack, ...) instead.
     """
     TILE_SIZE = 256
+    MANIFEST_NAME = "manifest.json"
+
+    def __init__(self):
+        # image_id -> resolved source path (see _find_source_image)
+        self._source_cache: Dict[str, str] = {}
+        self._source_lock = threading.Lock()
+        self.source_hits = 0
+        self.source_misses = 0
     
-    def get_tile_path(self, image_id: str, zoom: int, x: int, y: int, db=None) -> str | None:
+    @staticmethod
+    def _tile_path(key: str, zoom: int, x: int, y: int, fmt: str) -> str:
+        return os.path.join(TEMP_DIR, "tiles", key, str(zoom), f"{x}_{y}.{image_format.extension(fmt)}")
+
+    def get_tile_path(self, image_id: str, zoom: int, x: int, y: int, db=None, fmt: str = "jpeg") -> str | None:
         """
         Returns the absolute path to a requested tile.
         Generates it if it doesn't exist.
         """
-        tile_dir = os.path.join(TEMP_DIR, "tiles", image_id, str(zoom))
-        tile_name = f"{x}_{y}.jpg"
-        tile_path = os.path.join(tile_dir, tile_name)
+        tile_path = self._tile_path(image_id, zoom, x, y, fmt)
         
         if os.path.exists(tile_path):
             return tile_path
@@ -30,31 +56,264 @@ class TileService:
             logger.error(f"Tile Generation Failed: Source not found for {image_id}")
             return None
             
-        return self._generate_tile(source_path, tile_dir, zoom, x, y)
+        return self._generate_tile(source_path, image_id, zoom, x, y, fmt)
 
-    def get_tile_for_local_path(self, source_path: str, zoom: int, x: int, y: int) -> str | None:
+    def get_tile_for_local_path(self, source_path: str, zoom: int, x: int, y: int, key: str | None = None, fmt: str = "jpeg") -> str | None:
         """
         Generates tiles for LOCAL files (not in database).
-        Uses MD5 hash of path as cache key.
+        Uses local_key() (MD5 of path + mtime) as cache key.
         """
-        import hashlib
-        
-        # Create unique cache key from file path
-        path_hash = hashlib.md5(source_path.encode()).hexdigest()
-        
-        tile_dir = os.path.join(TEMP_DIR, "tiles", f"local_{path_hash}", str(zoom))
-        tile_name = f"{x}_{y}.jpg"
-        tile_path = os.path.join(tile_dir, tile_name)
+        key = key or self.local_key(source_path)
+        tile_path = self._tile_path(key, zoom, x, y, fmt)
         
         # Return cached tile if exists
         if os.path.exists(tile_path):
             return tile_path
         
         # Generate new tile
-        return self._generate_tile(source_path, tile_dir, zoom, x, y)
+        return self._generate_tile(source_path, key, zoom, x, y, fmt)
+
+    @staticmethod
+    def local_key(source_path: str) -> str:
+        """
+        Tile cache key for LOCAL files: MD5 of the path and its mtime,
+        so a page overwritten in place (e.g. re-cleaned) gets fresh tiles.
+        """
+        try:
+            mtime = os.stat(source_path).st_mtime_ns
+        except OSError:
+            mtime = 0
+        return f"local_{hashlib.md5(f'{source_path}|{mtime}'.encode()).hexdigest()}"
+
+    @staticmethod
+    def _atomic_save(img: Image.Image, path: str, **save_kwargs):
+        """Save to a UNIQUE temp file, then rename, so readers never see partial files."""
+        temp_path = path + f".{uuid.uuid4().hex}.tmp"
+        img.save(temp_path, **save_kwargs)
+        os.rename(temp_path, path)
+
+    # --- PYRAMID (pre-generation) ---
+
+    def _levels(self, width: int, height: int) -> List[dict]:
+        """Grid of every zoom level: halve until the whole image fits in one tile."""
+        levels = []
+        zoom = 0
+        while width >= 1 and height >= 1:
+            cols = math.ceil(width / self.TILE_SIZE)
+            rows = math.ceil(height / self.TILE_SIZE)
+            levels.append({"zoom": zoom, "width": width, "height": height, "cols": cols, "rows": rows, "tiles": cols * rows})
+            if cols == 1 and rows == 1:
+                break
+            width, height = width // 2, height // 2
+            zoom += 1
+        return levels
+
+    def _manifest(self, width: int, height: int, source_mtime: float | None, pregenerated: bool) -> dict:
+        levels = self._levels(width, height)
+        return {
+            "tileSize": self.TILE_SIZE,
+            # Served per Accept header; pre-built formats are listed in "prebuilt"
+            "formats": image_format.ENABLED_FORMATS,
+            "width": width,
+            "height": height,
+            "maxZoom": levels[-1]["zoom"],
+            "levels": levels,
+            "totalTiles": sum(level["tiles"] for level in levels),
+            "pregenerated": pregenerated,
+            "sourceMtime": source_mtime,
+            # Append as ?v= to tile URLs: versioned tiles are served as immutable
+            "version": source_version(source_mtime) if source_mtime else None
+        }
+
+    def _read_manifest(self, key: str) -> dict | None:
+        manifest_path = os.path.join(TEMP_DIR, "tiles", key, self.MANIFEST_NAME)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _iter_pyramid(self, layer: Image.Image, levels: List[dict]):
+        """Yields (zoom, x, y, tile) for every level, halving the previous level each time."""
+        for level in levels:
+            if level["zoom"] > 0:
+                # Same dimensions as on-demand int(w / 2**zoom)
+                layer = layer.resize((level["width"], level["height"]), Image.Resampling.LANCZOS)
+            for y in range(level["rows"]):
+                for x in range(level["cols"]):
+                    left, top = x * self.TILE_SIZE, y * self.TILE_SIZE
+                    yield level["zoom"], x, y, layer.crop((left, top, left + self.TILE_SIZE, top + self.TILE_SIZE))
+
+    def get_packed_tile(self, key: str, zoom: int, x: int, y: int, fmt: str = "jpeg") -> memoryview | None:
+        """
+        Tile bytes from the image's pack file (TILE_STORE=pack), as a zero-copy
+        slice of the memory-mapped pack. None if not packed; callers then fall back to loose files.
+        """
+        if TILE_STORE != "pack":
+            return None
+        return tile_pack_store.get_tile(key, zoom, x, y, fmt)
+
+    def build_pyramid(self, source_path: str, key: str) -> dict | None:
+        """
+        Decodes the source once, then halves it level by level, writing every tile
+        of every level (in each TILE_PREBUILD_FORMATS format) plus manifest.json.
+        Skipped if the manifest matches the source mtime, store and formats.
+        """
+        try:
+            formats = [f for f in TILE_PREBUILD_FORMATS if f in image_format.ENABLED_FORMATS] or ["jpeg"]
+            source_mtime = os.path.getmtime(source_path)
+            manifest = self._read_manifest(key)
+            if (manifest and manifest.get("pregenerated") and manifest.get("sourceMtime") == source_mtime
+                    and manifest.get("store", "files") == TILE_STORE and manifest.get("prebuilt") == formats):
+                return manifest
+
+            root = os.path.join(TEMP_DIR, "tiles", key)
+            os.makedirs(root, exist_ok=True)
+            # Lazy per-level layers from an older source are stale now
+            for name in os.listdir(root):
+                if name.startswith("layer_full_"):
+                    os.remove(os.path.join(root, name))
+            layer_cache.invalidate(key)
+
+            with Image.open(source_path) as img:
+                layer = img.convert("RGB")
+
+            manifest = self._manifest(layer.width, layer.height, source_mtime, pregenerated=True)
+            manifest["store"] = TILE_STORE
+            manifest["prebuilt"] = formats
+
+            if TILE_STORE == "pack":
+                # One file per format for all tiles + offset index (see tile_pack.py)
+                writers = {fmt: TilePackWriter(tile_pack_store.path_for(key, fmt)) for fmt in formats}
+                try:
+                    for zoom, x, y, tile in self._iter_pyramid(layer, manifest["levels"]):
+                        for fmt, writer in writers.items():
+                            writer.add(zoom, x, y, image_format.encode(tile, fmt))
+                except Exception:
+                    for writer in writers.values():
+                        writer.abort()
+                    raise
+                for writer in writers.values():
+                    writer.close()
+                tile_pack_store.invalidate(key)
+            else:
+                for zoom, x, y, tile in self._iter_pyramid(layer, manifest["levels"]):
+                    os.makedirs(os.path.join(root, str(zoom)), exist_ok=True)
+                    for fmt in formats:
+                        self._atomic_save(tile, self._tile_path(key, zoom, x, y, fmt), **image_format.save_kwargs(fmt))
+
+            manifest_path = os.path.join(root, self.MANIFEST_NAME)
+            temp_manifest = manifest_path + f".{uuid.uuid4().hex}.tmp"
+            with open(temp_manifest, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.rename(temp_manifest, manifest_path)
+
+            logger.info(f"🧱 Tile pyramid built for {key}: {len(manifest['levels'])} levels, {manifest['totalTiles']} tiles")
+            return manifest
+
+        except Exception as e:
+            logger.error(f"Tile Pyramid Error ({key}): {e}")
+            return None
+
+    def get_manifest(self, key: str, source_path: str | None) -> dict | None:
+        """
+        Returns the pyramid manifest. If the pyramid was not pre-built (yet),
+        the grid is computed from the image header alone (no decode).
+        """
+        manifest = self._read_manifest(key)
+        if manifest:
+            return manifest
+        if not source_path:
+            return None
+        try:
+            with Image.open(source_path) as img:
+                width, height = img.size
+            return self._manifest(width, height, os.path.getmtime(source_path), pregenerated=False)
+        except Exception as e:
+            logger.error(f"Tile Manifest Error ({key}): {e}")
+            return None
+
+    def get_manifest_for_id(self, image_id: str, db=None) -> dict | None:
+        manifest = self._read_manifest(image_id)
+        if manifest:
+            return manifest
+        return self.get_manifest(image_id, self._find_source_image(image_id, db))
+
+    def process_pyramid_job(self, job_id: str, sources: List[Tuple[str, str]]):
+        """Background worker: builds pyramids for (key, source_path) pairs."""
+        try:
+            job_manager.update_job(job_id, JobState.PROCESSING)
+            built, tiles = 0, 0
+            for i, (key, source_path) in enumerate(sources):
+                job_manager.update_progress(job_id, i / len(sources) * 100)
+                manifest = self.build_pyramid(source_path, key)
+                if manifest:
+                    built += 1
+                    tiles += manifest["totalTiles"]
+            job_manager.update_job(job_id, JobState.COMPLETED, result={"images": built, "tiles": tiles})
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Tile Pyramid Job {job_id} Failed: {e}")
+            job_manager.update_job(job_id, JobState.FAILED, error=str(e))
+
+    def schedule_pyramids(self, sources: List[Tuple[str, str]], comic_id: str | None = None, force: bool = False) -> str | None:
+        """
+        Queues a background TILE_PYRAMID job for freshly uploaded/imported pages.
+        sources: (tile key, local source path) pairs.
+        Returns the job id (None if TILE_PREGENERATE is off and force is not set).
+        """
+        if not sources or not (TILE_PREGENERATE or force):
+            return None
+        job_id = job_manager.create_job("TILE_PYRAMID", comic_id=comic_id)
+        job_scheduler.submit(job_id, self.process_pyramid_job, sources, queue_name="tiles", priority=JobPriority.BATCH)
+        return job_id
 
 
     def _find_source_image(self, image_id: str, db=None) -> str | None:
+        """
+        Source path for an image id, cached after the first successful resolution
+        (DB query + URL parsing + several os.path.exists probes).
+        Resolution reads the entry's url and name, and which files exist: entries are dropped
+        when the file is renamed or deleted, and a hit whose file is gone is resolved again.
+        """
+        with self._source_lock:
+            source_path = self._source_cache.get(image_id)
+        if source_path and os.path.exists(source_path):
+            with self._source_lock:
+                self.source_hits += 1
+            return source_path
+        with self._source_lock:
+            self._source_cache.pop(image_id, None)
+            self.source_misses += 1
+
+        source_path = self._resolve_source_image(image_id, db)
+        if source_path:
+            # Only successful lookups are cached: a missing source may be uploaded later
+            with self._source_lock:
+                self._source_cache[image_id] = source_path
+        return source_path
+
+    def invalidate_sources(self, image_ids: Iterable[str] | None = None):
+        """Drops cached source paths for the given ids (all of them if None)."""
+        with self._source_lock:
+            if image_ids is None:
+                self._source_cache.clear()
+                return
+            for image_id in image_ids:
+                self._source_cache.pop(image_id, None)
+
+    def source_cache_stats(self) -> dict:
+        with self._source_lock:
+            lookups = self.source_hits + self.source_misses
+            return {
+                "entries": len(self._source_cache),
+                "hits": self.source_hits,
+                "misses": self.source_misses,
+                "hit_rate": round(self.source_hits / lookups, 3) if lookups else None
+            }
+
+    def _resolve_source_image(self, image_id: str, db=None) -> str | None:
         # STRATEGY 1: Database Lookup (For File IDs)
         if db:
             from app.models_db import FileSystemEntry
@@ -120,87 +379,79 @@ class TileService:
             
         return None
 
-    def _generate_tile(self, source_path: str, tile_dir: str, zoom: int, x: int, y: int) -> str | None:
+    def _load_layer(self, source_path: str, tile_root: str, zoom: int) -> Image.Image | None:
+        """
+        Decodes the full layer for a zoom level (layer_full_{zoom}.png),
+        resizing it from the source and saving it first if missing.
+        Layers are stored losslessly, so the tile encode is the only lossy step;
+        zoom 0 is the source itself and is never copied.
+        """
+        if zoom == 0:
+            with Image.open(source_path) as img:
+                return img.convert('RGB')
+
+        layer_cache_path = os.path.join(tile_root, f"layer_full_{zoom}.png")
+
+        if os.path.exists(layer_cache_path):
+            with Image.open(layer_cache_path) as layer_img:
+                return layer_img.convert('RGB')
+
+        with Image.open(source_path) as img:
+            w, h = img.size
+
+            # IMPLEMENTATION CHOICE: "Inverse Pyramid" relative to Original
+            # Level 0 = 100% (Original)
+            # Level 1 = 50%
+            # Level 2 = 25%
+            # scale = 1 / (2^zoom_level)  <-- DOWNsampling
+            scale_factor = 1 / (2 ** zoom)
+
+            # Resize whole image to target scale -> Cache it as "layer_full_{zoom}.png" -> Crop from that.
+            target_w = int(w * scale_factor)
+            target_h = int(h * scale_factor)
+            if target_w < 1 or target_h < 1: return None
+
+            logger.info(f"generating layer cache for zoom {zoom} ({target_w}x{target_h})")
+            resized = img.resize((target_w, target_h), Image.Resampling.LANCZOS)
+            resized = resized.convert('RGB')
+
+        # Atomic Write: Save to UNIQUE temp, then rename (fast, lossless PNG)
+        self._atomic_save(resized, layer_cache_path, format='PNG', compress_level=1)
+        # Use the in-memory layer directly instead of decoding the file we just wrote
+        return resized
+
+    def _generate_tile(self, source_path: str, key: str, zoom: int, x: int, y: int, fmt: str = "jpeg") -> str | None:
         try:
-            os.makedirs(tile_dir, exist_ok=True)
-            tile_path = os.path.join(tile_dir, f"{x}_{y}.jpg")
+            tile_root = os.path.join(TEMP_DIR, "tiles", key)
+            tile_path = self._tile_path(key, zoom, x, y, fmt)
+            os.makedirs(os.path.dirname(tile_path), exist_ok=True)
             
             # This is "On-Demand" generation (slow for first user).
-            # Efficient implementation would generate WHOLE pyramid on import.
-            # But for "Safe Implementation", we do lazily to avoid breaking import flow.
+            # Fallback for images whose pyramid was not pre-built (see build_pyramid).
             
-            with Image.open(source_path) as img:
-                w, h = img.size
-                
-                # Calculate scale for this zoom level
-                # Deep Zoom logic: Level 0 = 1px? No, usually Level 0 = 1 tile fits whole image.
-                # Let's standardize: 
-                # Level 0 = Original Size?
-                # Usually standard mapping is: 
-                # - Level 0: 1 tile (thumbnail)
-                # - ...
-                # - Level N: Original Resolution
-                
-                # IMPLEMENTATION CHOICE: "Inverse Pyramid" relative to Original
-                # Level 0 = 100% (Original)
-                # Level 1 = 50%
-                # Level 2 = 25%
-                
-                # Wait, "Leaflet/Google Maps" style is:
-                # Zoom 0 world map. Zoom 20 house.
-                # Let's stick to simple scaling factor:
-                # scale = 1 / (2^zoom_level)  <-- DOWNsampling
-                
-                scale_factor = 1 / (2 ** zoom) 
-                
-                # Optimization: Don't load full image if we just want a small crop?
-                # PIL loads lazily, but resizing requires full process usually.
-                # Ideally, we resize the WHOLE image to the target zoom level ONCE, 
-                # then crop. Doing this per tile is inefficient (repeats resize).
-                
-                # BETTER STRATEGY for Lazy:
-                # Resize whole image to target scale -> Cache it as "layer_{zoom}.jpg" -> Crop from that.
-                
-                # Implement Atomic Write to prevent race conditions
-                # 1. Resize Layer (Critical Section)
-                layer_cache_path = os.path.join(os.path.dirname(tile_dir), f"layer_full_{zoom}.jpg")
+            # 1. Decoded layer, shared across requests: a burst of tiles from one
+            #    viewport costs one decode (concurrent misses wait for the first loader)
+            layer_img = layer_cache.get_or_load(
+                (key, zoom), lambda: self._load_layer(source_path, tile_root, zoom)
+            )
+            if layer_img is None:
+                return None
+
+            # 2. Crop Tile
+            left = x * self.TILE_SIZE
+            top = y * self.TILE_SIZE
+            right = left + self.TILE_SIZE
+            bottom = top + self.TILE_SIZE
+            
+            if left >= layer_img.width or top >= layer_img.height:
+                return None
                 
-                # Check existance AGAIN to avoid redundant work if race lost
-                if not os.path.exists(layer_cache_path):
-                    target_w = int(w * scale_factor)
-                    target_h = int(h * scale_factor)
-                    if target_w < 1 or target_h < 1: return None
-                    
-                    logger.info(f"generating layer cache for zoom {zoom} ({target_w}x{target_h})")
-                    resized = img.resize((target_w, target_h), Image.Resampling.LANCZOS)
-                    resized = resized.convert('RGB')
-                    
-                    # Atomic Write: Save to UNIQUE temp, then rename
-                    import uuid
-                    temp_layer_path = layer_cache_path + f".{uuid.uuid4().hex}.tmp"
-                    resized.save(temp_layer_path, format='JPEG', quality=90)
-                    os.rename(temp_layer_path, layer_cache_path)
+            tile = layer_img.crop((left, top, right, bottom))
+            
+            # Atomic Write for Tile (the only lossy encode)
+            self._atomic_save(tile, tile_path, **image_format.save_kwargs(fmt))
                 
-                # 2. Crop Tile
-                # We retry opening logic slightly if race condition hits?
-                with Image.open(layer_cache_path) as layer_img:
-                    left = x * self.TILE_SIZE
-                    top = y * self.TILE_SIZE
-                    right = left + self.TILE_SIZE
-                    bottom = top + self.TILE_SIZE
-                    
-                    if left >= layer_img.width or top >= layer_img.height:
-                        return None
-                        
-                    tile = layer_img.crop((left, top, right, bottom))
-                    
-                    # Atomic Write for Tile
-                    import uuid
-                    temp_tile_path = tile_path + f".{uuid.uuid4().hex}.tmp"
-                    tile.save(temp_tile_path, format='JPEG', quality=85)
-                    os.rename(temp_tile_path, tile_path)
-                        
-                return tile_path
+            return tile_path
 
         except Exception as e:
             logger.error(f"Tile Generation Error: {e}")
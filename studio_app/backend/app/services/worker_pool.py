@@ -0,0 +1,160 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List
+from loguru import logger
+
+from app.config import WORKER_POOL_MODE, WORKER_QUEUE_DEPTH, YOLO_WORKERS, FRAME_WORKERS, IMAGE_WORKERS
+
+
+class WorkerPoolBusy(Exception):
+    """Raised when a stage already has its maximum number of queued + running tasks."""
+    pass
+
+
+# --- WORKER INITIALIZERS ---
+# Run once inside each worker process (or thread in "thread" mode).
+# Each YOLO worker holds its own model copy; image workers hold their own GenAI client.
+
+def _init_yolo_worker(workers: int):
+    if WORKER_POOL_MODE == "process":
+        # Split the CPU between workers instead of every process grabbing all cores
+        try:
+            import torch
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+        except ImportError:
+            pass
+    from app.services.balloon_service import warm_up_model
+    warm_up_model()
+
+def _init_image_worker(workers: int):
+    if WORKER_POOL_MODE == "process":
+        from app.services.ai_service import init_genai_client
+        init_genai_client()
+
+def _yolo_worker_status() -> dict:
+    from app.services.balloon_service import get_model_status
+    return {"pid": os.getpid(), **get_model_status()}
+
+def _worker_status() -> dict:
+    return {"pid": os.getpid(), "status": "ready"}
+
+
+# --- STAGES ---
+# workers: max concurrent tasks. Pending tasks beyond workers * WORKER_QUEUE_DEPTH are rejected.
+STAGES = {
+    "yolo":   {"workers": YOLO_WORKERS,  "initializer": _init_yolo_worker,  "probe": _yolo_worker_status},
+    "frames": {"workers": FRAME_WORKERS, "initializer": None,               "probe": _worker_status},
+    "image":  {"workers": IMAGE_WORKERS, "initializer": _init_image_worker, "probe": _worker_status},
+}
+
+
+class WorkerPool:
+    """
+    Per-stage executors for CPU-heavy work (YOLO, OpenCV frame detection, mask/composite).
+    Keeps inference off the uvicorn event loop and bounds how much work can queue up per stage.
+    Executors are created lazily on first use.
+    """
+
+    def __init__(self, mode: str = WORKER_POOL_MODE):
+        self.mode = mode
+        self._executors: Dict[str, Executor] = {}
+        self._pending: Dict[str, int] = {stage: 0 for stage in STAGES}
+        self._warm: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+
+    def _executor(self, stage: str) -> Executor:
+        if stage not in STAGES:
+            raise ValueError(f"Unknown worker stage: {stage}")
+
+        with self._lock:
+            if stage not in self._executors:
+                spec = STAGES[stage]
+                initializer = spec["initializer"]
+                kwargs = {"initializer": initializer, "initargs": (spec["workers"],)} if initializer else {}
+
+                if self.mode == "process":
+                    self._executors[stage] = ProcessPoolExecutor(max_workers=spec["workers"], **kwargs)
+                else:
+                    self._executors[stage] = ThreadPoolExecutor(
+                        max_workers=spec["workers"], thread_name_prefix=f"worker-{stage}", **kwargs
+                    )
+                logger.info(f"🧵 Worker pool '{stage}' started ({self.mode}, {spec['workers']} workers)")
+            return self._executors[stage]
+
+    def submit(self, stage: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Dispatches fn to the stage's workers. fn and its arguments must be picklable in process mode.
+        Raises WorkerPoolBusy if the stage queue is full.
+        """
+        executor = self._executor(stage)
+        limit = STAGES[stage]["workers"] * WORKER_QUEUE_DEPTH
+
+        with self._lock:
+            if self._pending[stage] >= limit:
+                raise WorkerPoolBusy(f"Worker stage '{stage}' is busy ({limit} tasks queued)")
+            self._pending[stage] += 1
+
+        def _release(_):
+            with self._lock:
+                self._pending[stage] -= 1
+
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except Exception:
+            _release(None)
+            raise
+        future.add_done_callback(_release)
+        return future
+
+    async def run(self, stage: str, fn: Callable, *args, **kwargs):
+        """Awaitable variant of submit() for async route handlers."""
+        return await asyncio.wrap_future(self.submit(stage, fn, *args, **kwargs))
+
+    def warm_up(self, stage: str) -> List[dict]:
+        """
+        Starts the workers of a stage (running their initializer, e.g. loading YOLO)
+        by sending one status probe per worker, and records the replies for readiness checks.
+        """
+        executor = self._executor(stage)
+        spec = STAGES[stage]
+        futures = [executor.submit(spec["probe"]) for _ in range(spec["workers"])]
+        statuses = []
+        for future in futures:
+            try:
+                statuses.append(future.result())
+            except Exception as e:
+                statuses.append({"status": "failed", "error": str(e)})
+        self._warm[stage] = statuses
+        logger.info(f"🔥 Worker pool '{stage}' warmed: {[s.get('status') for s in statuses]}")
+        return statuses
+
+    def is_ready(self, stage: str) -> bool:
+        statuses = self._warm.get(stage)
+        return bool(statuses) and all(s.get("status") == "ready" for s in statuses)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                stage: {
+                    "mode": self.mode,
+                    "workers": spec["workers"],
+                    "max_pending": spec["workers"] * WORKER_QUEUE_DEPTH,
+                    "pending": self._pending[stage],
+                    "started": stage in self._executors,
+                    "warm": self._warm.get(stage)
+                }
+                for stage, spec in STAGES.items()
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Global Instance
+worker_pool = WorkerPool()
@@ -1,15 +1,25 @@
 import sys
 from loguru import logger
 import uvicorn
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse
+from starlette.datastructures import Headers, QueryParams
+from starlette.staticfiles import NotModifiedResponse
 from starlette.types import Scope # Needed for the override
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from app.config import TEMP_DIR, LIBRARY_DIR
+from app.config import TEMP_DIR, LIBRARY_DIR, YOLO_PRELOAD
 from app.services.ai_service import init_genai_client
+from app.services.worker_pool import worker_pool
+from app.services.job_manager import job_manager
+from app.services.job_scheduler import job_scheduler
+from app.services.save_buffer import save_buffer
+from app.services.http_cache import file_etag, IMMUTABLE, REVALIDATE
 from app.routers import (
     project_routes,
     # file_routes,  <-- REMOVED (Legacy)
@@ -23,7 +33,7 @@ from app.routers import (
 from app.routers.filesystem import core as fs_core
 from app.routers.filesystem import uploads as fs_uploads
 from app.routers.filesystem import exports as fs_exports
-from app.database import engine, Base
+from app.database import engine, Base, upgrade_schema
 import app.models_db
 
 # Configure Loguru
@@ -36,11 +46,31 @@ logger.add(
 # --- CUSTOM STATIC FILES CLASS TO FORCE CORS ---
 # This fixes the issue where mounted apps bypass global middleware
 class CORSStaticFiles(StaticFiles):
+    """
+    Also serves content-hash ETags (If-None-Match -> 304) and Cache-Control:
+    immutable for mounts whose files never change (immutable=True) or versioned URLs (?v=...),
+    revalidate otherwise.
+    """
+    def __init__(self, *args, immutable: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable = immutable
+
     async def get_response(self, path: str, scope: Scope):
         response = await super().get_response(path, scope)
         # Force allow origin on the file response itself
         response.headers["Access-Control-Allow-Origin"] = "*"
         return response
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200):
+        versioned = "v" in QueryParams(scope.get("query_string", b""))
+        headers = {
+            "etag": file_etag(str(full_path), stat_result),
+            "cache-control": IMMUTABLE if self.immutable or versioned else REVALIDATE
+        }
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
 # -----------------------------------------------
 
 @asynccontextmanager
@@ -48,10 +78,19 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
     # STARTUP
     logger.info("🚀 Starting Imagine Read Engine (Modularized)...")
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
     init_genai_client()
+    job_manager.restore()
+    if YOLO_PRELOAD:
+        # Start YOLO workers (each loads + warms its model) off the event loop;
+        # the server starts serving immediately
+        asyncio.get_running_loop().run_in_executor(None, worker_pool.warm_up, "yolo")
     yield
     # SHUTDOWN
     logger.info("👋 Shutting down Imagine Read Engine...")
+    save_buffer.shutdown()  # Pending editor saves are committed before anything else stops
+    job_scheduler.shutdown()
+    worker_pool.shutdown()
     
     # Auto-Cleanup on Shutdown
     from app.database import SessionLocal
@@ -81,12 +120,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination headers (GET /filesystem, GET /jobs) must be readable by the client
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
 # --- UPDATED MOUNTS ---
 # Use CORSStaticFiles instead of standard StaticFiles
+# Library files get a unique name on upload and are never rewritten -> immutable.
+# Temp holds overwritable files (exports, tiles), so it is only immutable for versioned URLs.
 app.mount("/temp", CORSStaticFiles(directory=TEMP_DIR), name="temp")
-app.mount("/library", CORSStaticFiles(directory=LIBRARY_DIR), name="library")
+app.mount("/library", CORSStaticFiles(directory=LIBRARY_DIR, immutable=True), name="library")
 # ----------------------
 
 # Include Routers
@@ -106,6 +149,18 @@ app.include_router(tile_routes.router)
 def health_check():
     return {"status": "ok", "service": "Imagine Read Engine (Modular)"}
 
+@app.get("/health/ready")
+def readiness_check():
+    """
+    Readiness probe: 200 once every YOLO worker has loaded and warmed its model, 503 otherwise.
+    With YOLO_PRELOAD disabled the model loads lazily and the probe always reports ready.
+    """
+    ready = worker_pool.is_ready("yolo") or not YOLO_PRELOAD
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "workers": worker_pool.stats()}
+    )
+
 import argparse
 
 if __name__ == "__main__":
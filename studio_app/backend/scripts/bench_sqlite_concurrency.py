@@ -0,0 +1,170 @@
+"""
+Concurrency benchmark: SQLite storage settings under a mixed editor workload.
+
+Runs the same workload against a scratch database twice:
+  legacy: the previous engine (rollback journal, default pragmas, default pool)
+  tuned:  app.database.create_sqlite_engine (WAL + pragmas from config, sized pool)
+
+Workload (one thread each, for --seconds):
+  readers     GET /filesystem-style child listings
+  exporter    full-table reads, like export_project's gathering phase
+  savers      balloon saves (revision bump + page_balloons rows of one page + commit)
+  uploaders   multi-page uploads (bulk INSERT + commit)
+
+Usage:
+    python scripts/bench_sqlite_concurrency.py --pages 20000 --seconds 10 --readers 4 --savers 4
+"""
+import sys
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+# Ensure we can import from 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import Base, create_sqlite_engine
+from app import crud
+
+FOLDERS = 200
+
+
+def _balloons(n: int) -> list:
+    return [{"id": i, "box": [i, i, 120, 80], "text": "Lorem ipsum dolor sit amet " * 3} for i in range(n)]
+
+
+def seed(engine, pages: int):
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    crud.bulk_create_filesystem_entries(db, [
+        {"id": f"folder-{f}", "name": f"Comic {f}", "type": "comic", "parentId": None} for f in range(FOLDERS)
+    ] + [
+        {
+            "id": f"file-{i}", "name": f"Page {i}", "type": "file", "parentId": f"folder-{i % FOLDERS}",
+            "url": f"http://127.0.0.1:8000/library/page_{i}.jpg", "order": i, "balloons": _balloons(8)
+        }
+        for i in range(pages)
+    ])
+    db.close()
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.locked = {}
+
+    def record(self, kind: str, seconds: float):
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(seconds)
+
+    def record_locked(self, kind: str):
+        with self.lock:
+            self.locked[kind] = self.locked.get(kind, 0) + 1
+
+
+def run_workload(engine, args) -> Stats:
+    Session = sessionmaker(bind=engine, autoflush=False)
+    stats = Stats()
+    stop = threading.Event()
+
+    def loop(kind, op):
+        rng = random.Random(kind + threading.current_thread().name)
+        while not stop.is_set():
+            db = Session()
+            start = time.perf_counter()
+            try:
+                op(db, rng)
+                stats.record(kind, time.perf_counter() - start)
+            except OperationalError as e:
+                db.rollback()
+                if "locked" in str(e):
+                    stats.record_locked(kind)
+                else:
+                    raise
+            finally:
+                db.close()
+
+    def read(db, rng):
+        crud.get_filesystem_by_parent(db, f"folder-{rng.randrange(FOLDERS)}")
+
+    def export(db, rng):
+        entries = crud.get_all_filesystem_entries(db)
+        [(e.id, e.name, e.parent_id, e.url) for e in entries]
+
+    def save(db, rng):
+        # Same statements as PersistenceService.save_many: revision bump (write lock), then the rows
+        file_id = f"file-{rng.randrange(args.pages)}"
+        crud.bump_file_revision(db, file_id)
+        crud.replace_page_annotations(db, file_id, balloons=_balloons(rng.randrange(4, 12)))
+        db.commit()
+
+    def upload(db, rng):
+        folder = f"upload-{rng.getrandbits(48):x}"
+        crud.bulk_create_filesystem_entries(db, [
+            {"id": f"{folder}-{p}", "name": f"Page {p}", "type": "file", "parentId": folder, "order": p}
+            for p in range(20)
+        ])
+
+    workers = (
+        [("read", read)] * args.readers + [("export", export)] + [("save", save)] * args.savers + [("upload", upload)]
+    )
+    threads = [threading.Thread(target=loop, args=w, name=f"{w[0]}-{i}") for i, w in enumerate(workers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return stats
+
+
+def report(name: str, stats: Stats, seconds: float):
+    print(f"\n[{name}]")
+    print(f"   {'op':<8} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'locked':>7}")
+    for kind in ("read", "export", "save", "upload"):
+        lat = sorted(stats.latencies.get(kind, []))
+        if not lat:
+            print(f"   {kind:<8} {0:>9.1f} {'-':>9} {'-':>9} {'-':>9} {stats.locked.get(kind, 0):>7}")
+            continue
+        pct = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] * 1000
+        print(
+            f"   {kind:<8} {len(lat) / seconds:>9.1f} {pct(0.5):>9.2f} {pct(0.95):>9.2f} "
+            f"{lat[-1] * 1000:>9.2f} {stats.locked.get(kind, 0):>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite settings under concurrent reads/saves/uploads")
+    parser.add_argument("--pages", type=int, default=20000, help="Seeded pages (with balloon JSON)")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration per configuration")
+    parser.add_argument("--readers", type=int, default=4, help="Listing threads")
+    parser.add_argument("--savers", type=int, default=4, help="Balloon save threads")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_sqlite_")
+    try:
+        configs = {
+            # Previous app/database.py engine (the driver's default 5 s lock timeout)
+            "legacy": lambda url: create_engine(url, connect_args={"check_same_thread": False}),
+            "tuned": create_sqlite_engine,
+        }
+        print(f"📊 {args.pages} pages, {args.readers} readers + 1 exporter + {args.savers} savers + 1 uploader, {args.seconds:g}s each")
+        for name, make_engine in configs.items():
+            url = f"sqlite:///{os.path.join(work_dir, name + '.db')}"
+            engine = make_engine(url)
+            seed(engine, args.pages)
+            report(name, run_workload(engine, args), args.seconds)
+            engine.dispose()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
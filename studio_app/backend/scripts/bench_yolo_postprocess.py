@@ -0,0 +1,142 @@
+"""
+Micro-benchmark: YOLO post-processing (boxes + mask polygons -> balloon dicts).
+
+Compares the legacy per-box loop (tensor .tolist() per box, cv2 imported in the loop)
+against the vectorized stage in balloon_service._result_to_balloons.
+Uses synthetic results shaped like ultralytics output, so no model or image is needed.
+
+Usage:
+    python scripts/bench_yolo_postprocess.py --balloons 60 --points 400 --runs 200
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+# Ensure we can import from 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.balloon_service import _result_to_balloons, SIMPLIFIERS
+
+
+# --- SYNTHETIC RESULT (mimics ultralytics Results on CPU) ---
+# Like ultralytics' BaseTensor, indexing/iterating Boxes builds a new Boxes object
+# around a slice of the underlying data. torch is used when installed (it ships with
+# ultralytics) so per-box tensor overhead matches production.
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+class _Boxes:
+    def __init__(self, data):
+        self.data = data  # (N, 6): x1, y1, x2, y2, conf, cls
+
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def conf(self):
+        return self.data[:, -2]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx):
+        return _Boxes(self.data[idx:idx + 1])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class _Masks:
+    def __init__(self, xy):
+        self.xy = xy
+
+
+class _Result:
+    def __init__(self, n_balloons: int, n_points: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        centers = rng.uniform(200, 1800, size=(n_balloons, 2))
+        radii = rng.uniform(40, 160, size=(n_balloons, 2))
+        xyxy = np.concatenate([centers - radii, centers + radii], axis=1)
+        conf = rng.uniform(0.05, 0.99, size=n_balloons)
+
+        # Noisy ellipses, like real bubble masks
+        t = np.linspace(0, 2 * np.pi, n_points, endpoint=False)
+        polys = []
+        for (cx, cy), (rx, ry) in zip(centers, radii):
+            noise = rng.normal(0, 1.5, size=(n_points, 2))
+            poly = np.stack([cx + rx * np.cos(t), cy + ry * np.sin(t)], axis=1) + noise
+            polys.append(poly.astype(np.float32))
+
+        data = np.concatenate([xyxy, conf[:, None], np.zeros((n_balloons, 1))], axis=1).astype(np.float32)
+        self.boxes = _Boxes(torch.from_numpy(data) if torch is not None else data)
+        self.masks = _Masks(polys)
+
+
+# --- LEGACY PATH (pre-vectorization execute_yolo loop) ---
+def legacy_result_to_balloons(result):
+    balloons = []
+    if result.boxes:
+        for i, box in enumerate(result.boxes):
+            conf = float(box.conf)
+            if conf < 0.15: continue
+
+            x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
+            w, h = x2 - x1, y2 - y1
+            polygon = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+
+            if result.masks is not None:
+                if hasattr(result.masks, 'xy') and len(result.masks.xy) > i:
+                    raw_poly = result.masks.xy[i]
+                    if len(raw_poly) > 0:
+                        import cv2
+                        contour = raw_poly.astype(np.int32).reshape(-1, 1, 2)
+                        peri = cv2.arcLength(contour, True)
+                        approx = cv2.approxPolyDP(contour, 0.003 * peri, True)
+                        if len(approx) > 2:
+                            polygon = approx.reshape(-1, 2).tolist()
+                        else:
+                            polygon = raw_poly.tolist()
+
+            balloons.append({"id": i, "conf": round(conf, 2), "box": [x1, y1, w, h], "polygon": polygon})
+    return balloons
+
+
+def _time(fn, runs: int) -> float:
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark YOLO post-processing")
+    parser.add_argument("--balloons", type=int, default=60, help="Detections per page")
+    parser.add_argument("--points", type=int, default=400, help="Points per mask contour")
+    parser.add_argument("--runs", type=int, default=200, help="Timed iterations")
+    args = parser.parse_args()
+
+    result = _Result(args.balloons, args.points)
+
+    legacy = legacy_result_to_balloons(result)
+    vectorized = _result_to_balloons(result)
+    assert [b["box"] for b in legacy] == [b["box"] for b in vectorized], "Box output mismatch"
+    assert [b["polygon"] for b in legacy] == [b["polygon"] for b in vectorized], "Polygon output mismatch"
+    assert [b["conf"] for b in legacy] == [b["conf"] for b in vectorized], "Confidence output mismatch"
+
+    print(f"📊 {args.balloons} detections x {args.points} pts, {args.runs} runs ({len(vectorized)} kept)")
+    legacy_ms = _time(lambda: legacy_result_to_balloons(result), args.runs)
+    print(f"   legacy per-box      : {legacy_ms:8.3f} ms/page")
+    for method in SIMPLIFIERS:
+        ms = _time(lambda: _result_to_balloons(result, simplify=method), args.runs)
+        print(f"   vectorized [{method:<4}]   : {ms:8.3f} ms/page  ({legacy_ms / ms:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
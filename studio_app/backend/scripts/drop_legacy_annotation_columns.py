@@ -0,0 +1,70 @@
+"""
+One-off migration: drops the legacy annotation columns
+(filesystem.balloons/panels and file_annotations.balloons).
+
+upgrade_schema copies them into file_annotations + page_balloons on startup but never drops
+them. Run this once the new layout has been checked: the database is backed up first
+(SQLite online backup, next to the database as <name>.<timestamp>.bak), and nothing is
+dropped unless the copy is recorded (PRAGMA user_version).
+
+Usage:
+    python scripts/drop_legacy_annotation_columns.py [--dry-run]
+"""
+import sys
+import os
+import sqlite3
+import argparse
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+# Ensure we can import from 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine, upgrade_schema, legacy_annotation_columns, ANNOTATIONS_COPIED_VERSION
+
+
+def backup(db_path: str) -> str:
+    backup_path = f"{db_path}.{datetime.now().strftime('%Y%m%d_%H%M%S')}.bak"
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(backup_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return backup_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop the legacy annotation columns (after a backup)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be dropped")
+    args = parser.parse_args()
+
+    upgrade_schema()  # Makes sure the copy into file_annotations/page_balloons has run
+    legacy = {table: columns for table, columns in legacy_annotation_columns(inspect(engine)).items() if columns}
+    if not legacy:
+        print("✅ No legacy annotation columns left")
+        return
+
+    with engine.connect() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+    if version < ANNOTATIONS_COPIED_VERSION:
+        sys.exit(f"❌ Annotations not copied yet (user_version {version}): start the app once, then retry")
+
+    for table, columns in legacy.items():
+        print(f"🗑️  {table}: {', '.join(columns)}")
+    if args.dry_run:
+        return
+
+    backup_path = backup(engine.url.database)
+    print(f"💾 Backup written to {backup_path}")
+
+    with engine.begin() as conn:
+        for table, columns in legacy.items():
+            for column in columns:
+                conn.execute(text(f'ALTER TABLE "{table}" DROP COLUMN "{column}"'))
+    print("✅ Legacy annotation columns dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,8 @@ import logging
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.database import SessionLocal, engine, Base
-from app.models_db import Project, FileSystemEntry
+from app.models_db import Project
+from app import crud
 
 # Setup Logger
 logging.basicConfig(level=logging.INFO)
@@ -54,28 +55,13 @@ def migrate():
         
         logger.info(f"✅ Migrated {len(projects)} Projects.")
 
-        # 4. Migrate FileSystem
+        # 4. Migrate FileSystem (one executemany upsert, so re-runs don't duplicate)
         fs_entries = data.get("fileSystem", [])
-        for i, f in enumerate(fs_entries):
-            # Parse Balloons (ensure it's stored as JSON-compatible object/list, SQLAlchemy handles serialization)
-            balloons = f.get("balloons")
-            
-            db_entry = FileSystemEntry(
-                id=f.get("id"),
-                parent_id=f.get("parentId"),
-                name=f.get("name"),
-                type=f.get("type"),
-                url=f.get("url"),
-                created_at=f.get("createdAt"),
-                is_pinned=f.get("isPinned", False),
-                order=f.get("order", i), # Fallback to index if no order
-                
-                # New Fields
-                clean_url=f.get("cleanUrl"),
-                is_cleaned=f.get("isCleaned", False),
-                balloons=balloons
-            )
-            session.merge(db_entry)
+        # Balloons are stored as JSON-compatible object/list, SQLAlchemy handles serialization
+        crud.bulk_create_filesystem_entries(session, [
+            {**f, "order": f.get("order", i)}  # Fallback to index if no order
+            for i, f in enumerate(fs_entries)
+        ], upsert=True, commit=False)
             
         logger.info(f"✅ Migrated {len(fs_entries)} Files/Folders.")
         